@@ -2,6 +2,8 @@
 ASGI config for GroupPortal project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Live thread updates (``forum.live``) stream from async views and need it;
+the sync views run unchanged in its thread pool.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
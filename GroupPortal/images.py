@@ -0,0 +1,158 @@
+"""
+Image derivatives: avatars, profile pictures and badge images resized into
+a few fixed sizes, in WebP and JPEG, so pages never ship the full upload.
+
+Derivative names are derived from the source file's name (uploads get a
+new name when replaced), so a derivative never needs invalidating: it
+either exists on disk or is rendered. They are rendered after upload by the
+``render_thumbnails`` task, on first request by the ``thumbnail`` view, or
+in bulk by the ``generate_thumbnails`` command. Rendering works on plain
+file paths and does not need Django, so the command can farm it out to a
+process pool.
+"""
+import hashlib
+import os
+
+from django.conf import settings
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+VERSION = 1
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+CONTENT_TYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+SAVE_OPTIONS = {
+    'webp': {'quality': 80, 'method': 4},
+    'jpeg': {'quality': 85, 'optimize': True, 'progressive': True},
+}
+
+# Upload directories of the image fields that get derivatives; the lazy
+# view renders nothing outside them.
+SOURCE_DIRS = ('avatars/', 'profile_pics/', 'badges/')
+
+
+def sizes():
+    return tuple(sorted(getattr(settings, 'IMAGE_DERIVATIVE_SIZES', (32, 64, 256))))
+
+
+def root():
+    return os.fspath(getattr(settings, 'IMAGE_DERIVATIVE_ROOT', os.path.join(settings.MEDIA_ROOT, 'derivatives')))
+
+
+def base_url():
+    return getattr(settings, 'IMAGE_DERIVATIVE_URL', settings.MEDIA_URL + 'derivatives/')
+
+
+def bucket(size):
+    """
+    The smallest derivative size at least ``size`` pixels, or the largest.
+    """
+    available = sizes()
+    return next((candidate for candidate in available if candidate >= size), available[-1])
+
+
+def derivative_name(name, size, fmt):
+    digest = hashlib.sha1(f"{VERSION}:{name}".encode()).hexdigest()[:20]
+    return f"{digest[:2]}/{digest}-{size}.{EXTENSIONS[fmt]}"
+
+
+def derivative_path(name, size, fmt):
+    return os.path.join(root(), derivative_name(name, size, fmt))
+
+
+def source_path(name):
+    return os.path.join(settings.MEDIA_ROOT, name)
+
+
+def is_source(name):
+    return name.startswith(SOURCE_DIRS) and '..' not in name.split('/')
+
+
+def targets(name, force=False):
+    """
+    ``(size, format, path)`` of every derivative of ``name`` still to
+    render (all of them with ``force``), largest first.
+    """
+    return [
+        (size, fmt, path)
+        for size in reversed(sizes()) for fmt in FORMATS
+        for path in [derivative_path(name, size, fmt)]
+        if force or not os.path.exists(path)
+    ]
+
+
+# ----- Rendering -----
+
+def render(source, targets):
+    """
+    Write ``targets`` (``(size, format, path)``, largest first) from the
+    image at ``source``. Each size is scaled down from the previous one,
+    and JPEG sources are decoded at the lowest resolution that still covers
+    the largest size. Returns the number of files written.
+    """
+    if not targets:
+        return 0
+    largest = targets[0][0]
+    with Image.open(source) as original:
+        original.draft(None, (largest, largest))
+        image = ImageOps.exif_transpose(original)
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            image = image.convert('RGBA')
+        else:
+            image = image.convert('RGB')
+
+    written = 0
+    for size in sorted({size for size, _, _ in targets}, reverse=True):
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        for target_size, fmt, path in targets:
+            if target_size == size:
+                _save(image, fmt, path)
+                written += 1
+    return written
+
+
+def _save(image, fmt, path):
+    if fmt == 'jpeg' and image.mode == 'RGBA':
+        flat = Image.new('RGB', image.size, (255, 255, 255))
+        flat.paste(image, mask=image.getchannel('A'))
+        image = flat
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written aside and renamed, so readers never see half a file and
+    # concurrent renders of the same image are harmless.
+    partial = f"{path}.{os.getpid()}.tmp"
+    image.save(partial, FORMATS[fmt], **SAVE_OPTIONS[fmt])
+    os.replace(partial, path)
+
+
+def render_job(job):
+    """
+    ``render`` for one ``(source, targets)`` pair, for process pools. A
+    broken source is reported instead of raised, so one bad upload does not
+    end a bulk run.
+    """
+    source, targets = job
+    try:
+        return source, render(source, targets), None
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        return source, 0, str(error)
+
+
+def generate(name, force=False):
+    """
+    Render the missing derivatives of the media file ``name``. Returns the
+    number written.
+    """
+    return render(source_path(name), targets(name, force))
+
+
+# ----- URLs -----
+
+def url(name, size, fmt='jpeg'):
+    """
+    The URL of the ``size`` derivative of ``name``: the file itself once
+    rendered, the rendering view until then.
+    """
+    size = bucket(size)
+    if os.path.exists(derivative_path(name, size, fmt)):
+        return base_url() + derivative_name(name, size, fmt)
+    return reverse('thumbnail', kwargs={'size': size, 'fmt': fmt, 'name': name})
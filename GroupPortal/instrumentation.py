@@ -0,0 +1,344 @@
+import contextvars
+import math
+import os
+import socket
+import threading
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRICS = ('total_ms', 'queries', 'sql_ms', 'template_ms', 'peak_kb')
+PERCENTILES = (50, 95, 99)
+
+SNAPSHOT_KEY = "instrumentation:snapshot:{}"
+WORKERS_KEY = "instrumentation:workers"
+
+# Bucket i holds values in [GROWTH ** i, GROWTH ** (i + 1)) times MIN_VALUE,
+# so any percentile is within about 5% of the real value.
+GROWTH = 1.1
+MIN_VALUE = 0.01
+_LOG_GROWTH = math.log(GROWTH)
+
+
+class Histogram:
+    """
+    Log-bucketed histogram: constant-time inserts, a few hundred buckets at
+    most, and two histograms merge by adding their bucket counts.
+    """
+
+    __slots__ = ('buckets', 'count', 'sum', 'max')
+
+    def __init__(self, buckets=None, count=0, sum=0.0, max=0.0):
+        self.buckets = buckets if buckets is not None else {}
+        self.count = count
+        self.sum = sum
+        self.max = max
+
+    def record(self, value):
+        # Bucket -1 collects zeros and anything below MIN_VALUE.
+        index = int(math.log(value / MIN_VALUE) / _LOG_GROWTH) if value >= MIN_VALUE else -1
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+        return self
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                if index < 0:
+                    return 0.0
+                # Geometric middle of the bucket, never above the real max.
+                return min(MIN_VALUE * GROWTH ** (index + 0.5), self.max)
+        return self.max
+
+    def summary(self):
+        summary = {
+            'count': self.count,
+            'mean': round(self.sum / self.count, 2) if self.count else None,
+            'max': round(self.max, 2),
+        }
+        for q in PERCENTILES:
+            value = self.percentile(q)
+            summary[f'p{q}'] = None if value is None else round(value, 2)
+        return summary
+
+    def to_state(self):
+        return {'buckets': self.buckets, 'count': self.count, 'sum': self.sum, 'max': self.max}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(dict(state['buckets']), state['count'], state['sum'], state['max'])
+
+
+class RollingHistogram:
+    """
+    A histogram over roughly the last ``window`` seconds: samples go into the
+    current generation, and reads combine it with the previous one.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.current = Histogram()
+        self.previous = Histogram()
+        self.started = time.monotonic()
+
+    def _rotate(self, now):
+        if now - self.started >= self.window:
+            # A long idle gap means the previous generation is stale too.
+            self.previous = self.current if now - self.started < 2 * self.window else Histogram()
+            self.current = Histogram()
+            self.started = now
+
+    def record(self, value, now):
+        self._rotate(now)
+        self.current.record(value)
+
+    def snapshot(self):
+        self._rotate(time.monotonic())
+        return Histogram().merge(self.previous).merge(self.current)
+
+
+class StatsRegistry:
+    """
+    Per-URL-name rolling histograms for every metric in METRICS, shared by
+    all threads of the process.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.views = {}
+        self.lock = threading.Lock()
+
+    def record(self, view_name, sample):
+        now = time.monotonic()
+        with self.lock:
+            metrics = self.views.get(view_name)
+            if metrics is None:
+                metrics = self.views[view_name] = {name: RollingHistogram(self.window) for name in METRICS}
+            for name, value in sample.items():
+                if value is not None:
+                    metrics[name].record(value, now)
+
+    def snapshot(self):
+        """
+        ``{view_name: {metric: Histogram}}`` for the current window.
+        """
+        with self.lock:
+            return {
+                view_name: {name: histogram.snapshot() for name, histogram in metrics.items()}
+                for view_name, metrics in self.views.items()
+            }
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+
+
+registry = StatsRegistry(getattr(settings, 'INSTRUMENTATION_WINDOW', 5 * 60))
+
+
+def summarize(snapshot):
+    return {
+        view_name: {name: histogram.summary() for name, histogram in metrics.items()}
+        for view_name, metrics in sorted(snapshot.items())
+    }
+
+
+def merge_snapshots(snapshots):
+    merged = {}
+    for snapshot in snapshots:
+        for view_name, metrics in snapshot.items():
+            target = merged.setdefault(view_name, {name: Histogram() for name in METRICS})
+            for name, histogram in metrics.items():
+                target[name].merge(histogram)
+    return merged
+
+
+# ----- Sharing between worker processes -----
+
+def _worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def publish(snapshot=None):
+    """
+    Store this process's snapshot in the cache so the ``view_stats`` command
+    (or any other process) can merge the stats of every worker. Only useful
+    with a cache backend shared between processes.
+    """
+    snapshot = registry.snapshot() if snapshot is None else snapshot
+    timeout = 2 * registry.window
+    worker = _worker_id()
+    state = {
+        view_name: {name: histogram.to_state() for name, histogram in metrics.items()}
+        for view_name, metrics in snapshot.items()
+    }
+    cache.set(SNAPSHOT_KEY.format(worker), state, timeout)
+    # Written on every publish, so the list lives as long as its newest
+    # snapshot, and a worker lost to a concurrent update re-adds itself.
+    cache.set(WORKERS_KEY, (cache.get(WORKERS_KEY) or set()) | {worker}, timeout)
+
+
+def collect():
+    """
+    Merge the snapshots published by every worker, this one included.
+    Workers whose snapshot has expired are dropped from the list.
+    """
+    snapshots = [registry.snapshot()]
+    listed = cache.get(WORKERS_KEY) or set()
+    workers = listed - {_worker_id()}
+    states = cache.get_many([SNAPSHOT_KEY.format(worker) for worker in workers])
+    expired = {worker for worker in workers if SNAPSHOT_KEY.format(worker) not in states}
+    if expired:
+        cache.set(WORKERS_KEY, listed - expired, 2 * registry.window)
+    for state in states.values():
+        snapshots.append({
+            view_name: {name: Histogram.from_state(histogram) for name, histogram in metrics.items()}
+            for view_name, metrics in state.items()
+        })
+    return merge_snapshots(snapshots)
+
+
+# ----- Request measurement -----
+
+_template_time = contextvars.ContextVar('template_time', default=None)
+
+
+class TimedTemplate(Template):
+    """
+    Adds its render time to the current request's total while the
+    middleware is measuring one; a plain render otherwise.
+    """
+
+    def render(self, context=None, request=None):
+        spent = _template_time.get()
+        if spent is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            spent[0] += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, handing out ``TimedTemplate``s so that
+    ``template_ms`` can be measured. Select it in ``TEMPLATES``.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class _QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+
+
+def _peak_memory_kb():
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[1] / 1024
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return None
+
+
+class InstrumentationMiddleware:
+    """
+    Record query count, SQL time, template render time, wall time and peak
+    memory for every request, keyed by the resolved URL name. Opt-in through
+    INSTRUMENTATION_ENABLED; template time is only seen through templates
+    of the ``TimedDjangoTemplates`` backend.
+
+    Peak memory is the per-request tracemalloc peak when tracemalloc is on
+    (set INSTRUMENTATION_TRACEMALLOC, costly) and otherwise how much the
+    request raised the process's peak RSS, which is free to read.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTATION_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.publish_interval = getattr(settings, 'INSTRUMENTATION_PUBLISH_INTERVAL', 30)
+        self.last_published = time.monotonic()
+        if getattr(settings, 'INSTRUMENTATION_TRACEMALLOC', False) and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def __call__(self, request):
+        timer = _QueryTimer()
+        template_time = [0.0]
+        token = _template_time.set(template_time)
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        memory_before = _peak_memory_kb()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timer))
+                response = self.get_response(request)
+        finally:
+            _template_time.reset(token)
+        elapsed = time.perf_counter() - start
+
+        memory_after = _peak_memory_kb()
+        peak = None
+        if memory_after is not None:
+            peak = memory_after if tracing else memory_after - memory_before
+        match = request.resolver_match
+        registry.record(match.view_name if match else '<unresolved>', {
+            'total_ms': elapsed * 1000,
+            'queries': timer.count,
+            'sql_ms': timer.seconds * 1000,
+            'template_ms': template_time[0] * 1000,
+            'peak_kb': peak,
+        })
+
+        if time.monotonic() - self.last_published >= self.publish_interval:
+            self.last_published = time.monotonic()
+            publish()
+        return response
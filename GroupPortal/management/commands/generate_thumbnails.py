@@ -0,0 +1,65 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from GroupPortal import images
+from authentification.models import CustomUser
+from forum.models import Achievement, UserProfile
+
+
+def source_names():
+    """
+    Every stored avatar, profile picture and badge image, once each.
+    """
+    names = set()
+    for model, field in ((UserProfile, 'avatar'), (CustomUser, 'profile_picture'), (Achievement, 'badge_image')):
+        names.update(model.objects.exclude(**{field: ''}).exclude(**{field: None}).values_list(field, flat=True))
+    return sorted(names)
+
+
+class Command(BaseCommand):
+    help = "Render missing image derivatives (all of them with --force) in a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--force', action='store_true', help="Re-render derivatives that already exist.")
+        parser.add_argument('--prune', action='store_true', help="Delete derivatives of images no longer in use.")
+
+    def handle(self, *args, **options):
+        names = source_names()
+        jobs = [
+            (images.source_path(name), targets)
+            for name in names
+            for targets in [images.targets(name, options['force'])]
+            if targets and os.path.isfile(images.source_path(name))
+        ]
+        written = failed = 0
+        if jobs:
+            # Rendering is CPU-bound and needs neither Django nor the
+            # database, so the children only get file paths.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+                for source, count, error in pool.map(images.render_job, jobs, chunksize=8):
+                    written += count
+                    if error:
+                        failed += 1
+                        self.stderr.write(f"{source}: {error}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {written} derivative(s) of {len(jobs)} image(s); {failed} failed."
+        ))
+
+        if options['prune']:
+            keep = {
+                images.derivative_path(name, size, fmt)
+                for name in names for size in images.sizes() for fmt in images.FORMATS
+            }
+            removed = 0
+            for directory, _, files in os.walk(images.root()):
+                for file in files:
+                    path = os.path.join(directory, file)
+                    if path not in keep:
+                        os.remove(path)
+                        removed += 1
+            self.stdout.write(self.style.SUCCESS(f"Removed {removed} unused derivative(s)."))
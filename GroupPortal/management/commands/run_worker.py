@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from GroupPortal.models import Task
+from GroupPortal.tasks import Worker
+
+
+class Command(BaseCommand):
+    help = "Run queued background tasks with a pool of worker threads or processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument(
+            '--pool', choices=('thread', 'process'), default='thread',
+            help="Threads suit I/O and database work; processes suit CPU-bound tasks.",
+        )
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when idle.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Starting {options['concurrency']} {options['pool']} worker(s).")
+        Worker(
+            concurrency=options['concurrency'], pool=options['pool'],
+            burst=options['burst'], poll_interval=options['poll_interval'],
+        ).run()
+        counts = dict(Task.objects.order_by().values_list('status').annotate(n=models.Count('id')))
+        summary = ", ".join(f"{counts.get(status, 0)} {status}" for status, _ in Task.STATUS_CHOICES)
+        self.stdout.write(self.style.SUCCESS(f"Worker stopped. Tasks: {summary}."))
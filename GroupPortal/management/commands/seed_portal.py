@@ -0,0 +1,42 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from GroupPortal.seeding import DEFAULTS, PortalSeeder, scaled
+from forum.activity import backfill, FEED_DAYS
+from forum.search import reindex
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-generate synthetic users, forums, threads, nested comments, votes, polls and diary grades. "
+        "Counts default to DEFAULTS in GroupPortal/seeding.py times --scale."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0, help="Multiply every default count.")
+        for name, value in DEFAULTS.items():
+            parser.add_argument(f"--{name.replace('_', '-')}", type=int, help=f"Default {value} (before --scale).")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, help="Random seed, for reproducible content.")
+        parser.add_argument('--index', action='store_true', help="Rebuild the search index and activity feed afterwards.")
+
+    def handle(self, *args, **options):
+        counts = scaled(options['scale'], **{name: options[name] for name in DEFAULTS})
+        self.stdout.write("Seeding " + ", ".join(f"{value} {name}" for name, value in counts.items()))
+        started = time.monotonic()
+
+        def progress(name, done, total):
+            if options['verbosity'] > 1 or done == total:
+                self.stdout.write(f"  {name}: {done}/{total} ({time.monotonic() - started:.1f}s)")
+
+        PortalSeeder(counts, chunk_size=options['chunk_size'], seed=options['seed'], progress=progress).run()
+
+        if options['index']:
+            indexed = sum(count for _, count in reindex(chunk_size=options['chunk_size']))
+            self.stdout.write(f"  search index: {indexed} document(s)")
+            recorded = sum(count for _, count in backfill(now() - timedelta(days=FEED_DAYS), options['chunk_size']))
+            self.stdout.write(f"  activity feed: {recorded} event(s)")
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.monotonic() - started:.1f}s."))
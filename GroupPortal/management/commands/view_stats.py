@@ -0,0 +1,50 @@
+import json
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from GroupPortal.instrumentation import METRICS, WORKERS_KEY, collect, summarize
+
+
+class Command(BaseCommand):
+    help = (
+        "Show the per-view instrumentation percentiles published by the running workers "
+        "(requires a cache backend shared between processes)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help="Print the raw summary as JSON.")
+        parser.add_argument(
+            '--sort', choices=METRICS, default='queries', help="Metric to sort views by (by its p95).",
+        )
+        parser.add_argument('--reset', action='store_true', help="Forget the published snapshots.")
+
+    def handle(self, *args, **options):
+        if isinstance(caches['default'], LocMemCache):
+            raise CommandError(
+                "The default cache is per-process (LocMemCache), so no worker's stats can be seen from here. "
+                "Configure a shared backend in CACHES."
+            )
+        if options['reset']:
+            cache.delete(WORKERS_KEY)
+            self.stdout.write(self.style.SUCCESS("Published snapshots forgotten."))
+            return
+
+        stats = summarize(collect())
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+        if not stats:
+            self.stdout.write(self.style.WARNING("No requests recorded."))
+            return
+
+        sort = options['sort']
+        self.stdout.write(f"{'view':<40} {'hits':>6} " + " ".join(f"{name + ' p50/p95/p99':>28}" for name in METRICS))
+        for view_name, metrics in sorted(stats.items(), key=lambda item: -(item[1][sort]['p95'] or 0)):
+            columns = [
+                "/".join("-" if metrics[name][p] is None else f"{metrics[name][p]:g}" for p in ('p50', 'p95', 'p99'))
+                for name in METRICS
+            ]
+            hits = metrics['total_ms']['count']
+            self.stdout.write(f"{view_name:<40} {hits:>6} " + " ".join(f"{column:>28}" for column in columns))
@@ -0,0 +1,43 @@
+from django.db import models
+from django.db.models import Q
+
+
+class Task(models.Model):
+    """
+    A queued call of a ``GroupPortal.tasks.task`` function, run by the
+    ``run_worker`` command.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=255)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    # Enqueuing twice with the same key runs the task once, for as long as
+    # the first row is kept.
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField()
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker's "next due task" lookup.
+            models.Index(fields=['run_at', 'id'], name='task_due_idx', condition=Q(status='queued')),
+            # Stale claims of crashed workers.
+            models.Index(fields=['locked_at'], name='task_running_idx', condition=Q(status='running')),
+            models.Index(fields=['finished_at'], name='task_finished_idx', condition=Q(status='done')),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
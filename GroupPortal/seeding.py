@@ -0,0 +1,325 @@
+"""
+Bulk synthetic data for local load testing, used by the ``seed_portal``
+command and the load benchmark. Rows are written with ``bulk_create`` in
+chunks and only ids are kept in memory, so millions of rows are fine.
+
+Denormalized columns (vote counters, ``Comment.root``, poll option counts)
+are filled in as the rows are generated, and per-user dashboard stats are
+recounted at the end, so the data is consistent without running the
+rebuild commands afterwards.
+"""
+import datetime
+import random
+import secrets
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from authentification.models import CustomUser
+from diary.models import Student, Subject, Grade
+from forum.dashboard import rebuild_user_stats
+from forum.reputation import recompute as recompute_reputation
+from forum.trending import rescore as rescore_threads
+from forum.models import (
+    Category, Tag, Forum, Thread, Comment, Poll, PollOption, PollVote, ThreadVote, CommentVote,
+)
+
+DEFAULTS = {
+    'users': 1000,
+    'forums': 10,
+    'categories': 30,
+    'tags': 100,
+    'threads': 10000,
+    'comments': 100000,
+    'thread_votes': 100000,
+    'comment_votes': 100000,
+    'polls': 1000,
+    'poll_votes': 50000,
+    'students': 500,
+    'subjects': 15,
+    'grades': 100000,
+}
+
+# Fraction of comments that are replies, and how deep reply chains go.
+REPLY_RATIO = 0.6
+MAX_DEPTH = 4
+# Content timestamps are spread over this many days before now.
+HISTORY_DAYS = 90
+
+WORDS = (
+    'django query index cache thread comment poll vote grade student subject forum category tag '
+    'python database latency page cursor search signal queue worker memory benchmark release'
+).split()
+
+
+def scaled(scale=1.0, **overrides):
+    """
+    DEFAULTS multiplied by ``scale``, with explicit counts taking precedence.
+    """
+    counts = {name: max(int(value * scale), 1) for name, value in DEFAULTS.items()}
+    counts.update({name: value for name, value in overrides.items() if value is not None})
+    return counts
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """
+    Let bulk_create keep the generated ``created_at``-style values instead of
+    auto_now / auto_now_add overwriting them.
+    """
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class PortalSeeder:
+    def __init__(self, counts, chunk_size=5000, seed=None, progress=None):
+        self.counts = counts
+        self.chunk_size = chunk_size
+        self.rng = random.Random(seed)
+        self.progress = progress or (lambda name, done, total: None)
+        # Keeps names unique across repeated runs against the same database.
+        self.tag = secrets.token_hex(3)
+        self.now = timezone.now()
+
+        self.user_ids = []
+        self.category_ids = []
+        self.tag_ids = []
+
+    def run(self):
+        with explicit_timestamps(Thread, Comment, Poll, PollVote, ThreadVote, CommentVote):
+            self.seed_users()
+            self.seed_taxonomy()
+            self.seed_threads()
+            self.seed_diary()
+        rebuild_user_stats()
+        recompute_reputation()
+        rescore_threads()
+
+    # ----- Helpers -----
+
+    def _chunks(self, total):
+        for start in range(0, total, self.chunk_size):
+            yield start, min(self.chunk_size, total - start)
+
+    def _moment(self, after=None):
+        if after is None:
+            return self.now - datetime.timedelta(seconds=self.rng.random() * HISTORY_DAYS * 86400)
+        span = max((self.now - after).total_seconds(), 1)
+        return after + datetime.timedelta(seconds=self.rng.random() * span)
+
+    def _text(self, words):
+        return ' '.join(self.rng.choices(WORDS, k=words))
+
+    def _spread(self, total, buckets):
+        # ``total`` items dealt over ``buckets`` at random; returns the sizes.
+        sizes = [0] * buckets
+        for _ in range(total):
+            sizes[self.rng.randrange(buckets)] += 1
+        return sizes
+
+    def _votes(self, count):
+        voters = self.rng.sample(self.user_ids, min(count, len(self.user_ids)))
+        return [(user_id, 'up' if self.rng.random() < 0.75 else 'down') for user_id in voters]
+
+    # ----- Users and taxonomy -----
+
+    def seed_users(self):
+        # One hash for everyone: hashing per user would dominate the run.
+        password = make_password('password')
+        total = self.counts['users']
+        for start, size in self._chunks(total):
+            users = CustomUser.objects.bulk_create([
+                CustomUser(
+                    email=f'seed-{self.tag}-{n}@example.com', username=f'seed-{self.tag}-{n}', password=password,
+                )
+                for n in range(start, start + size)
+            ])
+            self.user_ids.extend(user.id for user in users)
+            self.progress('users', start + size, total)
+
+    def seed_taxonomy(self):
+        categories = Category.objects.bulk_create(
+            Category(name=f'{self._text(2).title()} {self.tag}-{n}') for n in range(self.counts['categories'])
+        )
+        self.category_ids = [category.id for category in categories]
+        tags = Tag.objects.bulk_create(Tag(name=f'{self.rng.choice(WORDS)}-{self.tag}-{n}') for n in range(self.counts['tags']))
+        self.tag_ids = [tag.id for tag in tags]
+
+        forums = Forum.objects.bulk_create(
+            Forum(name=f'Forum {self.tag}-{n}', description=self._text(12), author_id=self.rng.choice(self.user_ids))
+            for n in range(self.counts['forums'])
+        )
+        Forum.categories.through.objects.bulk_create(
+            Forum.categories.through(forum_id=forum.id, category_id=category_id)
+            for forum in forums
+            for category_id in self.rng.sample(self.category_ids, min(5, len(self.category_ids)))
+        )
+        Forum.tags.through.objects.bulk_create(
+            Forum.tags.through(forum_id=forum.id, tag_id=tag_id)
+            for forum in forums
+            for tag_id in self.rng.sample(self.tag_ids, min(10, len(self.tag_ids)))
+        )
+        self.progress('taxonomy', 1, 1)
+
+    # ----- Threads and everything hanging off them -----
+
+    def seed_threads(self):
+        total = self.counts['threads']
+        comments = self._spread(self.counts['comments'], total)
+        thread_votes = self._spread(self.counts['thread_votes'], total)
+        comment_votes = self.counts['comment_votes'] / max(self.counts['comments'], 1)
+        poll_every = total / max(min(self.counts['polls'], total), 1)
+        poll_votes = self.counts['poll_votes'] / max(self.counts['polls'], 1)
+
+        for start, size in self._chunks(total):
+            with transaction.atomic():
+                votes = [self._votes(thread_votes[n]) for n in range(start, start + size)]
+                threads = Thread.objects.bulk_create([
+                    self._thread(votes[i]) for i in range(size)
+                ])
+                ThreadVote.objects.bulk_create(
+                    ThreadVote(user_id=user_id, thread_id=thread.id, vote_type=vote_type, voted_at=self._moment(thread.created_at))
+                    for thread, thread_vote in zip(threads, votes) for user_id, vote_type in thread_vote
+                )
+                Thread.tags.through.objects.bulk_create(
+                    Thread.tags.through(thread_id=thread.id, tag_id=tag_id)
+                    for thread in threads
+                    for tag_id in self.rng.sample(self.tag_ids, min(self.rng.randint(1, 3), len(self.tag_ids)))
+                )
+                self._comments(threads, comments[start:start + size], comment_votes)
+                self._polls(
+                    [thread for n, thread in enumerate(threads, start) if int(n % poll_every) == 0],
+                    poll_votes,
+                )
+            self.progress('threads', start + size, total)
+
+    def _thread(self, votes):
+        up = sum(1 for _, vote_type in votes if vote_type == 'up')
+        created_at = self._moment()
+        return Thread(
+            title=self._text(self.rng.randint(3, 9)).capitalize(),
+            description=self._text(self.rng.randint(20, 80)),
+            author_id=self.rng.choice(self.user_ids),
+            category_id=self.rng.choice(self.category_ids),
+            views=self.rng.randint(0, 5000),
+            upvotes=up, downvotes=len(votes) - up, score=2 * up - len(votes),
+            status=self.rng.choices(('open', 'closed', 'archived'), (90, 8, 2))[0],
+            created_at=created_at, updated_at=created_at,
+        )
+
+    def _comments(self, threads, counts, votes_per_comment):
+        # Written in generations: the first holds top-level comments, each
+        # later one replies to comments already written in the same thread,
+        # and the last takes whatever is left.
+        pending = {thread.id: count for thread, count in zip(threads, counts) if count}
+        created_at = {thread.id: thread.created_at for thread in threads}
+        written = {}
+        for depth in range(MAX_DEPTH + 1):
+            rows = []
+            for thread_id, remaining in pending.items():
+                if depth == 0:
+                    size = max(1, round(remaining * (1 - REPLY_RATIO)))
+                elif depth == MAX_DEPTH:
+                    size = remaining
+                else:
+                    size = self.rng.randint(0, remaining)
+                for _ in range(size):
+                    rows.append((thread_id, self.rng.choice(written[thread_id]) if depth else None))
+                pending[thread_id] = remaining - size
+            if not rows:
+                continue
+
+            votes = [self._votes(self._poisson(votes_per_comment)) for _ in rows]
+            comments = Comment.objects.bulk_create([
+                self._comment(thread_id, parent, created_at[thread_id], comment_votes)
+                for (thread_id, parent), comment_votes in zip(rows, votes)
+            ])
+            CommentVote.objects.bulk_create(
+                CommentVote(user_id=user_id, comment_id=comment.id, vote_type=vote_type, voted_at=comment.created_at)
+                for comment, comment_votes in zip(comments, votes) for user_id, vote_type in comment_votes
+            )
+            for comment in comments:
+                written.setdefault(comment.thread_id, []).append(comment)
+
+    def _poisson(self, mean):
+        # Small integer with the given mean; exact distribution does not matter.
+        whole = int(mean)
+        return whole + (1 if self.rng.random() < mean - whole else 0)
+
+    def _comment(self, thread_id, parent, thread_created_at, votes):
+        up = sum(1 for _, vote_type in votes if vote_type == 'up')
+        created_at = self._moment(parent.created_at if parent else thread_created_at)
+        return Comment(
+            thread_id=thread_id,
+            parent_id=parent.id if parent else None,
+            root_id=(parent.root_id or parent.id) if parent else None,
+            author_id=self.rng.choice(self.user_ids),
+            content=self._text(self.rng.randint(5, 60)),
+            upvotes=up, downvotes=len(votes) - up, score=2 * up - len(votes),
+            created_at=created_at, updated_at=created_at,
+        )
+
+    def _polls(self, threads, votes_per_poll):
+        if not threads:
+            return
+        polls = Poll.objects.bulk_create(
+            Poll(thread_id=thread.id, question=self._text(6).capitalize() + '?', created_at=self._moment(thread.created_at))
+            for thread in threads
+        )
+        ballots = {}
+        options = []
+        for poll in polls:
+            voters = self.rng.sample(self.user_ids, min(self._poisson(votes_per_poll), len(self.user_ids)))
+            count = self.rng.randint(2, 5)
+            choices = [[] for _ in range(count)]
+            for user_id in voters:
+                choices[self.rng.randrange(count)].append(user_id)
+            for n, user_ids in enumerate(choices):
+                option = PollOption(poll_id=poll.id, text=f'Option {n + 1}: {self._text(2)}', votes=len(user_ids))
+                options.append(option)
+                ballots[id(option)] = (user_ids, poll.created_at)
+        PollOption.objects.bulk_create(options)
+        PollVote.objects.bulk_create(
+            PollVote(user_id=user_id, option_id=option.id, voted_at=self._moment(created_at))
+            for option in options
+            for user_ids, created_at in [ballots[id(option)]]
+            for user_id in user_ids
+        )
+
+    # ----- Diary -----
+
+    def seed_diary(self):
+        students = Student.objects.bulk_create(
+            Student(first_name=self.rng.choice(WORDS).title(), last_name=f'{self.rng.choice(WORDS).title()}-{self.tag}-{n}')
+            for n in range(self.counts['students'])
+        )
+        subjects = Subject.objects.bulk_create(
+            Subject(name=f'{self.rng.choice(WORDS).title()} {self.tag}-{n}') for n in range(self.counts['subjects'])
+        )
+        student_ids = [student.id for student in students]
+        subject_ids = [subject.id for subject in subjects]
+        today = timezone.localdate()
+        total = self.counts['grades']
+        for start, size in self._chunks(total):
+            Grade.objects.bulk_create([
+                Grade(
+                    student_id=self.rng.choice(student_ids),
+                    subject_id=self.rng.choice(subject_ids),
+                    grade=self.rng.randint(1, 12),
+                    date=today - datetime.timedelta(days=self.rng.randrange(365)),
+                )
+                for _ in range(size)
+            ])
+            self.progress('grades', start + size, total)
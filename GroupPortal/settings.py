@@ -52,13 +52,14 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'GroupPortal.instrumentation.InstrumentationMiddleware',
 ]
 
 ROOT_URLCONF = 'GroupPortal.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'GroupPortal.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -82,9 +83,38 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Transactions take the write lock up front and wait for it, so
+            # concurrent writers (task workers, the server) queue up instead
+            # of failing with "database is locked" on lock upgrade.
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+#
+# Instrumentation snapshots (view_stats), fragment invalidation, leaderboard
+# generations and the parsed achievement rules are shared through the cache,
+# so it has to be visible to every process: the default per-process LocMem
+# cache is not. The file cache covers one host; with several, point this at
+# Redis or Memcached instead. FileBasedCache.add() is not atomic, so with it
+# the per-session view dedupe (FORUM_VIEW_DEDUPE_WINDOW) is best-effort: two
+# concurrent hits from one session may both count.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
     }
 }
 
+# Tests get a cache directory of their own.
+TEST_RUNNER = 'GroupPortal.testing.TestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -128,8 +158,153 @@ STATICFILES_DIRS = [
     BASE_DIR / "static", 
 ]
 
+MEDIA_URL = '/media/'
+
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+
+# Forum view counters are buffered in process memory and flushed in bulk
+# after this many page hits or seconds, whichever comes first. Repeat views
+# from one session are ignored for FORUM_VIEW_DEDUPE_WINDOW seconds.
+
+FORUM_VIEW_COUNT_FLUSH_THRESHOLD = 100
+
+FORUM_VIEW_COUNT_FLUSH_INTERVAL = 10
+
+FORUM_VIEW_DEDUPE_WINDOW = 30 * 60
+
+
+# Per-view instrumentation, off unless INSTRUMENTATION_ENABLED is set. Its
+# template timing comes from the TimedDjangoTemplates backend in TEMPLATES,
+# which costs nothing while the middleware is off. Rolling histograms cover
+# the last INSTRUMENTATION_WINDOW to 2 * INSTRUMENTATION_WINDOW seconds and
+# each worker publishes its snapshot to the cache every
+# INSTRUMENTATION_PUBLISH_INTERVAL seconds. INSTRUMENTATION_TRACEMALLOC gives
+# exact per-request peak memory at a real cost, so leave it off outside of
+# profiling sessions.
+
+INSTRUMENTATION_ENABLED = False
+
+INSTRUMENTATION_WINDOW = 5 * 60
+
+INSTRUMENTATION_PUBLISH_INTERVAL = 30
+
+INSTRUMENTATION_TRACEMALLOC = False
+
+
+# Recent-activity feed events older than this many days are removed by the
+# prune_activity command; run it daily from cron.
+
+FORUM_ACTIVITY_RETENTION_DAYS = 30
+
+
+# Notification digests: send_notification_digests emails each user at most
+# once per FORUM_NOTIFICATION_DIGEST_INTERVAL seconds. Locally mail goes to
+# the console; switch to 'django.core.mail.backends.filebased.EmailBackend'
+# to keep it in EMAIL_FILE_PATH instead.
+
+FORUM_NOTIFICATION_DIGEST_INTERVAL = 60 * 60
+
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
+
+DEFAULT_FROM_EMAIL = 'forum@localhost'
+
+
+# Live thread updates (Server-Sent Events at /thread/<id>/events/) need the
+# ASGI application, e.g. `uvicorn GroupPortal.asgi:application`; only turn
+# FORUM_LIVE_ENABLED on when serving that way. Under WSGI the endpoint
+# answers 204 and pages do not open a stream. The default broker only
+# reaches readers connected to the same process; run several processes with
+# a shared broker implementing forum.live.Broker.
+
+FORUM_LIVE_ENABLED = False
+
+FORUM_LIVE_BROKER = 'forum.live.InProcessBroker'
+
+
+# Background tasks (GroupPortal.tasks) are queued in the database and run by
+# `manage.py run_worker`. TASKS_EAGER runs them in-process after commit
+# instead, for setups without a worker. Claims older than
+# TASKS_STALE_TIMEOUT seconds are assumed lost and retried; finished tasks
+# are kept TASKS_RETENTION_DAYS days, which is also how long idempotency
+# keys hold.
+
+TASKS_EAGER = False
+
+TASKS_STALE_TIMEOUT = 30 * 60
+
+TASKS_RETENTION_DAYS = 7
+
+
+# Attachments are streamed to disk while hashed and stored once per content
+# under FORUM_ATTACHMENT_ROOT. Uploads over FORUM_ATTACHMENT_MAX_SIZE bytes or
+# of other types than FORUM_ATTACHMENT_TYPES are cut off mid-stream.
+# Unreferenced files are deleted by collect_attachments once they have been
+# unused for FORUM_ATTACHMENT_GRACE seconds. Behind nginx, point
+# FORUM_ATTACHMENT_ACCEL_REDIRECT at an internal location aliased to the
+# root (e.g. '/protected-attachments/') to have nginx send the files.
+
+FORUM_ATTACHMENT_ROOT = MEDIA_ROOT / 'blobs'
+
+FORUM_ATTACHMENT_MAX_SIZE = 10 * 1024 * 1024
+
+FORUM_ATTACHMENT_TYPES = ['pdf', 'jpg', 'jpeg', 'png', 'doc', 'docx']
+
+FORUM_ATTACHMENT_GRACE = 24 * 60 * 60
+
+FORUM_ATTACHMENT_ACCEL_REDIRECT = None
+
+
+# Avatars, profile pictures and badge images are shown through derivatives
+# of these sizes (pixels, longest side), in WebP and JPEG, rendered into
+# IMAGE_DERIVATIVE_ROOT after upload or on first request. Serve
+# IMAGE_DERIVATIVE_URL from the web server; generate_thumbnails renders or
+# re-renders them in bulk.
+
+IMAGE_DERIVATIVE_SIZES = (32, 64, 256)
+
+IMAGE_DERIVATIVE_ROOT = MEDIA_ROOT / 'derivatives'
+
+IMAGE_DERIVATIVE_URL = MEDIA_URL + 'derivatives/'
+
+
+# Edit history is kept as revisions: a full snapshot every
+# FORUM_REVISION_SNAPSHOT_INTERVAL revisions and word-level deltas in
+# between, zlib-compressed where that is smaller unless
+# FORUM_REVISION_COMPRESS is off. Reading a revision decodes at most one
+# interval's worth of deltas.
+
+FORUM_REVISION_SNAPSHOT_INTERVAL = 10
+
+FORUM_REVISION_COMPRESS = True
+
+
+# The rendered dashboard summary is cached per user for
+# DASHBOARD_CACHE_TIMEOUT seconds and dropped on the user's own posts;
+# votes from others show up when it expires.
+
+DASHBOARD_CACHE_TIMEOUT = 5 * 60
+
+
+# Leaderboards rank from an in-process index per forum (and one global),
+# reloaded from the reputation tables every LEADERBOARD_REFRESH_INTERVAL
+# seconds so moves made by other processes show up; a process sees its
+# own at once. The recompute_reputation command should run nightly, e.g.
+#     30 3 * * * python manage.py recompute_reputation
+
+LEADERBOARD_REFRESH_INTERVAL = 60
+
+
+# Trending threads: activity loses half its weight every
+# TRENDING_HALF_LIFE seconds. Changing it needs a full rescore. Schedule
+#     5 * * * * python manage.py rescore_threads --windows
+#     45 3 * * * python manage.py rescore_threads
+
+TRENDING_HALF_LIFE = 24 * 60 * 60
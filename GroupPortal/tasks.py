@@ -0,0 +1,258 @@
+"""
+A small database-backed task queue. Functions decorated with ``@task`` get
+``delay()``/``enqueue()``, which insert a ``Task`` row in the caller's
+transaction (a rolled-back request queues nothing), and the ``run_worker``
+command claims and runs due rows from a thread or process pool.
+
+With ``TASKS_EAGER`` set, tasks run in-process once the caller's transaction
+commits instead, which is what tests and a worker-less development setup
+want.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+from django.utils.timezone import now
+
+from GroupPortal.models import Task
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRY_DELAY = 60 * 60
+
+
+class TaskFunction:
+    def __init__(self, func, max_attempts, retry_delay, atomic):
+        self.func = func
+        self.name = f"{func.__module__}.{func.__qualname__}"
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.atomic = atomic
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        return self.enqueue(args, kwargs)
+
+    def enqueue(self, args=(), kwargs=None, key=None, countdown=0):
+        """
+        Queue a call. Arguments must be JSON-serializable. With ``key``, a
+        second call with the same key is dropped for as long as the first
+        task's row exists.
+        """
+        kwargs = kwargs or {}
+        if getattr(settings, 'TASKS_EAGER', False):
+            transaction.on_commit(lambda: self.func(*args, **kwargs))
+            return None
+        task = Task(
+            name=self.name, args=list(args), kwargs=kwargs, idempotency_key=key,
+            max_attempts=self.max_attempts, run_at=now() + timedelta(seconds=countdown),
+        )
+        Task.objects.bulk_create([task], ignore_conflicts=key is not None)
+        return task
+
+    def retry_at(self, attempts):
+        """
+        Exponential backoff with full jitter, capped at MAX_RETRY_DELAY.
+        """
+        ceiling = min(self.retry_delay * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+        return now() + timedelta(seconds=random.uniform(ceiling / 2, ceiling))
+
+
+def task(func=None, *, max_attempts=5, retry_delay=10, atomic=True):
+    """
+    Make ``func`` a task. Failed runs are retried up to ``max_attempts``
+    times in all, ``retry_delay`` seconds after the first failure and twice
+    as long after each further one. ``atomic`` runs each attempt in a
+    transaction, so a failed attempt leaves nothing half done.
+    """
+    def decorate(func):
+        return TaskFunction(func, max_attempts, retry_delay, atomic)
+    return decorate(func) if func is not None else decorate
+
+
+def resolve(name):
+    target = import_string(name)
+    return target if isinstance(target, TaskFunction) else TaskFunction(target, 1, 0, True)
+
+
+# ----- Worker -----
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def claim(worker, batch=10):
+    """
+    Take the next due task, or None. The claim is a conditional UPDATE, so
+    competing workers never run the same row and no lock is held between
+    the lookup and the update.
+    """
+    due = Task.objects.filter(status='queued', run_at__lte=now()).order_by('run_at', 'id')
+    for pk in due.values_list('pk', flat=True)[:batch]:
+        # Counting the attempt here means a task that kills its worker
+        # still runs out of attempts.
+        claimed = Task.objects.filter(pk=pk, status='queued').update(
+            status='running', locked_by=worker, locked_at=now(), attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Task.objects.get(pk=pk)
+    return None
+
+
+def execute(task):
+    """
+    Run a claimed task and record the outcome: done, queued again with
+    backoff, or failed for good once its attempts are used up.
+    """
+    function = None
+    try:
+        function = resolve(task.name)
+        if function.atomic:
+            with transaction.atomic():
+                function(*task.args, **task.kwargs)
+        else:
+            function(*task.args, **task.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if function is not None and task.attempts < task.max_attempts:
+            logger.warning("Task %s (%s) failed, attempt %s of %s", task.pk, task.name, task.attempts, task.max_attempts)
+            Task.objects.filter(pk=task.pk).update(
+                status='queued', run_at=function.retry_at(task.attempts),
+                locked_by='', locked_at=None, last_error=error,
+            )
+            return 'queued'
+        logger.error("Task %s (%s) failed for good:\n%s", task.pk, task.name, error)
+        Task.objects.filter(pk=task.pk).update(
+            status='failed', finished_at=now(), last_error=error,
+        )
+        return 'failed'
+    Task.objects.filter(pk=task.pk).update(status='done', finished_at=now())
+    return 'done'
+
+
+def requeue_stale(timeout):
+    """
+    Put back tasks claimed more than ``timeout`` seconds ago by a worker
+    that died before finishing them, or fail those out of attempts.
+    """
+    stale = Task.objects.filter(status='running', locked_at__lt=now() - timedelta(seconds=timeout))
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', finished_at=now(), last_error='Worker lost while running the task.',
+    )
+    return stale.update(status='queued', locked_by='', locked_at=None)
+
+
+def purge_finished(before):
+    return Task.objects.filter(status='done', finished_at__lt=before).delete()[0]
+
+
+def run_pending(limit=None):
+    """
+    Run due tasks in this thread until none are left (or ``limit`` ran).
+    Returns how many ran. Handy in tests and one-off scripts.
+    """
+    worker, ran = worker_id(), 0
+    while limit is None or ran < limit:
+        task = claim(worker)
+        if task is None:
+            break
+        execute(task)
+        ran += 1
+    return ran
+
+
+def work(stop, burst=False, poll_interval=1.0):
+    """
+    One worker loop: claim and run tasks until ``stop`` is set, or, with
+    ``burst``, until the queue is empty.
+    """
+    worker = worker_id()
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            task = claim(worker)
+            if task is not None:
+                execute(task)
+            elif burst:
+                return
+            else:
+                stop.wait(poll_interval)
+    finally:
+        connections.close_all()
+
+
+def _process_main(burst, poll_interval):
+    import django
+    django.setup()
+    stop = threading.Event()
+    try:
+        work(stop, burst, poll_interval)
+    except KeyboardInterrupt:
+        pass
+
+
+class Worker:
+    """
+    ``concurrency`` worker loops, as threads (tasks that wait on I/O or the
+    database) or processes (CPU-bound tasks), plus housekeeping in the
+    calling thread: stale claims are requeued and old finished tasks purged.
+    """
+
+    def __init__(self, concurrency=1, pool='thread', burst=False, poll_interval=1.0):
+        self.concurrency = concurrency
+        self.pool = pool
+        self.burst = burst
+        self.poll_interval = poll_interval
+        self.stop = threading.Event()
+        self.stale_timeout = getattr(settings, 'TASKS_STALE_TIMEOUT', 30 * 60)
+        self.retention = timedelta(days=getattr(settings, 'TASKS_RETENTION_DAYS', 7))
+
+    def housekeeping(self):
+        requeue_stale(self.stale_timeout)
+        purge_finished(now() - self.retention)
+
+    def run(self):
+        self.housekeeping()
+        if self.pool == 'process':
+            import multiprocessing
+            # Children must not share the parent's database connections.
+            connections.close_all()
+            workers = [
+                multiprocessing.Process(target=_process_main, args=(self.burst, self.poll_interval), daemon=True)
+                for _ in range(self.concurrency)
+            ]
+        else:
+            workers = [
+                threading.Thread(target=work, args=(self.stop, self.burst, self.poll_interval), daemon=True)
+                for _ in range(self.concurrency)
+            ]
+        for worker in workers:
+            worker.start()
+        last_housekeeping = time.monotonic()
+        try:
+            while any(worker.is_alive() for worker in workers):
+                for worker in workers:
+                    worker.join(timeout=self.poll_interval)
+                if time.monotonic() - last_housekeeping >= 60:
+                    self.housekeeping()
+                    last_housekeeping = time.monotonic()
+        except KeyboardInterrupt:
+            self.stop.set()
+            for worker in workers:
+                if self.pool == 'process':
+                    worker.terminate()
+                worker.join()
+        finally:
+            connections.close_all()
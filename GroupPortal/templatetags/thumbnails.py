@@ -0,0 +1,44 @@
+from django import template
+from django.utils.html import format_html
+
+from GroupPortal import images
+
+register = template.Library()
+
+
+def _name(image):
+    return getattr(image, 'name', image) or ''
+
+
+@register.simple_tag
+def thumbnail_url(image, size, fmt='jpeg'):
+    """
+    ``{% thumbnail_url user.profile_picture 64 %}``: the URL of the smallest
+    derivative covering ``size`` pixels, or '' without an image.
+    """
+    name = _name(image)
+    return images.url(name, size, fmt) if name else ''
+
+
+@register.simple_tag
+def picture(image, size, alt='', css_class=''):
+    """
+    ``{% picture user.profile_picture 32 alt=user.username %}``: a
+    ``<picture>`` offering WebP with a JPEG fallback, at ``size`` CSS pixels
+    with a double-density candidate where a larger derivative exists.
+    Renders nothing without an image.
+    """
+    name = _name(image)
+    if not name:
+        return ''
+
+    def srcset(fmt):
+        single = images.url(name, size, fmt)
+        double = images.url(name, size * 2, fmt)
+        return single if double == single else f"{single} 1x, {double} 2x"
+
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}">'
+        '<img src="{}" srcset="{}" width="{}" alt="{}" class="{}" loading="lazy"></picture>',
+        srcset('webp'), images.url(name, size), srcset('jpeg'), size, alt, css_class,
+    )
@@ -0,0 +1,217 @@
+"""
+Test helpers shared by the apps' test suites: small factories for the forum
+and diary models, an upper-bound assertion on the number of queries and the
+project's test runner.
+"""
+import itertools
+import random
+import shutil
+import tempfile
+
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from authentification.models import CustomUser
+from diary.models import Student, Subject, Grade
+from forum.dashboard import rebuild_user_stats
+from forum.reputation import recompute as recompute_reputation
+from forum.trending import rescore as rescore_threads
+from forum.polls import rebuild_poll_counters
+from forum.voting import rebuild_vote_counters
+from forum.models import (
+    Category, Tag, Forum, Thread, Comment, Poll, PollOption, PollVote, ThreadVote, CommentVote,
+)
+from forum.revisions import record_edit
+
+_sequence = itertools.count(1)
+
+
+def make_user(**fields):
+    n = next(_sequence)
+    fields.setdefault('username', f'user{n}')
+    fields.setdefault('email', f"{fields['username']}@example.com")
+    password = fields.pop('password', 'pw')
+    return CustomUser.objects.create_user(fields.pop('email'), fields.pop('username'), password, **fields)
+
+
+def make_category(**fields):
+    fields.setdefault('name', f'Category {next(_sequence)}')
+    return Category.objects.create(**fields)
+
+
+def make_tag(**fields):
+    fields.setdefault('name', f'tag{next(_sequence)}')
+    return Tag.objects.create(**fields)
+
+
+def make_forum(categories=(), tags=(), **fields):
+    fields.setdefault('name', f'Forum {next(_sequence)}')
+    forum = Forum.objects.create(**fields)
+    forum.categories.set(categories)
+    forum.tags.set(tags)
+    return forum
+
+
+def make_thread(tags=(), **fields):
+    n = next(_sequence)
+    fields.setdefault('title', f'Thread {n}')
+    fields.setdefault('description', f'Description of thread {n}')
+    if 'author' not in fields:
+        fields['author'] = make_user()
+    thread = Thread.objects.create(**fields)
+    thread.tags.set(tags)
+    return thread
+
+
+def make_comment(thread, **fields):
+    fields.setdefault('content', f'Comment {next(_sequence)}')
+    if 'author' not in fields:
+        fields['author'] = thread.author
+    return Comment.objects.create(thread=thread, **fields)
+
+
+def make_poll(thread, options=('Yes', 'No'), **fields):
+    fields.setdefault('question', f'Question {next(_sequence)}?')
+    poll = Poll.objects.create(thread=thread, **fields)
+    PollOption.objects.bulk_create([PollOption(poll=poll, text=text) for text in options])
+    return poll
+
+
+def make_student(**fields):
+    n = next(_sequence)
+    fields.setdefault('first_name', f'First{n}')
+    fields.setdefault('last_name', f'Last{n}')
+    return Student.objects.create(**fields)
+
+
+def make_subject(**fields):
+    fields.setdefault('name', f'Subject {next(_sequence)}')
+    return Subject.objects.create(**fields)
+
+
+def seed_forum(users=5, threads=12, comments=4, replies=2, seed=0):
+    """
+    A forum with categories and tags, ``threads`` threads spread over them,
+    each with ``comments`` top-level comments carrying ``replies`` nested
+    replies, a poll with votes on every other thread, votes and edit history.
+    Returns a dict of the created objects, enough to exercise every view.
+    """
+    rng = random.Random(seed)
+    people = [make_user() for _ in range(users)]
+    categories = [make_category() for _ in range(3)]
+    tags = [make_tag() for _ in range(4)]
+    forum = make_forum(categories=categories, tags=tags, author=people[0])
+
+    created_threads, created_comments, polls = [], [], []
+    for i in range(threads):
+        thread = make_thread(
+            author=rng.choice(people), category=rng.choice(categories), tags=rng.sample(tags, 2),
+        )
+        created_threads.append(thread)
+        for _ in range(comments):
+            parent = make_comment(thread, author=rng.choice(people))
+            created_comments.append(parent)
+            for _ in range(replies):
+                parent = make_comment(thread, author=rng.choice(people), parent=parent)
+                created_comments.append(parent)
+        if i % 2 == 0:
+            poll = make_poll(thread, options=('A', 'B', 'C'))
+            options = list(poll.options.all())
+            for person in people:
+                option = rng.choice(options)
+                PollVote.objects.create(user=person, option=option)
+            polls.append(poll)
+
+    ThreadVote.objects.bulk_create(
+        ThreadVote(user=person, thread=thread, vote_type=rng.choice(('up', 'down')))
+        for thread in created_threads for person in people
+    )
+    CommentVote.objects.bulk_create(
+        CommentVote(user=person, comment=comment, vote_type='up')
+        for comment in created_comments[:20] for person in people
+    )
+    for n, thread in enumerate(created_threads):
+        record_edit('thread', created_threads[0], f'v{n}', f'v{n + 1}', thread.author)
+    for n, comment in enumerate(created_comments[:10]):
+        record_edit('comment', created_comments[0], f'v{n}', f'v{n + 1}', comment.author)
+    # The votes above bypass the counters; bring them in line.
+    rebuild_vote_counters(Thread)
+    rebuild_vote_counters(Comment)
+    rebuild_poll_counters()
+    rebuild_user_stats()
+    recompute_reputation()
+    rescore_threads()
+    return {
+        'users': people,
+        'forum': forum,
+        'categories': categories,
+        'tags': tags,
+        'threads': created_threads,
+        'comments': created_comments,
+        'polls': polls,
+    }
+
+
+def seed_diary(students=30, subjects=8, grades_per_cell=3, seed=0):
+    rng = random.Random(seed)
+    created_students = Student.objects.bulk_create(
+        Student(first_name=f'First{n}', last_name=f'Last{n}') for n in range(students)
+    )
+    created_subjects = Subject.objects.bulk_create(Subject(name=f'Subject {n}') for n in range(subjects))
+    Grade.objects.bulk_create(
+        Grade(student=student, subject=subject, grade=rng.randint(1, 12))
+        for student in created_students for subject in created_subjects for _ in range(grades_per_cell)
+    )
+    return {'students': created_students, 'subjects': created_subjects}
+
+
+class QueryBudgetMixin:
+    """
+    ``assertMaxQueries(n)``: like ``assertNumQueries`` but an upper bound,
+    and the failure message lists every query that ran.
+    """
+
+    def assertMaxQueries(self, limit, using=connection):
+        return _MaxQueriesContext(self, limit, using)
+
+
+class _MaxQueriesContext(CaptureQueriesContext):
+    def __init__(self, test_case, limit, connection):
+        super().__init__(connection)
+        self.test_case = test_case
+        self.limit = limit
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return
+        executed = len(self)
+        if executed > self.limit:
+            queries = "\n".join(
+                f"{n}. {query['sql']}" for n, query in enumerate(self.captured_queries, start=1)
+            )
+            self.test_case.fail(f"{executed} queries executed, at most {self.limit} allowed:\n{queries}")
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs the suite against a throwaway cache directory, so tests neither see
+    nor clear the shared cache of a site running from the same checkout.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_dir = tempfile.mkdtemp(prefix='groupportal-test-cache-')
+        self._cache_settings = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': self._cache_dir,
+            },
+        })
+        self._cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_settings.disable()
+        shutil.rmtree(self._cache_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,267 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from datetime import timedelta
+
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils.timezone import now
+
+from authentification.models import CustomUser
+from diary.models import Grade
+from PIL import Image
+
+from GroupPortal import images
+from GroupPortal.instrumentation import WORKERS_KEY, Histogram, collect, publish, registry
+from GroupPortal.models import Task
+from GroupPortal.seeding import PortalSeeder, scaled
+from GroupPortal.tasks import task, run_pending, requeue_stale, purge_finished
+from forum.models import Forum, Thread, Comment, PollVote, UserProfile
+from forum.polls import rebuild_poll_counters
+from forum.voting import rebuild_vote_counters
+
+
+@override_settings(INSTRUMENTATION_ENABLED=True)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        registry.clear()
+
+    def test_histogram_percentiles(self):
+        histogram = Histogram()
+        for value in range(1, 101):
+            histogram.record(value)
+        histogram.record(0)
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 101)
+        self.assertEqual(summary['max'], 100)
+        self.assertAlmostEqual(summary['p50'], 50, delta=50 * 0.1)
+        self.assertAlmostEqual(summary['p99'], 99, delta=99 * 0.1)
+
+        merged = Histogram().merge(histogram).merge(histogram)
+        self.assertEqual(merged.count, 202)
+        self.assertEqual(Histogram.from_state(merged.to_state()).summary(), merged.summary())
+
+    def test_records_per_url_name(self):
+        Forum.objects.create(name='General', description='')
+        self.client.get('/forums/')
+        self.client.get('/forums/')
+        stats = collect()
+        self.assertEqual(stats['forum_list']['total_ms'].count, 2)
+        self.assertGreaterEqual(stats['forum_list']['queries'].percentile(50), 1)
+        self.assertGreater(stats['forum_list']['template_ms'].max, 0)
+
+    def test_stats_endpoint_is_admin_only(self):
+        self.assertEqual(self.client.get('/instrumentation/').status_code, 302)
+        admin = CustomUser.objects.create_user('admin@example.com', 'admin', 'pw', is_staff=True)
+        self.client.force_login(admin)
+        self.client.get('/about/')
+        stats = self.client.get('/instrumentation/').json()
+        self.assertEqual(stats['about']['queries']['count'], 1)
+        self.assertIn('p95', stats['about']['total_ms'])
+
+    def test_command(self):
+        self.client.get('/about/')
+        out = StringIO()
+        call_command('view_stats', stdout=out)
+        self.assertIn('about', out.getvalue())
+
+    def test_expired_workers_are_dropped(self):
+        publish()
+        cache.set(WORKERS_KEY, cache.get(WORKERS_KEY) | {'gone:1'})
+        collect()
+        self.assertNotIn('gone:1', cache.get(WORKERS_KEY))
+
+    @override_settings(INSTRUMENTATION_ENABLED=False)
+    def test_disabled_records_nothing(self):
+        self.client.get('/about/')
+        self.assertEqual(collect(), {})
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_command_needs_a_shared_cache(self):
+        with self.assertRaisesMessage(CommandError, 'LocMemCache'):
+            call_command('view_stats', stdout=StringIO())
+
+
+class SeedPortalTests(TestCase):
+    def test_seeded_data_is_consistent(self):
+        counts = scaled(0.01, users=20, threads=30, comments=200)
+        PortalSeeder(counts, chunk_size=7, seed=1).run()
+
+        self.assertEqual(Thread.objects.count(), 30)
+        self.assertEqual(Comment.objects.count(), 200)
+        self.assertEqual(Grade.objects.count(), counts['grades'])
+        self.assertTrue(PollVote.objects.exists())
+        self.assertTrue(Comment.objects.filter(parent__parent__isnull=False).exists())
+        # Replies point at their top-level comment, and counters match votes.
+        self.assertFalse(Comment.objects.filter(parent__isnull=False, root__parent__isnull=False).exists())
+        self.assertFalse(Comment.objects.filter(parent__isnull=False, root__isnull=True).exists())
+        self.assertEqual(rebuild_vote_counters(Thread, dry_run=True), [])
+        self.assertEqual(rebuild_vote_counters(Comment, dry_run=True), [])
+        self.assertEqual(rebuild_poll_counters(dry_run=True), [])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('seed_portal', scale=0.001, threads=5, comments=10, stdout=out)
+        self.assertEqual(Thread.objects.count(), 5)
+        self.assertIn('Done', out.getvalue())
+
+
+calls = []
+
+
+@task(max_attempts=3, retry_delay=1)
+def record_call(value):
+    calls.append(value)
+    Forum.objects.create(name=f'Forum {value}')
+
+
+@task(max_attempts=2, retry_delay=1)
+def always_fails():
+    Forum.objects.create(name='Rolled back')
+    raise RuntimeError('boom')
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_and_run(self):
+        record_call.delay('a')
+        record_call.enqueue(['b'], countdown=60)
+        self.assertEqual(calls, [])
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(calls, ['a'])
+        self.assertEqual(
+            list(Task.objects.order_by('id').values_list('status', 'attempts')), [('done', 1), ('queued', 0)],
+        )
+
+    def test_idempotency_key(self):
+        for _ in range(3):
+            record_call.enqueue(['once'], key='only-once')
+        run_pending()
+        record_call.enqueue(['once'], key='only-once')
+        run_pending()
+        self.assertEqual(calls, ['once'])
+
+    def test_retries_with_backoff(self):
+        always_fails.delay()
+        started = now()
+        with self.assertLogs('GroupPortal.tasks', 'WARNING'):
+            self.assertEqual(run_pending(), 1)
+        queued = Task.objects.get()
+        self.assertEqual((queued.status, queued.attempts), ('queued', 1))
+        self.assertIn('RuntimeError: boom', queued.last_error)
+        self.assertGreaterEqual(queued.run_at, started + timedelta(seconds=0.5))
+        # The failed attempt rolled back its writes.
+        self.assertFalse(Forum.objects.filter(name='Rolled back').exists())
+
+        self.assertEqual(run_pending(), 0)
+        Task.objects.update(run_at=now())
+        with self.assertLogs('GroupPortal.tasks', 'ERROR'):
+            run_pending()
+        failed = Task.objects.get()
+        self.assertEqual((failed.status, failed.attempts), ('failed', 2))
+        self.assertIsNotNone(failed.finished_at)
+
+    def test_stale_claims_and_purge(self):
+        record_call.delay('lost')
+        Task.objects.update(status='running', attempts=1, locked_at=now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale(60), 1)
+        run_pending()
+        self.assertEqual(calls, ['lost'])
+        Task.objects.update(finished_at=now() - timedelta(days=30))
+        self.assertEqual(purge_finished(now() - timedelta(days=7)), 1)
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_call.delay('eager')
+            self.assertEqual(calls, [])
+        self.assertEqual(calls, ['eager'])
+        self.assertFalse(Task.objects.exists())
+
+
+class TaskWorkerTests(TransactionTestCase):
+    def test_thread_pool(self):
+        calls.clear()
+        for n in range(20):
+            record_call.delay(n)
+        out = StringIO()
+        # One thread: the in-memory test database can't take concurrent writers.
+        call_command('run_worker', concurrency=1, burst=True, poll_interval=0.01, stdout=out)
+        self.assertEqual(sorted(calls), list(range(20)))
+        self.assertEqual(Forum.objects.count(), 20)
+        self.assertIn('20 done', out.getvalue())
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings = override_settings(
+            MEDIA_ROOT=media, IMAGE_DERIVATIVE_ROOT=os.path.join(media, 'derivatives'),
+            IMAGE_DERIVATIVE_URL='/media/derivatives/',
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.name = 'profile_pics/me.png'
+        os.makedirs(os.path.join(media, 'profile_pics'))
+        Image.new('RGBA', (600, 400), (200, 30, 30, 128)).save(os.path.join(media, self.name))
+        self.user = CustomUser.objects.create_user(email='pic@example.com', username='pic', profile_picture=self.name)
+
+    def test_bucket(self):
+        self.assertEqual([images.bucket(size) for size in (10, 32, 33, 200, 1000)], [32, 32, 64, 256, 256])
+
+    def test_generate_renders_every_size_and_format(self):
+        self.assertEqual(images.generate(self.name), 6)
+        with Image.open(images.derivative_path(self.name, 256, 'webp')) as image:
+            self.assertEqual((image.format, image.size, image.mode), ('WEBP', (256, 171), 'RGBA'))
+        with Image.open(images.derivative_path(self.name, 32, 'jpeg')) as image:
+            self.assertEqual((image.format, image.width, image.mode), ('JPEG', 32, 'RGB'))
+        # Only what is missing.
+        self.assertEqual(images.generate(self.name), 0)
+        self.assertEqual(images.generate(self.name, force=True), 6)
+
+    def test_view_renders_on_first_request(self):
+        response = self.client.get(f'/thumbnails/64/webp/{self.name}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertTrue(os.path.exists(images.derivative_path(self.name, 64, 'jpeg')))
+        for url in ('/thumbnails/50/webp/' + self.name, '/thumbnails/64/gif/' + self.name,
+                    '/thumbnails/64/webp/attachments/x.png', '/thumbnails/64/webp/avatars/missing.png'):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_template_tags(self):
+        template = Template('{% load thumbnails %}{% thumbnail_url user.profile_picture 40 %}|{% picture user.profile_picture 32 alt="me" %}')
+        before = template.render(Context({'user': self.user}))
+        self.assertTrue(before.startswith(f'/thumbnails/64/jpeg/{self.name}|'))
+        images.generate(self.name)
+        after = template.render(Context({'user': self.user}))
+        self.assertTrue(after.startswith('/media/derivatives/'))
+        self.assertIn('-32.webp 1x, ', after)
+        self.assertIn('-64.jpg 2x', after)
+        self.assertEqual(Template('{% load thumbnails %}{% picture None 32 %}').render(Context()), '')
+
+    def test_uploads_queue_rendering(self):
+        key = f'thumbnails:{self.name}'
+        self.assertTrue(Task.objects.filter(idempotency_key=key).exists())
+        images.generate(self.name)
+        Task.objects.all().delete()
+        self.user.save()
+        self.assertFalse(Task.objects.exists())
+
+    def test_command(self):
+        UserProfile.objects.create(user=self.user, avatar='avatars/gone.png')
+        stray = os.path.join(images.root(), 'ab', 'stray.jpg')
+        os.makedirs(os.path.dirname(stray))
+        open(stray, 'wb').close()
+        out = StringIO()
+        call_command('generate_thumbnails', '--workers', '2', '--prune', stdout=out)
+        self.assertIn('Rendered 6 derivative(s) of 1 image(s); 0 failed.', out.getvalue())
+        self.assertIn('Removed 1 unused derivative(s).', out.getvalue())
+        self.assertFalse(os.path.exists(stray))
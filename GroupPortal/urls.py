@@ -1,6 +1,8 @@
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path
-from GroupPortal.views import about, index, contacts, dashboard, create   
+from GroupPortal.views import about, index, contacts, dashboard, create, instrumentation_stats, thumbnail
 from forum.views import (
     error, success,
     create_comment, create_forum, create_poll, create_thread,
@@ -8,11 +10,17 @@ from forum.views import (
     update_category, update_comment, update_forum, update_poll, update_tag, update_thread,
     vote_comment, vote_poll, vote_thread,
     add_category, add_tag, confirm_action, confirm_delete, view_poll_results,
-    recent_activity, thread_detail, delete_comment,
-    forum_detail, forum_list
+    recent_activity, search, thread_detail, comment_replies, delete_comment,
+    forum_detail, forum_list, leaderboard,
+    subscribe_thread, unsubscribe_thread, save_thread, unsave_thread,
+    notification_list, open_notification, read_notifications, thread_events,
+    thread_attachment, comment_attachment, view_thread_revision, view_comment_revision,
 )
 from authentification.views import register_view, login_view, logout_view
-from diary.views import diary_view, add_student, add_subject, add_grade, edit_student, edit_subject, edit_grade
+from diary.views import (
+    diary_view, diary_grades, add_student, add_subject, add_grade, edit_student, edit_subject, edit_grade,
+    export_grades, import_grades_view,
+)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -26,6 +34,8 @@ urlpatterns = [
     path('success/', success, name='success'),
     path('forums/', forum_list, name='forum_list'),  # Added forum list
     path('forum/<int:forum_id>/', forum_detail, name='forum_detail'),  # Added forum detail
+    path('forum/<int:forum_id>/leaderboard/', leaderboard, name='forum_leaderboard'),
+    path('leaderboard/', leaderboard, name='leaderboard'),
 
     # Authentication Views
     path('login/', login_view, name='login'),
@@ -38,13 +48,28 @@ urlpatterns = [
     path('thread/<int:thread_id>/comment/<int:parent_id>/', create_comment, name='reply_comment'),
     path('thread/<int:thread_id>/edit/', update_thread, name='update_thread'),
     path('thread/<int:thread_id>/history/', view_thread_edit_history, name='thread_edit_history'),
+    path('thread/<int:thread_id>/history/<int:number>/', view_thread_revision, name='thread_revision'),
     path('thread/<int:thread_id>/vote/', vote_thread, name='vote_thread'),
+    path('thread/<int:thread_id>/events/', thread_events, name='thread_events'),
+    path('thread/<int:thread_id>/attachment/', thread_attachment, name='thread_attachment'),
+    path('thread/<int:thread_id>/subscribe/', subscribe_thread, name='subscribe_thread'),
+    path('thread/<int:thread_id>/unsubscribe/', unsubscribe_thread, name='unsubscribe_thread'),
+    path('thread/<int:thread_id>/save/', save_thread, name='save_thread'),
+    path('thread/<int:thread_id>/unsave/', unsave_thread, name='unsave_thread'),
+
+    # Notifications
+    path('notifications/', notification_list, name='notifications'),
+    path('notifications/read/', read_notifications, name='read_notifications'),
+    path('notifications/<int:notification_id>/', open_notification, name='open_notification'),
 
     # Comment Views
     path('comment/<int:comment_id>/edit/', update_comment, name='update_comment'),
     path('comment/<int:comment_id>/history/', view_comment_edit_history, name='view_comment_edit_history'),
+    path('comment/<int:comment_id>/history/<int:number>/', view_comment_revision, name='comment_revision'),
     path('comment/<int:comment_id>/vote/', vote_comment, name='vote_comment'),
     path('comment/<int:comment_id>/delete/', delete_comment, name='delete_comment'),
+    path('comment/<int:comment_id>/replies/', comment_replies, name='comment_replies'),
+    path('comment/<int:comment_id>/attachment/', comment_attachment, name='comment_attachment'),
 
     # Poll / Forum / Tag / Category Views
     path('create-forum/', create_forum, name='create_forum'),
@@ -54,6 +79,7 @@ urlpatterns = [
     path('update-category/<int:category_id>/', update_category, name='update_category'),
     path('update-forum/<int:forum_id>/', update_forum, name='update_forum'),
     path('update-poll/<int:poll_id>/', update_poll, name='update_poll'),
+    path('poll/<int:poll_id>/vote/', vote_poll, name='vote_poll'),
     path('update-tag/<int:tag_id>/', update_tag, name='update_tag'),
 
     # Other Features
@@ -63,19 +89,30 @@ urlpatterns = [
     path('confirm-delete/', confirm_delete, name='confirm_delete'),
     path('poll-results/', view_poll_results, name='poll_results'),
     path('recent/', recent_activity, name='recent_activity'),
+    path('search/', search, name='search'),
 
     # Diary URLs
     path('diary/', diary_view, name='diary'),
+    path('diary/grades/', diary_grades, name='diary-grades'),
     path('add-student/', add_student, name='add-student'),
     path('edit-student/<int:student_id>/', edit_student, name='edit-student'),
     path('add-subject/', add_subject, name='add-subject'),
     path('edit-subject/<int:subject_id>/', edit_subject, name='edit-subject'),
     path('add-grade/', add_grade, name='add-grade'),
     path('edit-grade/<int:grade_id>/', edit_grade, name='edit-grade'),
+    path('export-grades/', export_grades, name='export-grades'),
+    path('import-grades/', import_grades_view, name='import-grades'),
 
 
     path('confirm-delete/<int:id>/', confirm_delete, name='confirm_delete'),
     path('poll-results/<int:poll_id>/', view_poll_results, name='poll_results'),
     path('recent/', recent_activity, name='recent_activity'),
     path('creaturepanel/', create, name='creaturepanel'),
+    path('instrumentation/', instrumentation_stats, name='instrumentation_stats'),
+    path('thumbnails/<int:size>/<str:fmt>/<path:name>', thumbnail, name='thumbnail'),
+
+]
 
+# Rendered derivatives are plain files; in production the web server serves
+# IMAGE_DERIVATIVE_URL. static() is a no-op unless DEBUG is on.
+urlpatterns += static(settings.IMAGE_DERIVATIVE_URL, document_root=settings.IMAGE_DERIVATIVE_ROOT)
@@ -1,4 +1,12 @@
-from django.shortcuts import render
+import os
+
+from django.contrib.auth.decorators import user_passes_test
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import redirect, render
+
+from GroupPortal import images
+from GroupPortal.instrumentation import collect, summarize
+from forum.dashboard import render_summary
 
 
 def index(request):
@@ -11,8 +19,44 @@ def about(request):
     return render(request, 'about.html')
 
 def dashboard(request):
-    return render(request, 'dashboard.html')
+    if not request.user.is_authenticated:
+        return redirect('login')
+    return render(request, 'dashboard.html', {'summary': render_summary(request)})
 
 
 def create(request):
-    return render(request, "create_template.html")
\ No newline at end of file
+    return render(request, "create_template.html")
+
+
+def is_admin(user):
+    return user.is_superuser or user.is_staff
+
+
+@user_passes_test(is_admin)
+def instrumentation_stats(request):
+    """
+    Rolling per-view query count, SQL/template/total time and peak memory
+    percentiles, merged across the workers that published to the cache.
+    """
+    return JsonResponse(summarize(collect()))
+
+
+def thumbnail(request, size, fmt, name):
+    """
+    A derivative of an uploaded image, rendered on first request. Once it
+    exists, templates link to the file itself and this view is bypassed.
+    """
+    if size not in images.sizes() or fmt not in images.FORMATS or not images.is_source(name):
+        raise Http404("No such image.")
+    path = images.derivative_path(name, size, fmt)
+    if not os.path.exists(path):
+        if not os.path.isfile(images.source_path(name)):
+            raise Http404("No such image.")
+        try:
+            images.generate(name)
+        except (OSError, ValueError) as error:
+            raise Http404("The image cannot be read.") from error
+    response = FileResponse(open(path, 'rb'), content_type=images.CONTENT_TYPES[fmt])
+    # The name changes whenever the source does.
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
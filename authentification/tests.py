@@ -1,3 +1,16 @@
 from django.test import TestCase
 
-# Create your tests here.
+from GroupPortal.testing import QueryBudgetMixin, make_user
+
+
+class ViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def test_pages(self):
+        for url in ('/login/', '/register/'):
+            with self.subTest(url=url), self.assertMaxQueries(0):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_login(self):
+        user = make_user(password='secret')
+        with self.assertMaxQueries(9):
+            response = self.client.post('/login/', {'username': user.email, 'password': 'secret'})
+        self.assertRedirects(response, '/dashboard/')
@@ -0,0 +1,73 @@
+"""
+Comment tree construction on synthetic deep, wide and random threads.
+
+For each shape this builds the tree twice: once from in-memory rows (pure
+linking cost) and once through ``load_comment_tree`` against the database,
+recording the number of queries issued.
+
+    python -m benchmarks.comment_tree --comments 10000
+"""
+import argparse
+import random
+from types import SimpleNamespace
+
+from benchmarks.harness import setup_django, timed, report
+
+
+def shape_parents(shape, n, rng):
+    """
+    Return parent indexes (None for top level) for ``n`` comments.
+    """
+    if shape == 'deep':
+        return [None] + list(range(n - 1))
+    if shape == 'wide':
+        return [None] + [0] * (n - 1)
+    return [None] + [rng.randrange(i) if rng.random() < 0.8 else None for i in range(1, n)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--comments', type=int, default=10000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from forum.comment_tree import build_comment_tree, load_comment_tree
+    from forum.models import Thread, Comment
+
+    rng = random.Random(0)
+    rows = []
+    for shape in ('deep', 'wide', 'random'):
+        parents = shape_parents(shape, args.comments, rng)
+
+        fake = [SimpleNamespace(id=i + 1, parent_id=None if p is None else p + 1) for i, p in enumerate(parents)]
+        build_seconds, tree = timed(build_comment_tree, fake)
+
+        thread = Thread.objects.create(title=shape, description='bench')
+        comments = Comment.objects.bulk_create(
+            [Comment(thread=thread, content='bench') for _ in parents], batch_size=1000
+        )
+        for comment, parent in zip(comments, parents):
+            comment.parent_id = None if parent is None else comments[parent].id
+        Comment.objects.bulk_update(comments, ['parent_id'], batch_size=1000)
+
+        def load():
+            with CaptureQueriesContext(connection) as queries:
+                load_comment_tree(thread)
+            return len(queries)
+
+        load_seconds, queries = timed(load, repeat=3)
+        rows.append({
+            'shape': shape,
+            'comments': args.comments,
+            'rendered_nodes': len(tree),
+            'build_ms': round(build_seconds * 1000, 2),
+            'load_and_build_ms': round(load_seconds * 1000, 2),
+            'queries': queries,
+        })
+    report('comment_tree', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Gradebook aggregation at school scale: 10k students x 50 subjects with
+several grades per cell.
+
+Times building the matrix and every statistic from flat rows, next to the
+per-row Python loop ``diary_view`` used before. With ``--with-db`` the rows
+are also written to and read back from the database.
+
+    python -m benchmarks.gradebook --students 10000 --subjects 50 --grades-per-cell 4
+"""
+import argparse
+import datetime
+
+import numpy as np
+
+from benchmarks.harness import setup_django, timed, report
+
+
+def legacy_grade_dict(rows):
+    grade_dict = {}
+    for grade_id, student_id, subject_id, grade, _ in rows:
+        key = f"{student_id}_{subject_id}"
+        if key not in grade_dict:
+            grade_dict[key] = []
+        grade_dict[key].append({'id': grade_id, 'grade': grade})
+    return grade_dict
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=10000)
+    parser.add_argument('--subjects', type=int, default=50)
+    parser.add_argument('--grades-per-cell', type=int, default=4)
+    parser.add_argument('--with-db', action='store_true')
+    args = parser.parse_args()
+
+    setup_django()
+    from diary.gradebook import Gradebook
+    from diary.models import Student, Subject, Grade
+
+    rng = np.random.default_rng(0)
+    cells = args.students * args.subjects
+    total = cells * args.grades_per_cell
+    students = np.repeat(np.arange(1, args.students + 1), args.subjects * args.grades_per_cell)
+    subjects = np.tile(np.repeat(np.arange(1, args.subjects + 1), args.grades_per_cell), args.students)
+    grades = rng.integers(1, 13, total)
+    start = datetime.date(2025, 9, 1)
+    dates = [start + datetime.timedelta(days=int(d)) for d in rng.integers(0, 270, total)]
+    rows = list(zip(range(1, total + 1), students.tolist(), subjects.tolist(), grades.tolist(), dates))
+    student_ids = range(1, args.students + 1)
+    subject_ids = range(1, args.subjects + 1)
+
+    results = []
+
+    def record(step, seconds):
+        results.append({'step': step, 'grades': total, 'ms': round(seconds * 1000, 1)})
+
+    record('legacy_python_loop_grade_dict', timed(legacy_grade_dict, rows, repeat=1)[0])
+    seconds, gradebook = timed(Gradebook.from_rows, student_ids, subject_ids, rows, repeat=1)
+    record('build_arrays', seconds)
+    record('cell_grades', timed(gradebook.cell_grades, repeat=1)[0])
+    record('matrix_counts_and_means', timed(lambda: (gradebook.counts(), gradebook.means()))[0])
+    record('by_student', timed(gradebook.by_student)[0])
+    record('by_subject', timed(gradebook.by_subject)[0])
+    record('date_range_by_subject', timed(
+        lambda: gradebook.between(datetime.date(2025, 11, 1), datetime.date(2025, 12, 31)).by_subject()
+    )[0])
+
+    if args.with_db:
+        Student.objects.bulk_create(
+            [Student(id=i, first_name='S', last_name=str(i)) for i in student_ids], batch_size=5000
+        )
+        Subject.objects.bulk_create([Subject(id=i, name=f'Subject {i}') for i in subject_ids])
+        Grade.objects.bulk_create(
+            [Grade(id=g, student_id=st, subject_id=su, grade=v) for g, st, su, v, _ in rows], batch_size=5000
+        )
+        record('load_from_db', timed(Gradebook.load, repeat=1)[0])
+
+    report('gradebook', results)
+
+
+if __name__ == '__main__':
+    main()
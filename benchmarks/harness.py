@@ -0,0 +1,55 @@
+"""
+Shared bootstrap for the benchmark scripts in this package.
+
+Each script is run from the project root, e.g.
+``python -m benchmarks.view_counter``, and works against a throwaway test
+database and a per-process cache so it never touches ``db.sqlite3`` or the
+site's shared cache.
+"""
+import json
+import os
+import statistics
+import sys
+import time
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'GroupPortal.settings')
+    import django
+    from django.conf import settings
+    # Keys written here name rows of the throwaway database.
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+
+def timed(fn, *args, repeat=5, **kwargs):
+    """
+    Run ``fn`` ``repeat`` times and return (median seconds, last result).
+    """
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+def report(name, rows):
+    json.dump({'benchmark': name, 'results': rows}, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+def percentile(samples, q):
+    """
+    Nearest-rank percentile of a sorted list, ``None`` for an empty one.
+    """
+    if not samples:
+        return None
+    rank = max(int(round(q / 100 * len(samples) + 0.5)) - 1, 0)
+    return samples[min(rank, len(samples) - 1)]
@@ -0,0 +1,202 @@
+"""
+In-process load test: drives the WSGI application from GroupPortal/wsgi.py
+with concurrent worker threads and reports throughput and p50/p95/p99
+latency per URL name as JSON, so two runs can be diffed.
+
+By default it seeds a throwaway database with ``seed_portal`` data first:
+
+    python -m benchmarks.load --scale 0.1 --workers 8 --requests 5000
+
+``--existing`` skips seeding and runs against the configured database
+(e.g. one filled with ``manage.py seed_portal``).
+"""
+import argparse
+import io
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from benchmarks.harness import setup_django, report, percentile
+
+# Relative request mix; anonymous traffic only.
+MIX = {
+    'index': 2,
+    'forum_list': 5,
+    'forum_detail': 10,
+    'thread_detail': 30,
+    'comment_replies': 5,
+    'recent_activity': 10,
+    'search': 8,
+    'poll_results': 5,
+    'diary': 3,
+    'diary-grades': 7,
+}
+
+
+def build_urls(count, seed):
+    from django.urls import reverse
+    from diary.models import Student
+    from forum.models import Forum, Thread, Comment, Poll
+
+    rng = random.Random(seed)
+    sample = lambda qs: list(qs.order_by('?').values_list('id', flat=True)[:1000])  # noqa: E731
+    ids = {
+        'forum': sample(Forum.objects.all()),
+        'thread': sample(Thread.objects.filter(is_deleted=False)),
+        'comment': sample(Comment.objects.filter(parent__isnull=True, replies__isnull=False).distinct()),
+        'poll': sample(Poll.objects.all()),
+    }
+    student_pages = max(-(-Student.objects.count() // 50), 1)
+    words = ['django', 'query', 'cache', 'python', 'vote', 'index thread', 'memory']
+
+    makers = {
+        'index': lambda: reverse('index'),
+        'forum_list': lambda: reverse('forum_list'),
+        'forum_detail': lambda: reverse('forum_detail', args=[rng.choice(ids['forum'])]),
+        'thread_detail': lambda: reverse('thread_detail', args=[rng.choice(ids['thread'])]),
+        'comment_replies': lambda: reverse('comment_replies', args=[rng.choice(ids['comment'])]),
+        'recent_activity': lambda: reverse('recent_activity'),
+        'search': lambda: f"{reverse('search')}?q={rng.choice(words).replace(' ', '+')}",
+        'poll_results': lambda: reverse('poll_results', args=[rng.choice(ids['poll'])]),
+        'diary': lambda: reverse('diary'),
+        'diary-grades': lambda: f"{reverse('diary-grades')}?page={rng.randint(1, student_pages)}",
+    }
+    required = {'forum_detail': 'forum', 'thread_detail': 'thread', 'comment_replies': 'comment', 'poll_results': 'poll'}
+    names = [name for name in MIX if name not in required or ids[required[name]]]
+    weights = [MIX[name] for name in names]
+    return [makers[name]() for name in rng.choices(names, weights, k=count)]
+
+
+def environ_for(url):
+    parts = urlsplit(url)
+    return {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': parts.path,
+        'QUERY_STRING': parts.query,
+        'SCRIPT_NAME': '',
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'testserver',
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+
+def run(application, urls, workers):
+    from django.db import connections
+    from django.urls import resolve
+
+    names = {}
+    samples = {}
+    errors = {}
+    lock = threading.Lock()
+    queue = iter(urls)
+
+    def worker():
+        try:
+            while True:
+                with lock:
+                    url = next(queue, None)
+                if url is None:
+                    return
+                status = []
+                start = time.perf_counter()
+                body = application(environ_for(url), lambda code, headers, exc_info=None: status.append(code))
+                try:
+                    for _ in body:
+                        pass
+                finally:
+                    if hasattr(body, 'close'):
+                        body.close()
+                elapsed = time.perf_counter() - start
+
+                path = urlsplit(url).path
+                name = names.get(path) or names.setdefault(path, resolve(path).view_name)
+                with lock:
+                    samples.setdefault(name, []).append(elapsed)
+                    if not status or not status[0].startswith(('2', '3')):
+                        errors[name] = errors.get(name, 0) + 1
+        finally:
+            connections.close_all()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        for future in [pool.submit(worker) for _ in range(workers)]:
+            future.result()
+    return time.perf_counter() - start, samples, errors
+
+
+def summarize(samples, errors, wall):
+    rows = []
+    everything = []
+    for name, latencies in sorted(samples.items()):
+        latencies.sort()
+        everything.extend(latencies)
+        rows.append(_row(name, latencies, errors.get(name, 0), wall))
+    everything.sort()
+    rows.append(_row('*', everything, sum(errors.values()), wall))
+    return rows
+
+
+def _row(name, latencies, errors, wall):
+    ms = lambda q: round(percentile(latencies, q) * 1000, 2)  # noqa: E731
+    return {
+        'url_name': name,
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / wall, 1),
+        'p50_ms': ms(50),
+        'p95_ms': ms(95),
+        'p99_ms': ms(99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--scale', type=float, default=0.05, help="seed_portal scale for the throwaway database.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--existing', action='store_true', help="Use the configured database as is.")
+    args = parser.parse_args()
+
+    if args.existing:
+        import os
+        import django
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'GroupPortal.settings')
+        django.setup()
+    else:
+        setup_django()
+        from forum.search import reindex
+        from GroupPortal.seeding import PortalSeeder, scaled
+        PortalSeeder(scaled(args.scale), seed=args.seed).run()
+        for _ in reindex():
+            pass
+
+    from GroupPortal.wsgi import application
+    from forum.view_counter import flush_view_counts
+
+    urls = build_urls(args.warmup + args.requests, args.seed)
+    run(application, urls[:args.warmup], args.workers)
+    wall, samples, errors = run(application, urls[args.warmup:], args.workers)
+    flush_view_counts()
+
+    rows = summarize(samples, errors, wall)
+    for row in rows:
+        row.update(workers=args.workers, scale=None if args.existing else args.scale)
+    report('load', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Poll results cost with 100k votes: the old per-option COUNT queries versus
+one grouped aggregate, the stored counters, and the cached tally.
+
+    python -m benchmarks.poll_tally --votes 100000 --options 8
+"""
+import argparse
+
+from benchmarks.harness import setup_django, timed, report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--votes', type=int, default=100000)
+    parser.add_argument('--options', type=int, default=8)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.cache import cache
+    from django.db import connection
+    from django.db.models import Count
+    from django.test.utils import CaptureQueriesContext
+    from authentification.models import CustomUser
+    from forum.models import Thread, Poll, PollOption, PollVote
+    from forum.polls import poll_tally, rebuild_poll_counters
+
+    users = CustomUser.objects.bulk_create(
+        [CustomUser(email=f'voter{i}@example.com', username=f'voter{i}') for i in range(args.votes)],
+        batch_size=5000,
+    )
+    poll = Poll.objects.create(thread=Thread.objects.create(title='Bench', description='bench'), question='?')
+    options = PollOption.objects.bulk_create([PollOption(poll=poll, text=f'Option {i}') for i in range(args.options)])
+    PollVote.objects.bulk_create(
+        [PollVote(user=user, option=options[i % len(options)]) for i, user in enumerate(users)],
+        batch_size=5000,
+    )
+    rebuild_poll_counters()
+
+    def per_option_counts():
+        total = PollVote.objects.filter(option__poll=poll).count()
+        return total, [PollVote.objects.filter(option=option).count() for option in poll.options.all()]
+
+    def grouped_aggregate():
+        return list(poll.options.annotate(n=Count('pollvote')).values_list('id', 'n'))
+
+    def counters():
+        cache.delete(f"forum:poll-tally:{poll.id}")
+        return poll_tally(poll).results
+
+    def cached():
+        return poll_tally(poll).results
+
+    rows = []
+    for name, fn in (
+        ('per_option_count (before)', per_option_counts),
+        ('grouped_aggregate', grouped_aggregate),
+        ('stored_counters', counters),
+        ('cached_tally', cached),
+    ):
+        with CaptureQueriesContext(connection) as queries:
+            fn()
+        seconds, _ = timed(fn)
+        rows.append({
+            'strategy': name,
+            'votes': args.votes,
+            'options': args.options,
+            'queries': len(queries),
+            'ms': round(seconds * 1000, 3),
+        })
+    report('poll_tally', rows)
+
+
+if __name__ == '__main__':
+    main()
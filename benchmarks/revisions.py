@@ -0,0 +1,131 @@
+"""
+Edit history storage and read cost: the old layout (old and new text on
+every edit row) against the revision store (snapshots, deltas, zlib), for
+posts edited many times with small changes.
+
+    python -m benchmarks.revisions --posts 200 --edits 50 --words 300
+"""
+import argparse
+import random
+from datetime import timedelta
+
+from benchmarks.harness import setup_django, timed, report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=200)
+    parser.add_argument('--edits', type=int, default=50)
+    parser.add_argument('--words', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection, models
+    from django.test.utils import CaptureQueriesContext
+    from authentification.models import CustomUser
+    from forum.models import Thread, ThreadRevision
+    from forum.revisions import content_at, convert, revision_diff
+
+    rng = random.Random(args.seed)
+    vocabulary = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(2, 9))) for _ in range(2000)]
+
+    def versions():
+        words = [rng.choice(vocabulary) for _ in range(args.words)]
+        texts = [' '.join(words)]
+        for _ in range(args.edits):
+            # A typical edit: a few words changed, added or removed.
+            for _ in range(rng.randint(1, 4)):
+                position = rng.randrange(len(words))
+                action = rng.random()
+                if action < 0.6:
+                    words[position] = rng.choice(vocabulary)
+                elif action < 0.8:
+                    words.insert(position, rng.choice(vocabulary))
+                elif len(words) > 1:
+                    del words[position]
+            texts.append(' '.join(words))
+        return texts
+
+    user = CustomUser.objects.create(email='editor@example.com', username='editor')
+    threads = Thread.objects.bulk_create(
+        [Thread(title=f'Post {i}', description='', author=user) for i in range(args.posts)]
+    )
+
+    class LegacyHistory(models.Model):
+        """
+        The ThreadEditHistory table as it was before the revision store.
+        """
+        thread_id = models.IntegerField()
+        user_id = models.IntegerField(null=True)
+        old_content = models.TextField()
+        new_content = models.TextField()
+        edited_at = models.DateTimeField()
+
+        class Meta:
+            app_label = 'forum'
+            db_table = 'bench_legacy_history'
+            managed = False
+            indexes = [models.Index(fields=['thread_id', '-edited_at'], name='bench_legacy_history_idx')]
+
+    with connection.schema_editor() as editor:
+        editor.create_model(LegacyHistory)
+
+    legacy_bytes = store_bytes = 0
+    for thread in threads:
+        texts = versions()
+        edits = [(old, new, user.pk, None) for old, new in zip(texts, texts[1:])]
+        LegacyHistory.objects.bulk_create([
+            LegacyHistory(
+                thread_id=thread.pk, user_id=user.pk, old_content=old, new_content=new,
+                edited_at=thread.created_at + timedelta(seconds=n),
+            )
+            for n, (old, new, _, _) in enumerate(edits)
+        ])
+        legacy_bytes += sum(len(old.encode()) + len(new.encode()) for old, new, _, _ in edits)
+        rows = convert(texts[0], [(old, new, user.pk, thread.created_at) for old, new, _, _ in edits])
+        ThreadRevision.objects.bulk_create(
+            [ThreadRevision(thread_id=thread.pk, user_id=row.pop('user_id', None), **row) for row in rows]
+        )
+        store_bytes += sum(len(row['data']) for row in rows)
+
+    sample = threads[len(threads) // 2].pk
+    latest = args.edits
+
+    legacy = LegacyHistory.objects.filter(thread_id=sample)
+
+    def legacy_latest():
+        return legacy.order_by('-edited_at').values_list('new_content', flat=True)[0]
+
+    def legacy_middle():
+        return legacy.order_by('edited_at').values_list('new_content', flat=True)[latest // 2 - 1]
+
+    def legacy_history_page():
+        return list(legacy.order_by('-edited_at'))
+
+    def store_history_page():
+        return list(ThreadRevision.objects.filter(thread_id=sample).defer('data').order_by('-number'))
+
+    rows = [
+        {'layout': 'legacy old/new rows', 'posts': args.posts, 'edits': args.edits, 'payload_bytes': legacy_bytes},
+        {'layout': 'revision store', 'posts': args.posts, 'edits': args.edits, 'payload_bytes': store_bytes,
+         'ratio': round(store_bytes / legacy_bytes, 4)},
+    ]
+    for name, fn in (
+        ('legacy latest revision', legacy_latest),
+        ('store latest revision', lambda: content_at('thread', sample, latest)),
+        ('legacy middle revision', legacy_middle),
+        ('store middle revision', lambda: content_at('thread', sample, latest // 2)),
+        ('legacy history page', legacy_history_page),
+        ('store history page (no payloads)', store_history_page),
+        ('store diff page', lambda: revision_diff('thread', sample, latest)),
+    ):
+        with CaptureQueriesContext(connection) as queries:
+            fn()
+        seconds, _ = timed(fn, repeat=20)
+        rows.append({'read': name, 'queries': len(queries), 'ms': round(seconds * 1000, 3)})
+    report('revisions', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Trending thread orderings over a large forum: pages served from the
+indexed trending columns against the same orderings computed per request
+from the vote and comment tables, plus the cost of keeping the columns
+(the vote UPDATE with and without them, the hourly window refresh and the
+nightly full rescore).
+
+    python -m benchmarks.trending --threads 1000000 --votes 300000 --comments 300000
+"""
+import argparse
+import random
+from datetime import timedelta
+
+from benchmarks.harness import setup_django, timed, report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=1_000_000)
+    parser.add_argument('--votes', type=int, default=300_000)
+    parser.add_argument('--comments', type=int, default=300_000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection, reset_queries
+    from django.db.models import Count, F, Q
+    from django.test.utils import CaptureQueriesContext
+    from django.utils.timezone import now
+    from GroupPortal.seeding import explicit_timestamps
+    from authentification.models import CustomUser
+    from forum.models import Category, Comment, Forum, Thread, ThreadVote
+    from forum.pagination import KeysetPaginator
+    from forum.trending import ORDERINGS, WINDOW, refresh_windows, rescore, vote_updates
+
+    rng = random.Random(args.seed)
+    start = now()
+    span = args.days * 24 * 60 * 60
+
+    def recent():
+        # Activity skews towards the last few days, as on a live forum.
+        return start - timedelta(seconds=min(rng.expovariate(1 / (3 * 24 * 60 * 60)), span))
+
+    users = CustomUser.objects.bulk_create(
+        [CustomUser(email=f'u{n}@example.com', username=f'u{n}') for n in range(args.users)], batch_size=1000,
+    )
+    categories = Category.objects.bulk_create([Category(name=f'Category {n}') for n in range(20)])
+    forum = Forum.objects.create(name='Bench')
+    forum.categories.set(categories[:5])
+
+    with explicit_timestamps(Thread, Comment, ThreadVote):
+        for offset in range(0, args.threads, 10000):
+            batch = []
+            for _ in range(min(10000, args.threads - offset)):
+                created_at = start - timedelta(seconds=rng.uniform(0, span))
+                batch.append(Thread(
+                    title='Bench', description='', author=rng.choice(users), category=rng.choice(categories),
+                    views=rng.randrange(200), created_at=created_at, updated_at=created_at,
+                ))
+            Thread.objects.bulk_create(batch, batch_size=2000)
+        first, last = Thread.objects.order_by('pk').values_list('pk', flat=True)[0], Thread.objects.latest('pk').pk
+
+        pairs = set()
+        while len(pairs) < args.votes:
+            pairs.add((rng.choice(users).pk, rng.randint(first, last)))
+        ThreadVote.objects.bulk_create(
+            (ThreadVote(user_id=user_id, thread_id=thread_id, vote_type=rng.choice(('up', 'up', 'down')),
+                        voted_at=recent()) for user_id, thread_id in pairs),
+            batch_size=2000,
+        )
+        Comment.objects.bulk_create(
+            (Comment(thread_id=rng.randint(first, last), author=rng.choice(users), content='Bench',
+                     created_at=(at := recent()), updated_at=at) for _ in range(args.comments)),
+            batch_size=2000,
+        )
+
+    rows = [{'threads': args.threads, 'votes': args.votes, 'comments': args.comments}]
+    seconds, changed = timed(rescore, repeat=1)
+    rows.append({'maintenance': 'full rescore (nightly)', 'threads_written': changed, 's': round(seconds, 2)})
+    seconds, changed = timed(refresh_windows, repeat=3)
+    rows.append({'maintenance': 'window refresh (hourly)', 'threads_written': changed, 's': round(seconds, 3)})
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+    live = Thread.objects.filter(Q(category__in=categories[:5]) | Q(category__isnull=True), is_deleted=False)
+    since = start - WINDOW
+
+    def indexed(key, depth=0):
+        def read():
+            paginator = KeysetPaginator(live, per_page=20, key=key)
+            page = paginator.page()
+            for _ in range(depth):
+                page = paginator.page(page.next_cursor)
+            return list(page)
+        return read
+
+    def aggregated_top():
+        return list(live.annotate(
+            net=Count('threadvote', filter=Q(threadvote__voted_at__gte=since, threadvote__vote_type='up'))
+            - Count('threadvote', filter=Q(threadvote__voted_at__gte=since, threadvote__vote_type='down')),
+        ).order_by('-net', '-id')[:20])
+
+    def aggregated_discussed():
+        return list(live.annotate(
+            n=Count('comments', filter=Q(comments__created_at__gte=since)),
+        ).order_by('-n', '-id')[:20])
+
+    def aggregated_hot():
+        # Activity counted per request: the usual ad hoc "hot" without a
+        # stored score (and without any decay).
+        return list(live.annotate(
+            activity=Count('threadvote') + Count('comments', distinct=True) * 2 + F('views') / 10,
+        ).order_by(F('activity').desc(), '-created_at')[:20])
+
+    for name, fn in (
+        ('hot, indexed page 1', indexed(ORDERINGS['hot'])),
+        ('hot, indexed page 10', indexed(ORDERINGS['hot'], depth=9)),
+        ('top this week, indexed page 1', indexed(ORDERINGS['top'])),
+        ('most discussed, indexed page 1', indexed(ORDERINGS['discussed'])),
+        ('newest, indexed page 1', indexed(ORDERINGS['new'])),
+        ('hot, aggregated per request', aggregated_hot),
+        ('top this week, aggregated per request', aggregated_top),
+        ('most discussed, aggregated per request', aggregated_discussed),
+    ):
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            fn()
+        seconds, _ = timed(fn, repeat=3)
+        rows.append({'read': name, 'queries': len(queries), 'ms': round(seconds * 1000, 2)})
+
+    target = rng.randint(first, last)
+
+    def counters_only():
+        Thread.objects.filter(pk=target).update(upvotes=F('upvotes') + 1, score=F('score') + 1)
+
+    def with_trending():
+        Thread.objects.filter(pk=target).update(
+            upvotes=F('upvotes') + 1, score=F('score') + 1, **vote_updates(1, now()),
+        )
+
+    for name, fn in (('vote counters only', counters_only), ('vote counters + trending', with_trending)):
+        seconds, _ = timed(fn, repeat=200)
+        rows.append({'write': name, 'ms': round(seconds * 1000, 3)})
+    report('trending', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Flush cost of the buffered view counter as the request rate grows.
+
+Simulates N page hits spread over a fixed set of threads between two
+flushes and times the flush. The flush is one UPDATE per 500 distinct
+threads, so its cost tracks the number of distinct threads, not hits.
+
+    python -m benchmarks.view_counter --threads 2000
+"""
+import argparse
+import random
+
+from benchmarks.harness import setup_django, timed, report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=2000)
+    parser.add_argument('--rates', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from forum.models import Thread
+    from forum.view_counter import ViewCountBuffer
+
+    Thread.objects.bulk_create(
+        [Thread(title=f"Thread {i}", description="bench") for i in range(args.threads)],
+        batch_size=1000,
+    )
+    ids = list(Thread.objects.values_list('id', flat=True))
+    rng = random.Random(0)
+
+    rows = []
+    for rate in args.rates:
+        hits = [rng.choice(ids) for _ in range(rate)]
+        buffer = ViewCountBuffer(Thread)
+
+        def flush():
+            with CaptureQueriesContext(connection) as queries:
+                buffer.flush()
+            return len(queries)
+
+        samples = []
+        for _ in range(3):
+            buffer._pending.update(hits)
+            seconds, statements = timed(flush, repeat=1)
+            samples.append(seconds)
+        seconds = min(samples)
+        rows.append({
+            'hits_per_flush': rate,
+            'distinct_threads': len(set(hits)),
+            'update_statements': statements,
+            'flush_ms': round(seconds * 1000, 2),
+        })
+    report('view_counter_flush', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import csv
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from diary.models import Grade
+
+HEADER = ('student', 'subject', 'grade', 'date')
+CHUNK_SIZE = 2000
+
+# Spreadsheets run text cells starting with these as formulas.
+_FORMULA_START = ('=', '+', '-', '@', '\t', '\r')
+
+# Control characters are not allowed anywhere in an XML 1.0 document.
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def grade_rows(grades=None, students=None, subject=None, date_from=None, date_to=None):
+    """
+    Yield ``(student, subject, grade, date)`` for the selected grades,
+    streamed from the database in chunks.
+    """
+    grades = Grade.objects.all() if grades is None else grades
+    if students:
+        grades = grades.filter(student_id__in=students)
+    if subject:
+        grades = grades.filter(subject_id=subject)
+    if date_from:
+        grades = grades.filter(date__gte=date_from)
+    if date_to:
+        grades = grades.filter(date__lte=date_to)
+    rows = (
+        grades.order_by('student__last_name', 'student__first_name', 'student_id', 'subject__name', 'date', 'id')
+        .values_list('student__first_name', 'student__last_name', 'subject__name', 'grade', 'date')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    for first_name, last_name, subject_name, grade, date in rows:
+        yield f"{first_name} {last_name}", subject_name, grade, date
+
+
+class _Sink:
+    """
+    Write-only file object that hands back whatever was written since the
+    last ``drain()``, so a writer's output can be streamed piece by piece.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class _Line:
+    def write(self, value):
+        return value
+
+
+def _csv_cell(value):
+    if isinstance(value, str) and value.startswith(_FORMULA_START):
+        return "'" + value
+    return value
+
+
+def csv_stream(rows):
+    """
+    Yield ``rows`` as CSV lines. Text that a spreadsheet would take for a
+    formula is prefixed with a quote; the XLSX writes every text as an
+    inline string, which is never evaluated.
+    """
+    writer = csv.writer(_Line())
+    yield writer.writerow(HEADER)
+    for row in rows:
+        yield writer.writerow([_csv_cell(value) for value in row])
+
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Grades" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_cell(value):
+    if isinstance(value, int):
+        return f'<c><v>{value}</v></c>'
+    text = escape(_XML_ILLEGAL.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t>{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def xlsx_stream(rows, flush_every=CHUNK_SIZE):
+    """
+    Yield an XLSX workbook holding ``rows`` as it is being written. The zip
+    is produced with data descriptors, so nothing is buffered beyond the
+    rows since the last flush.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in _XLSX_PARTS.items():
+            workbook.writestr(name, content)
+        yield sink.drain()
+
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_xlsx_row(HEADER).encode())
+            for count, row in enumerate(rows, 1):
+                sheet.write(_xlsx_row(row).encode())
+                if count % flush_every == 0:
+                    yield sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+FORMATS = {
+    'csv': (csv_stream, 'text/csv', 'grades.csv'),
+    'xlsx': (xlsx_stream, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'grades.xlsx'),
+}
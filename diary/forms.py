@@ -32,3 +32,23 @@ class GradeForm(forms.ModelForm):
             'subject': forms.Select(attrs={'placeholder': 'Select Subject'}),
             'grade': forms.NumberInput(attrs={'placeholder': 'Enter Grade'})
         }
+
+
+class GradeExportForm(forms.Form):
+    format = forms.ChoiceField(choices=(('csv', 'CSV'), ('xlsx', 'XLSX')), required=False)
+    students = forms.ModelMultipleChoiceField(queryset=Student.objects.all(), required=False)
+    subject = forms.ModelChoiceField(queryset=Subject.objects.all(), required=False)
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+
+
+class GradeImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV: student, subject, grade[, date]")
+
+
+class DiaryFilterForm(forms.Form):
+    page = forms.IntegerField(min_value=1, required=False)
+    per_page = forms.IntegerField(min_value=1, max_value=200, required=False)
+    subjects = forms.ModelMultipleChoiceField(queryset=Subject.objects.all(), required=False)
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
@@ -0,0 +1,221 @@
+from datetime import date
+from operator import itemgetter
+
+import numpy as np
+
+from diary.models import Student, Subject, Grade
+
+UNIX_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class GroupStats:
+    """
+    Per-group statistics (one entry per student or per subject), aligned
+    with ``ids``. Groups without grades have a count of 0 and NaN averages.
+    """
+
+    def __init__(self, ids, counts, means, medians, values, distribution):
+        self.ids = ids
+        self.counts = counts
+        self.means = means
+        self.medians = medians
+        self.values = values
+        self.distribution = distribution
+
+    def as_dict(self):
+        """
+        ``{id: {'count', 'mean', 'median', 'distribution'}}`` with plain
+        Python numbers, ready for templates or JSON.
+        """
+        values = self.values.tolist()
+        return {
+            group_id: {
+                'count': count,
+                'mean': None if np.isnan(mean) else round(mean, 2),
+                'median': None if np.isnan(median) else median,
+                'distribution': {value: n for value, n in zip(values, row) if n},
+            }
+            for group_id, count, mean, median, row in zip(
+                self.ids.tolist(), self.counts.tolist(), self.means.tolist(),
+                self.medians.tolist(), self.distribution.tolist(),
+            )
+        }
+
+
+class Gradebook:
+    """
+    A student x subject view of the ``Grade`` table held as flat NumPy
+    arrays (one element per grade), with every aggregate computed
+    vectorized over them.
+    """
+
+    def __init__(self, student_ids, subject_ids, grade_ids, student_index, subject_index, grades, dates):
+        self.student_ids = student_ids
+        self.subject_ids = subject_ids
+        self.grade_ids = grade_ids
+        self.student_index = student_index
+        self.subject_index = subject_index
+        self.grades = grades
+        self.dates = dates
+
+    @classmethod
+    def load(cls, grades=None, student_ids=None, subject_ids=None, date_from=None, date_to=None):
+        """
+        Fetch ``grades`` (all of them by default) as flat value tuples,
+        optionally limited to an inclusive date range. The matrix axes are
+        ``student_ids`` and ``subject_ids``, or every student and subject.
+        """
+        grades = Grade.objects.all() if grades is None else grades
+        if date_from:
+            grades = grades.filter(date__gte=date_from)
+        if date_to:
+            grades = grades.filter(date__lte=date_to)
+        if student_ids is None:
+            student_ids = Student.objects.values_list('id', flat=True)
+        if subject_ids is None:
+            subject_ids = Subject.objects.values_list('id', flat=True)
+
+        rows = list(grades.order_by().values_list('id', 'student_id', 'subject_id', 'grade', 'date'))
+        return cls.from_rows(sorted(student_ids), sorted(subject_ids), rows)
+
+    @classmethod
+    def from_rows(cls, student_ids, subject_ids, rows):
+        """
+        Build a gradebook from ``(grade_id, student_id, subject_id, grade,
+        date)`` tuples over sorted id axes. Rows for students or subjects
+        outside the axes are dropped.
+        """
+        student_ids = np.asarray(student_ids, dtype=np.int64)
+        subject_ids = np.asarray(subject_ids, dtype=np.int64)
+        count = len(rows)
+        numbers = [np.fromiter(map(itemgetter(column), rows), np.int64, count) for column in range(4)]
+        # Going through ordinals is far cheaper than letting NumPy parse
+        # date objects one by one.
+        ordinals = np.fromiter(map(date.toordinal, map(itemgetter(4), rows)), np.int64, count)
+        dates = (ordinals - UNIX_EPOCH_ORDINAL).astype('datetime64[D]')
+
+        student_index = cls._positions(student_ids, numbers[1])
+        subject_index = cls._positions(subject_ids, numbers[2])
+        known = (student_index >= 0) & (subject_index >= 0)
+        return cls(
+            student_ids, subject_ids, numbers[0][known],
+            student_index[known], subject_index[known], numbers[3][known], dates[known],
+        )
+
+    @staticmethod
+    def _positions(sorted_ids, values):
+        # Index of each value in sorted_ids, or -1 where it is absent.
+        positions = np.searchsorted(sorted_ids, values)
+        positions = np.minimum(positions, max(len(sorted_ids) - 1, 0))
+        found = sorted_ids[positions] == values if len(sorted_ids) else np.zeros(len(values), dtype=bool)
+        return np.where(found, positions, -1)
+
+    def __len__(self):
+        return len(self.grades)
+
+    @property
+    def shape(self):
+        return len(self.student_ids), len(self.subject_ids)
+
+    def between(self, date_from=None, date_to=None):
+        """
+        The same gradebook restricted to an inclusive date range.
+        """
+        mask = np.ones(len(self.dates), dtype=bool)
+        if date_from is not None:
+            mask &= self.dates >= np.datetime64(date_from, 'D')
+        if date_to is not None:
+            mask &= self.dates <= np.datetime64(date_to, 'D')
+        return Gradebook(
+            self.student_ids, self.subject_ids, self.grade_ids[mask],
+            self.student_index[mask], self.subject_index[mask], self.grades[mask], self.dates[mask],
+        )
+
+    # ----- Matrix -----
+
+    def _cells(self):
+        return self.student_index * len(self.subject_ids) + self.subject_index
+
+    def counts(self):
+        """
+        Number of grades per (student, subject) cell.
+        """
+        size = len(self.student_ids) * len(self.subject_ids)
+        return np.bincount(self._cells(), minlength=size).reshape(self.shape)
+
+    def means(self):
+        """
+        Average grade per (student, subject) cell, NaN where there is none.
+        """
+        size = len(self.student_ids) * len(self.subject_ids)
+        sums = np.bincount(self._cells(), weights=self.grades, minlength=size).reshape(self.shape)
+        counts = self.counts()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, sums / counts, np.nan)
+
+    def cell_grades(self):
+        """
+        ``{"<student_id>_<subject_id>": [{'id', 'grade'}, ...]}`` for every
+        non-empty cell, grades in id order.
+        """
+        if not len(self):
+            return {}
+        cells = self._cells()
+        order = np.lexsort((self.grade_ids, cells))
+        cells, ids, grades = cells[order], self.grade_ids[order], self.grades[order]
+        starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+        bounds = np.r_[starts, len(cells)].tolist()
+        subject_count = len(self.subject_ids)
+        student_ids, subject_ids = self.student_ids.tolist(), self.subject_ids.tolist()
+        ids, grades, cells = ids.tolist(), grades.tolist(), cells.tolist()
+        return {
+            f"{student_ids[cells[lo] // subject_count]}_{subject_ids[cells[lo] % subject_count]}": [
+                {'id': grade_id, 'grade': grade} for grade_id, grade in zip(ids[lo:hi], grades[lo:hi])
+            ]
+            for lo, hi in zip(bounds, bounds[1:])
+        }
+
+    def columns(self):
+        """
+        Every grade as parallel lists (one entry per grade, in id order),
+        the compact shape the diary API sends to the browser.
+        """
+        order = np.argsort(self.grade_ids, kind='stable')
+        return {
+            'id': self.grade_ids[order].tolist(),
+            'student': self.student_ids[self.student_index[order]].tolist(),
+            'subject': self.subject_ids[self.subject_index[order]].tolist(),
+            'grade': self.grades[order].tolist(),
+            'date': np.datetime_as_string(self.dates[order], unit='D').tolist(),
+        }
+
+    # ----- Statistics -----
+
+    def _group_stats(self, ids, index):
+        groups = len(ids)
+        counts = np.bincount(index, minlength=groups)
+        sums = np.bincount(index, weights=self.grades, minlength=groups)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+        # Medians: sort grades within each group, then average the one or
+        # two middle elements of every group at once.
+        ordered = self.grades[np.lexsort((self.grades, index))]
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        medians = np.full(groups, np.nan)
+        has = counts > 0
+        low = starts[has] + (counts[has] - 1) // 2
+        high = starts[has] + counts[has] // 2
+        medians[has] = (ordered[low] + ordered[high]) / 2
+
+        values, value_index = np.unique(self.grades, return_inverse=True)
+        distribution = np.bincount(
+            index * len(values) + value_index, minlength=groups * len(values)
+        ).reshape(groups, len(values))
+        return GroupStats(ids, counts, means, medians, values, distribution)
+
+    def by_student(self):
+        return self._group_stats(self.student_ids, self.student_index)
+
+    def by_subject(self):
+        return self._group_stats(self.subject_ids, self.subject_index)
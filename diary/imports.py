@@ -0,0 +1,96 @@
+import csv
+import datetime
+
+from django.db import transaction
+
+from diary.models import Student, Subject, Grade
+
+BATCH_SIZE = 1000
+
+
+class ImportFailed(Exception):
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid row(s)")
+        self.errors = errors
+
+
+def _lookup(pairs):
+    """
+    Map lower-cased names to ids; names shared by several rows map to None
+    so they can be reported as ambiguous.
+    """
+    lookup = {}
+    for name, pk in pairs:
+        key = name.strip().lower()
+        lookup[key] = None if key in lookup else pk
+    return lookup
+
+
+def import_grades(lines, batch_size=BATCH_SIZE, dry_run=False):
+    """
+    Validate a CSV of ``student,subject,grade[,date]`` rows and insert them
+    with ``bulk_create`` in batches, all inside one transaction. Students
+    are matched on "First Last" and subjects on name, case-insensitively.
+
+    Nothing is written unless every row is valid; otherwise ImportFailed
+    carries ``(line number, message)`` for each bad row. Returns the
+    number of grades created.
+    """
+    students = _lookup(
+        (f"{first} {last}", pk) for pk, first, last in Student.objects.values_list('id', 'first_name', 'last_name')
+    )
+    subjects = _lookup(Subject.objects.values_list('name', 'id'))
+
+    reader = csv.DictReader(lines)
+    missing = {'student', 'subject', 'grade'} - set(reader.fieldnames or ())
+    if missing:
+        raise ImportFailed([(1, f"Missing column(s): {', '.join(sorted(missing))}")])
+
+    errors = []
+    created = 0
+    batch = []
+    with transaction.atomic():
+        for row in reader:
+            line = reader.line_num
+            problems = []
+            student_id = students.get((row['student'] or '').strip().lower(), 0)
+            subject_id = subjects.get((row['subject'] or '').strip().lower(), 0)
+            if not student_id:
+                problems.append(f"{'ambiguous' if student_id is None else 'unknown'} student {row['student']!r}")
+            if not subject_id:
+                problems.append(f"{'ambiguous' if subject_id is None else 'unknown'} subject {row['subject']!r}")
+            try:
+                grade = int(row['grade'])
+            except (TypeError, ValueError):
+                problems.append(f"grade {row['grade']!r} is not a whole number")
+            date = None
+            if row.get('date'):
+                try:
+                    date = datetime.date.fromisoformat(row['date'].strip())
+                except ValueError:
+                    problems.append(f"date {row['date']!r} is not YYYY-MM-DD")
+
+            if problems:
+                errors.append((line, "; ".join(problems)))
+                continue
+            if errors:
+                # Keep validating, but there is no point writing anything.
+                continue
+
+            grade = Grade(student_id=student_id, subject_id=subject_id, grade=grade)
+            if date:
+                grade.date = date
+            batch.append(grade)
+            if len(batch) >= batch_size:
+                Grade.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+
+        if errors:
+            raise ImportFailed(errors)
+        if batch:
+            Grade.objects.bulk_create(batch)
+            created += len(batch)
+        if dry_run:
+            transaction.set_rollback(True)
+    return created
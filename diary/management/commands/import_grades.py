@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from diary.imports import BATCH_SIZE, ImportFailed, import_grades
+
+
+class Command(BaseCommand):
+    help = "Bulk-import grades from a CSV file with student, subject, grade and optional date columns."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Validate the file without saving anything.")
+
+    def handle(self, *args, **options):
+        with open(options['path'], encoding='utf-8-sig', newline='') as lines:
+            try:
+                created = import_grades(lines, batch_size=options['batch_size'], dry_run=options['dry_run'])
+            except ImportFailed as failure:
+                for line, message in failure.errors:
+                    self.stderr.write(f"line {line}: {message}")
+                raise CommandError(f"Nothing imported: {failure}.")
+        action = "validated" if options['dry_run'] else "imported"
+        self.stdout.write(self.style.SUCCESS(f"{created} grade(s) {action}."))
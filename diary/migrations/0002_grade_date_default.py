@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diary', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='grade',
+            name='date',
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+    ]
@@ -1,3 +1,214 @@
+import datetime
+import io
+import zipfile
+
+from authentification.models import CustomUser
+from GroupPortal.testing import QueryBudgetMixin, make_user, seed_diary
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
 
-# Create your tests here.
+from diary.exports import csv_stream, grade_rows, xlsx_stream
+from diary.gradebook import Gradebook
+from diary.imports import ImportFailed, import_grades
+from diary.models import Student, Subject, Grade
+
+
+class GradebookTests(TestCase):
+    def setUp(self):
+        self.ann = Student.objects.create(first_name='Ann', last_name='A')
+        self.bob = Student.objects.create(first_name='Bob', last_name='B')
+        self.idle = Student.objects.create(first_name='Idle', last_name='I')
+        self.math = Subject.objects.create(name='Math')
+        self.art = Subject.objects.create(name='Art')
+        for student, subject, grade in [
+            (self.ann, self.math, 10), (self.ann, self.math, 12), (self.ann, self.art, 7),
+            (self.bob, self.math, 9), (self.bob, self.art, 9),
+        ]:
+            Grade.objects.create(student=student, subject=subject, grade=grade)
+
+    def test_matrix(self):
+        gradebook = Gradebook.load()
+        self.assertEqual(gradebook.shape, (3, 2))
+        self.assertEqual(gradebook.counts().tolist(), [[2, 1], [1, 1], [0, 0]])
+        self.assertEqual(gradebook.means()[0].tolist(), [11.0, 7.0])
+
+    def test_student_and_subject_stats(self):
+        gradebook = Gradebook.load()
+        students = gradebook.by_student().as_dict()
+        self.assertEqual(students[self.ann.id], {
+            'count': 3, 'mean': 9.67, 'median': 10.0, 'distribution': {7: 1, 10: 1, 12: 1},
+        })
+        self.assertEqual(students[self.idle.id], {'count': 0, 'mean': None, 'median': None, 'distribution': {}})
+        subjects = gradebook.by_subject().as_dict()
+        self.assertEqual(subjects[self.math.id]['median'], 10.0)
+        self.assertEqual(subjects[self.art.id]['distribution'], {7: 1, 9: 1})
+
+    def test_date_range(self):
+        Grade.objects.filter(grade=12).update(date=datetime.date(2020, 1, 1))
+        recent = Gradebook.load().between(date_from=datetime.date(2021, 1, 1))
+        self.assertEqual(len(recent), 4)
+        self.assertEqual(Gradebook.load(date_to=datetime.date(2020, 12, 31)).grades.tolist(), [12])
+
+    def test_cell_grades(self):
+        cells = Gradebook.load().cell_grades()
+        self.assertEqual([g['grade'] for g in cells[f'{self.ann.id}_{self.math.id}']], [10, 12])
+        self.assertNotIn(f'{self.idle.id}_{self.math.id}', cells)
+
+    def test_diary_view(self):
+        with self.assertNumQueries(3):
+            response = self.client.get('/diary/')
+        self.assertEqual(list(response.context['pages']), [1])
+        # Math: 10, 12, 9.
+        self.assertEqual(response.context['subject_means'], [10.33, 8.0])
+
+    def test_grades_api(self):
+        response = self.client.get('/diary/grades/', {'per_page': 2})
+        data = response.json()
+        self.assertEqual(data['pages'], 2)
+        self.assertEqual(data['students']['id'], [self.ann.id, self.bob.id])
+        self.assertEqual(data['students']['mean'], [9.67, 9.0])
+        self.assertEqual(len(data['grades']['id']), 5)
+        self.assertEqual(data['grades']['grade'][:3], [10, 12, 7])
+
+        data = self.client.get('/diary/grades/', {'per_page': 2, 'page': 2, 'subjects': self.math.id}).json()
+        self.assertEqual(data['students']['id'], [self.idle.id])
+        self.assertEqual(data['subjects'], [self.math.id])
+        self.assertEqual(data['grades']['id'], [])
+
+    def test_grades_api_filters_dates(self):
+        Grade.objects.filter(grade=12).update(date=datetime.date(2020, 1, 1))
+        data = self.client.get('/diary/grades/', {'date_to': '2020-12-31'}).json()
+        self.assertEqual(data['grades']['grade'], [12])
+        self.assertEqual(data['grades']['date'], ['2020-01-01'])
+
+    def test_grades_api_conditional(self):
+        response = self.client.get('/diary/grades/')
+        etag = response.headers['ETag']
+        self.assertEqual(self.client.get('/diary/grades/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(
+            self.client.get('/diary/grades/', HTTP_IF_MODIFIED_SINCE=response.headers['Last-Modified']).status_code,
+            304,
+        )
+
+        Grade.objects.filter(grade=7).delete()
+        self.assertEqual(self.client.get('/diary/grades/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_grades_api_conditional_on_students_and_subjects(self):
+        def etag():
+            return self.client.get('/diary/grades/').headers['ETag']
+
+        before = etag()
+        student = Student.objects.first()
+        student.last_name = 'Renamed'
+        student.save()
+        renamed = etag()
+        self.assertNotEqual(renamed, before)
+        self.assertEqual(self.client.get('/diary/grades/', HTTP_IF_NONE_MATCH=before).status_code, 200)
+
+        Subject.objects.create(name='History')
+        added = etag()
+        self.assertNotEqual(added, renamed)
+
+        Subject.objects.get(name='History').delete()
+        self.assertNotEqual(etag(), added)
+
+    def test_grades_api_rejects_bad_filters(self):
+        self.assertEqual(self.client.get('/diary/grades/', {'page': 'x'}).status_code, 400)
+
+
+class GradeTransferTests(TestCase):
+    def setUp(self):
+        self.ann = Student.objects.create(first_name='Ann', last_name='A')
+        self.math = Subject.objects.create(name='Math')
+        Grade.objects.create(student=self.ann, subject=self.math, grade=10, date=datetime.date(2024, 9, 2))
+        self.admin = CustomUser.objects.create_user("admin@example.com", "admin", "pw", is_staff=True)
+
+    def test_csv_export_streams(self):
+        self.client.force_login(self.admin)
+        response = self.client.get('/export-grades/')
+        self.assertTrue(response.streaming)
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(body.splitlines(), ['student,subject,grade,date', 'Ann A,Math,10,2024-09-02'])
+
+    def test_csv_export_defuses_formulas(self):
+        student = Student.objects.create(first_name='=1+1', last_name='B')
+        subject = Subject.objects.create(name='@SUM(A1)')
+        Grade.objects.create(student=student, subject=subject, grade=9, date=datetime.date(2024, 9, 3))
+        lines = ''.join(csv_stream(grade_rows())).splitlines()
+        self.assertIn("'=1+1 B,'@SUM(A1),9,2024-09-03", lines)
+        self.assertIn('Ann A,Math,10,2024-09-02', lines)
+
+    def test_export_filters(self):
+        rows = list(grade_rows(date_from=datetime.date(2025, 1, 1)))
+        self.assertEqual(rows, [])
+        self.assertEqual(len(list(grade_rows(students=[self.ann.id], subject=self.math.id))), 1)
+
+    def test_xlsx_export(self):
+        data = b''.join(xlsx_stream(grade_rows(), flush_every=1))
+        with zipfile.ZipFile(io.BytesIO(data)) as workbook:
+            sheet = workbook.read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('<t>Ann A</t>', sheet)
+        self.assertIn('<c><v>10</v></c>', sheet)
+
+    def test_export_requires_admin(self):
+        response = self.client.get('/export-grades/')
+        self.assertEqual(response.status_code, 302)
+
+    def test_import(self):
+        lines = io.StringIO("student,subject,grade,date\nann a,MATH,8,2023-05-01\nAnn A,Math,9,\n")
+        # Two name lookups, then one INSERT for the batch inside a savepoint.
+        with self.assertNumQueries(5):
+            self.assertEqual(import_grades(lines), 2)
+        self.assertEqual(Grade.objects.filter(date=datetime.date(2023, 5, 1)).count(), 1)
+        self.assertEqual(Grade.objects.count(), 3)
+
+    def test_import_rolls_back_on_errors(self):
+        lines = io.StringIO("student,subject,grade\nAnn A,Math,8\nNobody,Math,x\n")
+        with self.assertRaises(ImportFailed) as failure:
+            import_grades(lines, batch_size=1)
+        self.assertEqual(failure.exception.errors[0][0], 3)
+        self.assertEqual(Grade.objects.count(), 1)
+
+    def test_import_view(self):
+        self.client.force_login(self.admin)
+        upload = SimpleUploadedFile('grades.csv', b'student,subject,grade\nAnn A,Math,11\n')
+        response = self.client.post('/import-grades/', {'file': upload})
+        self.assertEqual(response.context['created'], 1)
+        self.assertEqual(Grade.objects.count(), 2)
+
+
+class ViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_diary(students=40, subjects=8)
+
+    def setUp(self):
+        self.client.force_login(make_user(is_staff=True))
+
+    def assertPageBudget(self, url, limit):
+        with self.subTest(url=url):
+            with self.assertMaxQueries(limit):
+                response = self.client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.assertEqual(response.status_code, 200)
+
+    def test_grid(self):
+        self.assertPageBudget('/diary/', 5)
+        self.assertPageBudget('/diary/grades/?per_page=20', 5)
+        self.assertPageBudget('/diary/grades/?per_page=20&page=2&date_from=2020-01-01', 5)
+
+    def test_forms(self):
+        student, subject = self.data['students'][0], self.data['subjects'][0]
+        grade = Grade.objects.first()
+        self.assertPageBudget('/add-student/', 2)
+        self.assertPageBudget(f'/edit-student/{student.id}/', 3)
+        self.assertPageBudget('/add-subject/', 2)
+        self.assertPageBudget(f'/edit-subject/{subject.id}/', 3)
+        self.assertPageBudget('/add-grade/', 4)
+        self.assertPageBudget(f'/edit-grade/{grade.id}/', 5)
+
+    def test_transfer(self):
+        self.assertPageBudget('/export-grades/', 3)
+        self.assertPageBudget('/export-grades/?format=xlsx', 3)
+        self.assertPageBudget('/import-grades/', 2)
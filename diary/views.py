@@ -1,9 +1,21 @@
+import hashlib
+import io
+
+from django.core.paginator import Paginator
+from django.db.models import Avg, Count, Max, Value
+from django.http import JsonResponse, StreamingHttpResponse, HttpResponseBadRequest
 from django.shortcuts import render, redirect, get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_GET
 from diary.models import Student, Subject, Grade
-from diary.forms import StudentForm, SubjectForm, GradeForm
-from django.core.serializers.json import DjangoJSONEncoder
+from diary.forms import StudentForm, SubjectForm, GradeForm, GradeExportForm, GradeImportForm, DiaryFilterForm
+from diary.gradebook import Gradebook
+from diary.exports import FORMATS, grade_rows
+from diary.imports import ImportFailed, import_grades
 from django.contrib.auth.decorators import user_passes_test
-import json
+
+STUDENTS_PER_PAGE = 50
 
 
 # Create your views here.
@@ -14,31 +26,125 @@ def is_admin(user):
 
 def diary_view(request):
     """
-    Diary view function to render the diary page.
+    Diary view function to render the diary page. Only the grid's frame and
+    the subject averages are rendered here; rows are fetched from
+    ``diary_grades`` one block of students at a time as they scroll into view.
     """
-    students = Student.objects.all()
-    subjects = Subject.objects.all()
-    grades = Grade.objects.all()
-
-    grade_dict = {}
-    for grade in grades:
-        key = f"{grade.student.id}_{grade.subject.id}"
-        if key not in grade_dict:
-            grade_dict[key] = []
-        grade_dict[key].append({
-            'id': grade.id,
-            'grade': grade.grade,
-        })
+    form = DiaryFilterForm(request.GET)
+    filters = form.cleaned_data if form.is_valid() else {}
+    subjects = list(Subject.objects.order_by('id'))
+    if filters.get('subjects'):
+        subjects = [subject for subject in subjects if subject in filters['subjects']]
+    per_page = filters.get('per_page') or STUDENTS_PER_PAGE
+    pages = -(-Student.objects.count() // per_page)
 
+    means = dict(
+        _filter_grades(Grade.objects.all(), filters)
+        .order_by()
+        .values('subject_id')
+        .annotate(mean=Avg('grade'))
+        .values_list('subject_id', 'mean')
+    )
     context = {
-        'students': students,
         'subjects': subjects,
-        'grade_dict_json': json.dumps(grade_dict, cls=DjangoJSONEncoder),
+        'subject_means': [_round(means.get(subject.id)) for subject in subjects],
+        'pages': range(1, pages + 1),
+        'per_page': per_page,
     }
 
     return render(request, 'diary/diary.html', context)
 
 
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+def _filter_grades(grades, filters):
+    if filters.get('subjects'):
+        grades = grades.filter(subject__in=filters['subjects'])
+    if filters.get('date_from'):
+        grades = grades.filter(date__gte=filters['date_from'])
+    if filters.get('date_to'):
+        grades = grades.filter(date__lte=filters['date_to'])
+    return grades
+
+
+@require_GET
+def diary_grades(request):
+    """
+    One block of diary rows as JSON: the page's students, each of their
+    grades as parallel columns and per-student averages. Answers 304 when
+    no grade, student or subject changed since the client's copy (ETag /
+    Last-Modified).
+    """
+    form = DiaryFilterForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    filters = form.cleaned_data
+
+    counts, changed = _diary_version()
+    etag = quote_etag(hashlib.md5(f"{counts}:{changed}:{request.GET.urlencode()}".encode()).hexdigest())
+    response = get_conditional_response(request, etag=etag, last_modified=int(changed))
+    if response is None:
+        response = JsonResponse(_diary_page(filters))
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(changed)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _diary_version():
+    """
+    Row counts and the newest change across grades, students and subjects,
+    all of which end up in a ``diary_grades`` payload. Deletions do not move
+    the newest timestamp but do change the count, so both are returned.
+    """
+    def version(model):
+        return (
+            model.objects.order_by()
+            .annotate(model=Value(model._meta.model_name))
+            .values('model')
+            .annotate(count=Count('id'), changed=Max('updated_at'))
+            .values_list('model', 'count', 'changed')
+        )
+
+    rows = sorted(version(Grade).union(version(Student), version(Subject), all=True))
+    counts = ':'.join(str(count) for _, count, _ in rows)
+    changed = max((changed.timestamp() for _, _, changed in rows if changed), default=0)
+    return counts, changed
+
+
+def _diary_page(filters):
+    students = Paginator(
+        Student.objects.order_by('id').values_list('id', 'first_name', 'last_name'),
+        filters['per_page'] or STUDENTS_PER_PAGE,
+    )
+    page = students.get_page(filters['page'])
+    student_ids = [student_id for student_id, _, _ in page]
+    if filters['subjects']:
+        subject_ids = sorted(subject.id for subject in filters['subjects'])
+    else:
+        subject_ids = list(Subject.objects.values_list('id', flat=True))
+
+    gradebook = Gradebook.load(
+        grades=_filter_grades(Grade.objects.filter(student_id__in=student_ids), filters),
+        student_ids=student_ids,
+        subject_ids=subject_ids,
+    )
+    stats = gradebook.by_student().as_dict()
+    return {
+        'page': page.number,
+        'pages': students.num_pages,
+        'subjects': subject_ids,
+        'students': {
+            'id': student_ids,
+            'name': [f"{first_name} {last_name}" for _, first_name, last_name in page],
+            'mean': [stats[student_id]['mean'] for student_id in student_ids],
+        },
+        'grades': gradebook.columns(),
+    }
+
+
 @user_passes_test(is_admin)
 def add_student(request):
     if request.method == "POST":
@@ -112,3 +218,44 @@ def edit_grade(request, grade_id):
     else:
         form = GradeForm(instance=grade)
     return render(request, 'diary/grade.html', {'form': form})
+
+
+@user_passes_test(is_admin)
+def export_grades(request):
+    """
+    Stream the selected grades as CSV (default) or XLSX without building
+    the file in memory.
+    """
+    form = GradeExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+    filters = form.cleaned_data
+    stream, content_type, filename = FORMATS[filters['format'] or 'csv']
+    rows = grade_rows(
+        students=[student.id for student in filters['students']],
+        subject=filters['subject'],
+        date_from=filters['date_from'],
+        date_to=filters['date_to'],
+    )
+    response = StreamingHttpResponse(stream(rows), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@user_passes_test(is_admin)
+def import_grades_view(request):
+    created = None
+    errors = []
+    if request.method == "POST":
+        form = GradeImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            lines = io.TextIOWrapper(form.cleaned_data['file'], encoding='utf-8-sig', newline='')
+            try:
+                created = import_grades(lines)
+            except ImportFailed as failure:
+                errors = failure.errors
+            except UnicodeDecodeError:
+                errors = [(0, "The file is not UTF-8 encoded.")]
+    else:
+        form = GradeImportForm()
+    return render(request, 'diary/import_grades.html', {'form': form, 'created': created, 'errors': errors})
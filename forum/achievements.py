@@ -0,0 +1,325 @@
+"""
+Achievements awarded by rules written in ``Achievement.criteria``:
+
+    comments >= 100
+    upvotes >= 50 and threads >= 5
+    threads in category "Django" >= 3
+
+A rule is one or more ``metric [in category NAME] >= N`` clauses joined by
+``and`` or commas, all of which must hold. Metrics are the per-user
+counters kept for the dashboard (threads, comments, polls, upvotes,
+downvotes, votes, score) plus threads per category.
+
+Parsed rules are cached until an achievement or category changes, and at
+most ``RULES_TIMEOUT`` seconds in case an invalidation is missed. When a
+write moves a counter, only the rules with a clause whose threshold that
+move just crossed are checked, against the counters the move returned, so
+most writes cost no query at all and history is never re-scanned. Awards
+are inserted in bulk with conflicts ignored, and the points of the ones
+that were new are added to reputation. ``backfill`` evaluates every user
+from the stored counters in chunks, over a process pool if asked.
+"""
+import re
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.cache import cache
+from django.db import connection
+from django.utils.timezone import now
+
+from forum import reputation
+from forum.models import Achievement, Category, UserAchievement, UserCategoryStats, UserStats
+
+RULES_KEY = 'forum:achievement-rules'
+RULES_TIMEOUT = 5 * 60
+
+METRICS = {
+    'threads': 'threads',
+    'comments': 'comments',
+    'polls': 'polls',
+    'upvotes': 'upvotes_received',
+    'upvotes received': 'upvotes_received',
+    'downvotes': 'downvotes_received',
+    'downvotes received': 'downvotes_received',
+    'votes': 'votes_received',
+    'votes received': 'votes_received',
+    'score': 'score',
+}
+COUNTERS = ('threads', 'comments', 'polls', 'upvotes_received', 'downvotes_received')
+
+_CLAUSE = re.compile(
+    r"""\s*(?P<metric>[a-z][a-z_ ]*?)
+    (?:\s+in\s+category\s+(?P<category>"[^"]+"|'[^']+'|[^\s"'>=≥,]+))?
+    \s*(?:>=|≥)\s*(?P<threshold>\d+)\s*
+    (?P<separator>,|\band\b|$)""",
+    re.IGNORECASE | re.VERBOSE,
+)
+
+Predicate = namedtuple('Predicate', 'metric threshold category')
+Rule = namedtuple('Rule', 'achievement_id clauses points', defaults=(0,))
+
+
+class InvalidCriteria(ValueError):
+    pass
+
+
+# ----- Parsing -----
+
+def _metric(name):
+    name = re.sub(r'[\s_]+', ' ', name.strip().lower())
+    name = re.sub(r' count$', '', name)
+    for candidate in (name, f'{name}s'):
+        if candidate in METRICS:
+            return METRICS[candidate]
+    raise InvalidCriteria(f"Unknown metric {name!r}; use one of: {', '.join(sorted(set(METRICS)))}.")
+
+
+def parse(criteria):
+    """
+    The predicates of ``criteria``, all of which must hold. Raises
+    InvalidCriteria for anything else.
+    """
+    predicates, position, text = [], 0, criteria.strip()
+    while position < len(text):
+        match = _CLAUSE.match(text, position)
+        if match is None or (not match['separator'] and match.end() < len(text)):
+            raise InvalidCriteria(f"Cannot read the rule from {text[position:]!r}.")
+        metric = _metric(match['metric'])
+        category = match['category']
+        if category:
+            if metric != 'threads':
+                raise InvalidCriteria("Only threads can be counted per category.")
+            category = category.strip('"\'')
+        predicates.append(Predicate(metric, int(match['threshold']), category))
+        position = match.end()
+    if not predicates:
+        raise InvalidCriteria("The rule is empty.")
+    return predicates
+
+
+def _key(predicate, category_ids):
+    # Counter keys: a metric name, or (metric, category id).
+    return (predicate.metric, category_ids[predicate.category]) if predicate.category else predicate.metric
+
+
+def load_rules():
+    """
+    Every achievement whose criteria parse and whose categories exist, as
+    Rules of ``(counter key, threshold)`` clauses with the points they are
+    worth. Criteria written before there were rules are skipped.
+    """
+    parsed = []
+    for achievement_id, criteria, points in Achievement.objects.order_by('pk').values_list('pk', 'criteria', 'points'):
+        try:
+            parsed.append((achievement_id, parse(criteria), points))
+        except InvalidCriteria:
+            continue
+    names = {predicate.category for _, predicates, _ in parsed for predicate in predicates if predicate.category}
+    category_ids = dict(Category.objects.filter(name__in=names).values_list('name', 'pk')) if names else {}
+    return [
+        Rule(
+            achievement_id,
+            tuple((_key(predicate, category_ids), predicate.threshold) for predicate in predicates),
+            points,
+        )
+        for achievement_id, predicates, points in parsed
+        if all(predicate.category in category_ids for predicate in predicates if predicate.category)
+    ]
+
+
+def rules():
+    cached = cache.get(RULES_KEY)
+    if cached is None:
+        cached = load_rules()
+        cache.set(RULES_KEY, cached, RULES_TIMEOUT)
+    return cached
+
+
+def invalidate_rules():
+    cache.delete(RULES_KEY)
+
+
+# ----- Evaluation -----
+
+def values_of(stats):
+    """
+    Counter values, derived metrics included, from a ``UserStats`` row or
+    the dict ``forum.dashboard.adjust`` returns.
+    """
+    if not isinstance(stats, dict):
+        stats = {name: getattr(stats, name) for name in COUNTERS}
+    values = {name: stats[name] for name in COUNTERS}
+    values['votes_received'] = values['upvotes_received'] + values['downvotes_received']
+    values['score'] = values['upvotes_received'] - values['downvotes_received']
+    return values
+
+
+def satisfied(rule, values):
+    return all(values.get(key, 0) >= threshold for key, threshold in rule.clauses)
+
+
+def evaluate(job):
+    """
+    ``(user_id, achievement_id)`` for every rule a user satisfies, over a
+    ``(rules, [(user_id, values), ...])`` job. Pure, for process pools.
+    """
+    rule_list, users = job
+    return [
+        (user_id, rule.achievement_id)
+        for user_id, values in users for rule in rule_list if satisfied(rule, values)
+    ]
+
+
+def award(pairs, rule_list, batch_size=500):
+    """
+    Insert ``(user_id, achievement_id)`` awards; ones already held are
+    ignored by the database, and ones for achievements deleted since the
+    rules were loaded are dropped. The points of the awards that were new,
+    as priced in ``rule_list``, go to the users' reputation. Returns those.
+    """
+    if not pairs:
+        return []
+    live = set(Achievement.objects.filter(pk__in={pk for _, pk in pairs}).values_list('pk', flat=True))
+    pairs = [pair for pair in pairs if pair[1] in live]
+    points = {rule.achievement_id: rule.points for rule in rule_list}
+    table = connection.ops.quote_name(UserAchievement._meta.db_table)
+    earned_at = connection.ops.adapt_datetimefield_value(now())
+    inserted = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, achievement_id, earned_at) "
+                f"VALUES {', '.join(['(%s, %s, %s)'] * len(batch))} "
+                f"ON CONFLICT (user_id, achievement_id) DO NOTHING RETURNING user_id, achievement_id",
+                [param for user_id, achievement_id in batch for param in (user_id, achievement_id, earned_at)],
+            )
+            inserted += cursor.fetchall()
+    gained = {}
+    for user_id, achievement_id in inserted:
+        gained[user_id] = gained.get(user_id, 0) + points.get(achievement_id, 0)
+    reputation.add_points(gained)
+    return inserted
+
+
+def check(user_id, values, changed):
+    """
+    Award what ``user_id`` just earned. ``values`` are counters after a
+    move (any subset), ``changed`` their deltas. Only rules with a clause
+    whose threshold the move crossed are evaluated; counters they need
+    that the move did not return are read with at most two queries.
+    """
+    increased = {key: delta for key, delta in changed.items() if delta > 0}
+    if user_id is None or not increased:
+        return []
+    candidates = [
+        rule for rule in rules()
+        if any(
+            key in increased and values[key] - increased[key] < threshold <= values[key]
+            for key, threshold in rule.clauses
+        )
+    ]
+    if not candidates:
+        return []
+
+    missing = {key for rule in candidates for key, _ in rule.clauses if key not in values}
+    values = dict(values)
+    if any(isinstance(key, str) for key in missing):
+        stats = UserStats.objects.filter(user_id=user_id).first()
+        values = {**(values_of(stats) if stats else {}), **values}
+    categories = [key[1] for key in missing if isinstance(key, tuple)]
+    if categories:
+        values.update(
+            (('threads', category_id), threads)
+            for category_id, threads in UserCategoryStats.objects.filter(
+                user_id=user_id, category_id__in=categories,
+            ).values_list('category_id', 'threads')
+        )
+    earned = [(user_id, rule.achievement_id) for rule in candidates if satisfied(rule, values)]
+    return award(earned, candidates)
+
+
+def counters_moved(stats, deltas):
+    """
+    ``check`` after ``forum.dashboard.adjust`` moved ``stats`` by ``deltas``.
+    """
+    if stats is None:
+        return []
+    changed = dict(deltas)
+    up, down = deltas.get('upvotes_received', 0), deltas.get('downvotes_received', 0)
+    if up or down:
+        changed['votes_received'], changed['score'] = up + down, up - down
+    return check(stats['user_id'], values_of(stats), changed)
+
+
+def adjust_category(user_id, category_id, delta):
+    """
+    Move the user's thread count in one category, never below zero, and
+    award what that earned. One upsert.
+    """
+    if user_id is None or category_id is None or not delta:
+        return []
+    table = connection.ops.quote_name(UserCategoryStats._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (user_id, category_id, threads) VALUES (%s, %s, %s) "
+            f"ON CONFLICT (user_id, category_id) DO UPDATE SET "
+            f"threads = CASE WHEN {table}.threads + %s > 0 THEN {table}.threads + %s ELSE 0 END "
+            f"RETURNING threads",
+            [user_id, category_id, max(delta, 0), delta, delta],
+        )
+        threads = cursor.fetchone()[0]
+    key = ('threads', category_id)
+    return check(user_id, {key: threads}, {key: delta})
+
+
+# ----- Backfill -----
+
+def user_values(chunk_size=2000):
+    """
+    Chunks of ``(user_id, values)`` for every user with stats, read from
+    the counters with two queries per chunk.
+    """
+    last = 0
+    while True:
+        chunk = list(UserStats.objects.filter(user_id__gt=last).order_by('user_id')[:chunk_size])
+        if not chunk:
+            return
+        users = {stats.user_id: values_of(stats) for stats in chunk}
+        for user_id, category_id, threads in UserCategoryStats.objects.filter(
+            user_id__gte=chunk[0].user_id, user_id__lte=chunk[-1].user_id,
+        ).values_list('user_id', 'category_id', 'threads'):
+            users[user_id][('threads', category_id)] = threads
+        yield list(users.items())
+        last = chunk[-1].user_id
+
+
+def backfill(achievement_ids=None, chunk_size=2000, workers=1):
+    """
+    Award every rule (or just those of ``achievement_ids``) to every user
+    who satisfies it. Chunks are evaluated in a pool of ``workers``
+    processes, at most two per worker in flight. Returns ``(users, rules)``
+    evaluated.
+    """
+    rule_list = [rule for rule in load_rules() if achievement_ids is None or rule.achievement_id in achievement_ids]
+    users = 0
+    if not rule_list:
+        return users, 0
+    if workers <= 1:
+        for chunk in user_values(chunk_size):
+            users += len(chunk)
+            award(evaluate((rule_list, chunk)), rule_list)
+        return users, len(rule_list)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for chunk in user_values(chunk_size):
+            users += len(chunk)
+            pending.add(pool.submit(evaluate, (rule_list, chunk)))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    award(future.result(), rule_list)
+        for future in pending:
+            award(future.result(), rule_list)
+    return users, len(rule_list)
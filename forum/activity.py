@@ -0,0 +1,271 @@
+"""
+The recent-activity feed: events appended by signals (``forum.signals``) and
+fanned out into one row per scope, so the global, category, forum and tag
+feeds are each one indexed range read.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils.timezone import now
+
+from forum.models import ActivityEvent, Forum, Thread, Comment, Poll
+
+FEED_DAYS = 7
+SUMMARY_LENGTH = 300
+
+_FIELDS = ('kind', 'verb', 'object_id', 'thread_id', 'actor_id', 'category_id', 'title', 'summary', 'created_at')
+
+
+# ----- Events -----
+
+def thread_event(thread, verb, at=None):
+    return ActivityEvent(
+        kind='thread', verb=verb, object_id=thread.pk, thread_id=thread.pk, actor_id=thread.author_id,
+        category_id=thread.category_id, title=thread.title, summary=thread.description[:SUMMARY_LENGTH],
+        created_at=at or thread.created_at,
+    )
+
+
+def comment_event(comment, thread, verb, at=None):
+    return ActivityEvent(
+        kind='comment', verb=verb, object_id=comment.pk, thread_id=comment.thread_id, actor_id=comment.author_id,
+        category_id=thread.category_id, title=thread.title, summary=comment.content[:SUMMARY_LENGTH],
+        created_at=at or comment.created_at,
+    )
+
+
+def poll_event(poll, thread, verb, at=None):
+    return ActivityEvent(
+        kind='poll', verb=verb, object_id=poll.pk, thread_id=poll.thread_id, actor_id=thread.author_id,
+        category_id=thread.category_id, title=poll.question, created_at=at or poll.created_at,
+    )
+
+
+def _scoped(event, **scope):
+    return ActivityEvent(**{field: getattr(event, field) for field in _FIELDS}, **scope)
+
+
+def fan_out(events, forums_by_category, tags_by_thread):
+    """
+    The global rows ``events`` plus their copies for every forum of their
+    category and every tag of their thread.
+    """
+    rows = []
+    for event in events:
+        rows.append(event)
+        rows.extend(_scoped(event, forum_id=forum_id) for forum_id in forums_by_category.get(event.category_id, ()))
+        rows.extend(_scoped(event, tag_id=tag_id) for tag_id in tags_by_thread.get(event.thread_id, ()))
+    return rows
+
+
+def forums_by_category(category_ids=None):
+    """
+    ``{category id: [forum id, ...]}`` for ``category_ids``, or for every
+    category when None.
+    """
+    mapping = {}
+    links = Forum.categories.through.objects.all()
+    if category_ids is not None:
+        links = links.filter(category_id__in=[pk for pk in category_ids if pk])
+    for category_id, forum_id in links.values_list('category_id', 'forum_id'):
+        mapping.setdefault(category_id, []).append(forum_id)
+    return mapping
+
+
+def tags_by_thread(thread_ids):
+    mapping = {}
+    for thread_id, tag_id in Thread.tags.through.objects.filter(thread_id__in=thread_ids).values_list('thread_id', 'tag_id'):
+        mapping.setdefault(thread_id, []).append(tag_id)
+    return mapping
+
+
+def save_events(events):
+    events = list(events)
+    if not events:
+        return []
+    rows = fan_out(
+        events,
+        forums_by_category({event.category_id for event in events}),
+        tags_by_thread({event.thread_id for event in events}),
+    )
+    ActivityEvent.objects.bulk_create(rows, batch_size=500)
+    return rows
+
+
+def remove_events(kind, object_ids):
+    ActivityEvent.objects.filter(kind=kind, object_id__in=object_ids).delete()
+
+
+# ----- Signal handlers (run on commit) -----
+
+def record(kind, verb, instance):
+    """
+    Append the ``verb`` event for ``instance``. Deleting purges the object's
+    earlier events (for a thread, everything that happened in it) so gone
+    content leaves the feed, and leaves a single "deleted" entry behind.
+    """
+    thread = instance if kind == 'thread' else (
+        Thread.objects.filter(pk=instance.thread_id).only('title', 'author_id', 'category_id').first()
+    )
+    if thread is None:
+        # Removed along with its thread; the events went with it.
+        return
+    at = None if verb == 'created' else now()
+    if verb == 'deleted':
+        stale = ActivityEvent.objects.filter(thread_id=thread.pk) if kind == 'thread' else (
+            ActivityEvent.objects.filter(kind=kind, object_id=instance.pk)
+        )
+        if not stale.exclude(verb='deleted').exists():
+            return
+        stale.delete()
+
+    if kind == 'thread':
+        event = thread_event(thread, verb, at)
+    elif kind == 'comment':
+        event = comment_event(instance, thread, verb, at)
+    else:
+        event = poll_event(instance, thread, verb, at)
+    if verb == 'deleted':
+        event.summary = ''
+    save_events([event])
+
+
+def rescope_thread(thread, moved):
+    """
+    Bring the events of ``thread`` in line with its new title and, when
+    ``moved`` to another category, rebuild their forum copies. Tag copies
+    follow the category in place.
+    """
+    events = ActivityEvent.objects.filter(thread_id=thread.pk)
+    events.exclude(kind='poll').exclude(title=thread.title).update(title=thread.title)
+    if not moved:
+        return
+    events.exclude(category_id=thread.category_id).update(category_id=thread.category_id)
+    events.filter(forum__isnull=False).delete()
+    forum_ids = forums_by_category([thread.category_id]).get(thread.category_id, ())
+    ActivityEvent.objects.bulk_create(
+        [_scoped(event, forum_id=forum_id) for event in _global_rows([thread.pk]) for forum_id in forum_ids],
+        batch_size=500,
+    )
+
+
+def add_tag_copies(thread_ids, tag_ids):
+    """
+    Give the events of ``thread_ids`` a copy in the feeds of ``tag_ids``,
+    replacing any they already have there.
+    """
+    remove_tag_copies(thread_ids, tag_ids)
+    ActivityEvent.objects.bulk_create(
+        [_scoped(event, tag_id=tag_id) for event in _global_rows(thread_ids) for tag_id in tag_ids],
+        batch_size=500,
+    )
+
+
+def remove_tag_copies(thread_ids=None, tag_ids=None):
+    """
+    Drop the tag-feed copies of the events of ``thread_ids`` (every thread
+    when None) from ``tag_ids`` (every tag when None).
+    """
+    copies = ActivityEvent.objects.filter(tag__isnull=False)
+    if thread_ids is not None:
+        copies = copies.filter(thread_id__in=thread_ids)
+    if tag_ids is not None:
+        copies = copies.filter(tag_id__in=tag_ids)
+    copies.delete()
+
+
+def _global_rows(thread_ids):
+    return ActivityEvent.objects.filter(thread_id__in=thread_ids, forum__isnull=True, tag__isnull=True)
+
+
+def refresh_forum(forum_id):
+    """
+    Rebuild one forum's feed from the global rows after its categories changed.
+    """
+    ActivityEvent.objects.filter(forum_id=forum_id).delete()
+    category_ids = Forum.categories.through.objects.filter(forum_id=forum_id).values('category_id')
+    base = ActivityEvent.objects.filter(forum__isnull=True, tag__isnull=True, category_id__in=category_ids)
+    ActivityEvent.objects.bulk_create(
+        (_scoped(event, forum_id=forum_id) for event in base.iterator(chunk_size=1000)), batch_size=500,
+    )
+
+
+# ----- Reading -----
+
+def feed(forum=None, category=None, tag=None, days=FEED_DAYS):
+    """
+    The events of the last ``days`` days for the given filters, newest
+    first, read from the narrowest scope: the tag rows, then the forum rows,
+    then the global rows. Further filters narrow that range by category.
+    """
+    events = ActivityEvent.objects.filter(created_at__gte=now() - timedelta(days=days))
+    if tag:
+        events = events.filter(tag_id=tag)
+        if forum:
+            events = events.filter(
+                category_id__in=Forum.categories.through.objects.filter(forum_id=forum).values('category_id')
+            )
+    elif forum:
+        events = events.filter(forum_id=forum)
+    else:
+        events = events.filter(forum__isnull=True, tag__isnull=True)
+    if category:
+        events = events.filter(category_id=category)
+    return events.select_related('actor')
+
+
+# ----- Maintenance -----
+
+def backfill(since, chunk_size=1000):
+    """
+    Write the "created" events of live content created since ``since``,
+    replacing any the objects already have, in chunks. Yields
+    ``(kind, count)`` after each chunk.
+    """
+    forums = forums_by_category()
+    sources = (
+        ('thread', Thread.objects.filter(is_deleted=False, created_at__gte=since),
+         lambda thread: thread_event(thread, 'created')),
+        ('comment', Comment.objects.filter(is_deleted=False, thread__is_deleted=False, created_at__gte=since)
+         .select_related('thread'), lambda comment: comment_event(comment, comment.thread, 'created')),
+        ('poll', Poll.objects.filter(thread__is_deleted=False, created_at__gte=since).select_related('thread'),
+         lambda poll: poll_event(poll, poll.thread, 'created')),
+    )
+    for kind, queryset, build in sources:
+        for chunk in _chunks(queryset.order_by('pk').iterator(chunk_size=chunk_size), chunk_size):
+            events = [build(obj) for obj in chunk]
+            ActivityEvent.objects.filter(kind=kind, verb='created', object_id__in=[obj.pk for obj in chunk]).delete()
+            ActivityEvent.objects.bulk_create(
+                fan_out(events, forums, tags_by_thread({event.thread_id for event in events})), batch_size=500,
+            )
+            yield kind, len(chunk)
+
+
+def retention_cutoff(days=None):
+    if days is None:
+        days = getattr(settings, 'FORUM_ACTIVITY_RETENTION_DAYS', 30)
+    return now() - timedelta(days=days)
+
+
+def prune(before, batch_size=5000):
+    """
+    Delete events older than ``before`` in batches, so no single statement
+    holds locks on a large part of the table. Returns the number deleted.
+    """
+    deleted = 0
+    while True:
+        ids = list(ActivityEvent.objects.filter(created_at__lt=before).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += ActivityEvent.objects.filter(pk__in=ids).delete()[0]
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
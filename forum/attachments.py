@@ -0,0 +1,441 @@
+"""
+Attachment storage: uploads are streamed to a temporary file while their
+SHA-256 is computed, then stored once per content under
+``FORUM_ATTACHMENT_ROOT/ab/cd/<sha256>`` and shared by every thread and
+comment that attaches the same file. ``Blob.refcount`` tracks the sharers;
+``collect`` deletes blobs nobody has used for ``FORUM_ATTACHMENT_GRACE``
+seconds.
+
+Views that take attachments are wrapped in ``accepts_attachments``, which
+installs ``AttachmentUploadHandler`` for the request. The handler rejects a
+disallowed type from the first chunk and an oversized file as soon as it
+crosses the limit, so neither is ever written to disk in full.
+"""
+import hashlib
+import os
+import re
+import tempfile
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopFutureHandlers
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import content_disposition_header
+from django.utils.timezone import now
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+from forum.models import Blob, Comment, Thread
+
+FIELD_NAME = 'attachment'
+
+# Extension -> (content type, leading bytes the file must start with).
+FORMATS = {
+    'pdf': ('application/pdf', (b'%PDF-',)),
+    'jpg': ('image/jpeg', (b'\xff\xd8\xff',)),
+    'jpeg': ('image/jpeg', (b'\xff\xd8\xff',)),
+    'png': ('image/png', (b'\x89PNG\r\n\x1a\n',)),
+    'gif': ('image/gif', (b'GIF87a', b'GIF89a')),
+    'webp': ('image/webp', (b'RIFF',)),
+    'txt': ('text/plain', ()),
+    'doc': ('application/msword', (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1',)),
+    'docx': ('application/vnd.openxmlformats-officedocument.wordprocessingml.document', (b'PK\x03\x04',)),
+    'zip': ('application/zip', (b'PK\x03\x04',)),
+}
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+
+def root():
+    return os.fspath(getattr(settings, 'FORUM_ATTACHMENT_ROOT', os.path.join(settings.MEDIA_ROOT, 'blobs')))
+
+
+def max_size():
+    return getattr(settings, 'FORUM_ATTACHMENT_MAX_SIZE', 10 * 1024 * 1024)
+
+
+def allowed_types():
+    return getattr(settings, 'FORUM_ATTACHMENT_TYPES', ['pdf', 'jpg', 'jpeg', 'png', 'doc', 'docx'])
+
+
+def relative_path(sha256):
+    return os.path.join(sha256[:2], sha256[2:4], sha256)
+
+
+def blob_path(sha256):
+    return os.path.join(root(), relative_path(sha256))
+
+
+def extension(name):
+    return os.path.splitext(name)[1].lstrip('.').lower()
+
+
+# ----- Uploads -----
+
+class HashedUpload(UploadedFile):
+    """
+    An upload spooled to a temporary file next to the blob store (so storing
+    it is a rename), with its SHA-256 already computed.
+    """
+
+    def __init__(self, file, path, name, content_type, size, sha256, charset=None):
+        super().__init__(file, name, content_type, size, charset)
+        self.path = path
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.path
+
+    def close(self):
+        try:
+            return self.file.close()
+        finally:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                # Stored: the file was renamed into the blob store.
+                pass
+
+
+class AttachmentUploadHandler(FileUploadHandler):
+    """
+    Streams the ``attachment`` field to disk, hashing as it goes; other file
+    fields pass on to the next handlers. A rejected file is skipped and its
+    reason left for ``upload_error``.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.active = False
+        self.spool = None
+        self.path = None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.active = field_name == FIELD_NAME
+        if not self.active:
+            return
+        self.hash = hashlib.sha256()
+        self.size = 0
+        self.format = extension(file_name)
+        if self.format not in allowed_types() or self.format not in FORMATS:
+            self.reject(f"Files of type '{self.format or file_name}' cannot be attached.")
+        if content_length is not None and content_length > max_size():
+            self.reject(self.too_large())
+        os.makedirs(os.path.join(root(), 'tmp'), exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=os.path.join(root(), 'tmp'), suffix='.upload')
+        self.spool = os.fdopen(fd, 'w+b')
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        if start == 0:
+            signatures = FORMATS[self.format][1]
+            if signatures and not raw_data.startswith(signatures):
+                self.reject(f"The file does not look like a .{self.format} file.")
+        self.size += len(raw_data)
+        if self.size > max_size():
+            self.reject(self.too_large())
+        self.hash.update(raw_data)
+        self.spool.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        self.active = False
+        self.spool.flush()
+        self.spool.seek(0)
+        upload = HashedUpload(
+            self.spool, self.path, self.file_name, FORMATS[self.format][0], self.size,
+            self.hash.hexdigest(), self.charset,
+        )
+        self.spool = None
+        return upload
+
+    def upload_interrupted(self):
+        self.discard()
+
+    def too_large(self):
+        return f"Attachments are limited to {max_size() // (1024 * 1024)} MB."
+
+    def reject(self, message):
+        self.discard()
+        self.active = False
+        if self.request is not None:
+            self.request.attachment_error = message
+        raise SkipFile(message)
+
+    def discard(self):
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def accepts_attachments(view):
+    """
+    Run ``view`` with ``AttachmentUploadHandler`` installed. Handlers must be
+    in place before anything reads the request body, CSRF middleware
+    included, so the CSRF check moves inside.
+    """
+    protected = csrf_protect(view)
+
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        request.upload_handlers.insert(0, AttachmentUploadHandler(request))
+        return protected(request, *args, **kwargs)
+    return csrf_exempt(wrapped)
+
+
+def upload_error(request):
+    """
+    Why the request's attachment was rejected, or None. Reading it parses
+    the body, if nothing has yet.
+    """
+    request.FILES
+    return getattr(request, 'attachment_error', None)
+
+
+# ----- Blob store -----
+
+def _table():
+    return connection.ops.quote_name(Blob._meta.db_table)
+
+
+def store(upload):
+    """
+    Take one reference to the blob for ``upload``, storing the file if it is
+    new, and return the Blob. A reference taken for a post that then fails
+    to save is over-counted, which ``recount`` corrects; if the row rolls
+    back with an outer transaction, ``collect`` removes the file left behind.
+    """
+    with transaction.atomic():
+        table = _table()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (sha256, size, content_type, refcount, created_at) "
+                f"VALUES (%s, %s, %s, 1, %s) "
+                f"ON CONFLICT (sha256) DO UPDATE SET refcount = {table}.refcount + 1, released_at = NULL",
+                [upload.sha256, upload.size, upload.content_type, now()],
+            )
+        # The file is placed after the row is written, which waits for a
+        # concurrent collect() of the same blob to commit, so the collector
+        # can never unlink a file a new reference relies on.
+        path = blob_path(upload.sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.chmod(upload.temporary_file_path(), settings.FILE_UPLOAD_PERMISSIONS or 0o644)
+            os.replace(upload.temporary_file_path(), path)
+    return Blob(sha256=upload.sha256, size=upload.size, content_type=upload.content_type)
+
+
+def release(sha256):
+    """
+    Drop one reference to a blob. The file stays until ``collect``.
+    """
+    if sha256:
+        Blob.objects.filter(pk=sha256, refcount__gt=0).update(
+            refcount=F('refcount') - 1,
+            released_at=Case(When(refcount=1, then=Value(now())), default=F('released_at')),
+        )
+
+
+def attach(obj, upload):
+    """
+    Point ``obj`` (a thread or comment, saved afterwards by the caller) at
+    the blob of ``upload``, releasing the one it had.
+    """
+    previous = obj.attachment_id
+    obj.attachment = store(upload)
+    obj.attachment_name = os.path.basename(upload.name)[:255]
+    if previous and previous != obj.attachment_id:
+        release(previous)
+
+
+def _references(model):
+    return Coalesce(Subquery(
+        model.objects.filter(attachment=OuterRef('pk')).order_by()
+        .values('attachment').annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+def recount():
+    """
+    Recompute every refcount from the threads and comments, for drift left
+    by crashes between a file's storage and its use.
+    """
+    Blob.objects.update(refcount=_references(Thread) + _references(Comment))
+    Blob.objects.filter(refcount=0, released_at__isnull=True).update(released_at=now())
+    Blob.objects.filter(refcount__gt=0, released_at__isnull=False).update(released_at=None)
+
+
+def _stored_files(before):
+    """
+    The sha256 of every file in the store last modified before ``before``
+    (a timestamp), upload spools aside.
+    """
+    for first in os.scandir(root()):
+        if not first.is_dir() or first.name == 'tmp':
+            continue
+        for second in os.scandir(first.path):
+            if not second.is_dir():
+                continue
+            for entry in os.scandir(second.path):
+                if _SHA256.match(entry.name) and entry.stat().st_mtime < before:
+                    yield entry.name
+
+
+def collect(grace=None):
+    """
+    Delete blobs unreferenced for more than ``grace`` seconds, files as old
+    whose row never committed, and abandoned upload spools, returning the
+    number of blobs deleted.
+    """
+    if grace is None:
+        grace = getattr(settings, 'FORUM_ATTACHMENT_GRACE', 24 * 60 * 60)
+    cutoff = now() - timedelta(seconds=grace)
+    deleted = 0
+    orphans = Blob.objects.filter(refcount=0, released_at__lt=cutoff).values_list('pk', flat=True)
+    for sha256 in list(orphans.iterator()):
+        with transaction.atomic():
+            if Blob.objects.filter(pk=sha256, refcount=0).delete()[0]:
+                try:
+                    os.remove(blob_path(sha256))
+                except FileNotFoundError:
+                    pass
+                deleted += 1
+
+    if os.path.isdir(root()):
+        stray = list(_stored_files(cutoff.timestamp()))
+        for start in range(0, len(stray), 500):
+            batch = stray[start:start + 500]
+            known = set(Blob.objects.filter(pk__in=batch).values_list('pk', flat=True))
+            for sha256 in batch:
+                if sha256 in known:
+                    continue
+                # The transaction takes the write lock up front (see
+                # DATABASES), so a store() of the same content in flight
+                # commits its row before this looks again.
+                with transaction.atomic():
+                    if not Blob.objects.filter(pk=sha256).exists():
+                        try:
+                            os.remove(blob_path(sha256))
+                        except FileNotFoundError:
+                            pass
+                        deleted += 1
+
+    spool = os.path.join(root(), 'tmp')
+    if os.path.isdir(spool):
+        for entry in os.scandir(spool):
+            if entry.stat().st_mtime < cutoff.timestamp():
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+    return deleted
+
+
+# ----- Downloads -----
+
+class _FileRange:
+    """
+    ``length`` bytes of ``file`` from its current position. No ``fileno``
+    or ``tell``, so servers stream it rather than sending the whole file.
+    """
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    ``(start, end)`` (inclusive) for a single-range ``Range`` header, None
+    to send the whole file (no header, or one we do not serve), or False
+    when the range cannot be satisfied.
+    """
+    match = _RANGE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        suffix = int(last)
+        if suffix == 0:
+            return False
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        return False
+    if end < start:
+        return None
+    return start, end
+
+
+def serve(request, blob, filename):
+    """
+    Send a blob as a download. Whole files go out through ``FileResponse``,
+    which WSGI servers hand to sendfile(); single byte ranges are honoured
+    with 206 responses. With ``FORUM_ATTACHMENT_ACCEL_REDIRECT`` set, nginx
+    sends the file (ranges included) and Django only writes the headers.
+    """
+    etag = f'"{blob.sha256}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    accel = getattr(settings, 'FORUM_ATTACHMENT_ACCEL_REDIRECT', None)
+    if accel:
+        response = HttpResponse(content_type=blob.content_type)
+        response['X-Accel-Redirect'] = accel.rstrip('/') + '/' + relative_path(blob.sha256).replace(os.sep, '/')
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        response['ETag'] = etag
+        return response
+
+    byte_range = None
+    if request.headers.get('If-Range', etag) == etag:
+        byte_range = parse_range(request.headers.get('Range'), blob.size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{blob.size}'
+        return response
+
+    file = open(blob_path(blob.sha256), 'rb')
+    if byte_range is None:
+        response = FileResponse(file, as_attachment=True, filename=filename, content_type=blob.content_type)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(
+            _FileRange(file, end - start + 1), as_attachment=True, filename=filename,
+            content_type=blob.content_type, status=206,
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{blob.size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    return response
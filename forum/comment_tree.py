@@ -0,0 +1,182 @@
+from collections import deque
+
+from django.db.models import Exists, OuterRef, Q
+
+from forum.models import Comment
+
+DEFAULT_MAX_DEPTH = 8
+DEFAULT_MAX_CHILDREN = 20
+
+
+class MoreReplies:
+    """
+    Cursor for replies that were left out of a rendered tree: the children of
+    ``parent_id`` created after ``after_id`` (all of them when ``after_id`` is
+    None). ``count`` is the number of hidden comments, nested ones included.
+    """
+    __slots__ = ('parent_id', 'after_id', 'count')
+
+    def __init__(self, parent_id, after_id, count):
+        self.parent_id = parent_id
+        self.after_id = after_id
+        self.count = count
+
+    def __repr__(self):
+        return f"MoreReplies(parent_id={self.parent_id}, after_id={self.after_id}, count={self.count})"
+
+
+class CommentNode:
+    __slots__ = ('comment', 'children', 'depth', 'descendants', 'more_replies')
+
+    def __init__(self, comment):
+        self.comment = comment
+        self.children = []
+        self.depth = 0
+        self.descendants = 0
+        self.more_replies = None
+
+
+class CommentTree:
+    def __init__(self, roots, nodes):
+        self.roots = roots
+        self.nodes = nodes
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __iter__(self):
+        return iter(self.roots)
+
+    def comment_ids(self):
+        return list(self.nodes)
+
+
+def build_comment_tree(comments, max_depth=DEFAULT_MAX_DEPTH, max_children=DEFAULT_MAX_CHILDREN,
+                       root_id=None, after_id=None):
+    """
+    Link a flat, ``created_at``-ordered sequence of comments into a reply
+    tree in O(n), without touching the database.
+
+    Comments whose parent is not in ``comments`` (for example because it was
+    deleted) are attached to their top-level comment when that is present,
+    and promoted to the top level otherwise. Levels at or below ``max_depth``
+    and children beyond the first ``max_children`` of a reply are cut off
+    and summarised by a ``MoreReplies`` cursor on their parent. With
+    ``root_id`` the tree is rooted at that comment's replies instead, and
+    ``after_id`` skips replies up to and including that one.
+    """
+    nodes = {comment.id: CommentNode(comment) for comment in comments}
+    top_level = []
+    for node in nodes.values():
+        parent = nodes.get(node.comment.parent_id)
+        if parent is None and node.comment.parent_id is not None:
+            parent = nodes.get(node.comment.root_id)
+        if parent is None:
+            top_level.append(node)
+        else:
+            parent.children.append(node)
+
+    # Subtree sizes, computed bottom-up over a breadth-first ordering.
+    order = list(top_level)
+    for node in order:
+        order.extend(node.children)
+    for node in reversed(order):
+        for child in node.children:
+            node.descendants += 1 + child.descendants
+
+    if root_id is not None:
+        root = nodes.get(root_id)
+        roots = root.children if root is not None else []
+    else:
+        roots = top_level
+    if after_id is not None:
+        ids = [node.comment.id for node in roots]
+        roots = roots[ids.index(after_id) + 1:] if after_id in ids else []
+
+    kept = {}
+    queue = deque(roots)
+    while queue:
+        node = queue.popleft()
+        kept[node.comment.id] = node
+        if not node.children:
+            continue
+        if max_depth is not None and node.depth + 1 >= max_depth:
+            node.more_replies = MoreReplies(node.comment.id, None, node.descendants)
+            node.children = []
+            continue
+        if max_children is not None and len(node.children) > max_children:
+            hidden = node.children[max_children:]
+            node.children = node.children[:max_children]
+            node.more_replies = MoreReplies(
+                node.comment.id,
+                node.children[-1].comment.id,
+                sum(1 + child.descendants for child in hidden),
+            )
+        for child in node.children:
+            child.depth = node.depth + 1
+            queue.append(child)
+
+    return CommentTree(roots, kept)
+
+
+def thread_comments(thread):
+    """
+    All non-deleted comments of ``thread`` with their authors, in one query.
+    """
+    return list(
+        Comment.objects
+        .filter(thread=thread, is_deleted=False)
+        .select_related('author')
+        .order_by('created_at', 'id')
+    )
+
+
+def load_comment_tree(thread, **options):
+    return build_comment_tree(thread_comments(thread), **options)
+
+
+def load_comment_subtree(comment, **options):
+    """
+    The replies below ``comment``, loaded through its top-level comment in
+    one query and rooted at ``comment``.
+    """
+    root_id = comment.root_id or comment.id
+    comments = (
+        Comment.objects
+        .filter(Q(id=root_id) | Q(root_id=root_id), is_deleted=False)
+        .select_related('author')
+        .order_by('created_at', 'id')
+    )
+    return build_comment_tree(comments, root_id=comment.id, **options)
+
+
+def top_level_comments(thread):
+    """
+    The top-level comments to page ``thread_detail`` over: the live ones,
+    and deleted ones that still have live replies so that
+    ``load_comment_page`` can promote those.
+    """
+    live_replies = Comment.objects.filter(root=OuterRef('pk'), is_deleted=False)
+    return (
+        Comment.objects
+        .filter(thread=thread, parent__isnull=True)
+        .filter(Q(is_deleted=False) | Exists(live_replies))
+        .select_related('author')
+    )
+
+
+def load_comment_page(roots, **options):
+    """
+    Build the tree for a page of top-level comments, fetching all of their
+    replies with one query. Deleted top-level comments are left out and
+    their direct replies promoted to the top level.
+    """
+    roots = list(roots)
+    replies = (
+        Comment.objects
+        .filter(root__in=[root.id for root in roots], is_deleted=False)
+        .select_related('author')
+    )
+    comments = [root for root in roots if not root.is_deleted] + list(replies)
+    comments.sort(key=lambda comment: (comment.created_at, comment.id))
+    return build_comment_tree(comments, **options)
@@ -0,0 +1,194 @@
+"""
+The user dashboard: activity counters from the user's ``UserStats`` row,
+moved by signals as posts and votes are written, and the most recent
+threads, comments and polls read a bounded page at a time off the
+per-author indexes. The rendered summary is cached per user and dropped
+whenever the user writes; votes received from others show up once the
+cached copy expires (``DASHBOARD_CACHE_TIMEOUT`` seconds).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, QuerySet, Sum
+from django.template.loader import render_to_string
+
+from forum.models import Comment, Poll, Thread, UserCategoryStats, UserStats
+from forum.pagination import paginate
+
+RECENT_ITEMS = 10
+CURSORS = ('threads_cursor', 'comments_cursor', 'polls_cursor')
+COUNTERS = ('threads', 'comments', 'polls', 'upvotes_received', 'downvotes_received')
+# Moved like the counters, but free to go below zero.
+SIGNED = ('reputation',)
+VOTE_COUNTERS = {'up': 'upvotes_received', 'down': 'downvotes_received'}
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def author_of(model, pk):
+    """
+    The author of one thread or comment, as a one-column queryset for
+    ``adjust`` to resolve inside its own statement.
+    """
+    return model.objects.filter(pk=pk).order_by().values('author_id')
+
+
+# ----- Counters -----
+
+def adjust(user, active_at=None, **deltas):
+    """
+    Move the counters of ``user`` (a user id, or an ``author_of`` queryset)
+    by ``deltas``, never below zero (``reputation`` excepted), and with
+    ``active_at`` set its last activity. One upsert: the row is created on
+    first use. Returns the counters after the change as a dict with
+    ``user_id``, or None if there was no user.
+    """
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if user is None or not (deltas or active_at):
+        return None
+    stats = _table(UserStats)
+    values = [max(deltas.get(name, 0), 0) for name in COUNTERS] + [deltas.get(name, 0) for name in SIGNED]
+    values.append(connection.ops.adapt_datetimefield_value(active_at))
+    placeholders = ', '.join(['%s'] * len(values))
+    if isinstance(user, QuerySet):
+        sql, params = user.query.sql_with_params()
+        source = f"SELECT owner.author_id, {placeholders} FROM ({sql}) owner WHERE owner.author_id IS NOT NULL"
+        params = [*values, *params]
+    else:
+        source, params = f"VALUES (%s, {placeholders})", [user, *values]
+    updates = []
+    for name, delta in deltas.items():
+        if name in SIGNED:
+            updates.append(f"{name} = {stats}.{name} + %s")
+            params.append(delta)
+        else:
+            updates.append(f"{name} = CASE WHEN {stats}.{name} + %s > 0 THEN {stats}.{name} + %s ELSE 0 END")
+            params += [delta, delta]
+    updates.append(f"last_activity_at = COALESCE(%s, {stats}.last_activity_at)")
+    params.append(values[-1])
+    columns = ('user_id', *COUNTERS, *SIGNED)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {stats} ({', '.join(columns)}, last_activity_at) {source} "
+            f"ON CONFLICT (user_id) DO UPDATE SET {', '.join(updates)} "
+            f"RETURNING {', '.join(columns)}",
+            params,
+        )
+        row = cursor.fetchone()
+    return dict(zip(columns, row)) if row else None
+
+
+def counted_stats():
+    """
+    ``{user_id: UserStats}`` counted from the posts, with votes taken from
+    their stored vote counters. Three grouped queries whatever the number
+    of users.
+    """
+    stats = {}
+
+    def merge(rows, counter):
+        for row in rows:
+            entry = stats.setdefault(row['author_id'], UserStats(user_id=row['author_id']))
+            setattr(entry, counter, row['n'])
+            entry.upvotes_received += row.get('up') or 0
+            entry.downvotes_received += row.get('down') or 0
+            if entry.last_activity_at is None or row['last'] > entry.last_activity_at:
+                entry.last_activity_at = row['last']
+
+    for model, counter in ((Thread, 'threads'), (Comment, 'comments')):
+        merge(
+            model.objects.filter(author__isnull=False).order_by().values('author_id')
+            .annotate(n=Count('id'), up=Sum('upvotes'), down=Sum('downvotes'), last=Max('updated_at')),
+            counter,
+        )
+    merge(
+        Poll.objects.filter(thread__author__isnull=False).order_by()
+        .values(author_id=F('thread__author_id')).annotate(n=Count('id'), last=Max('created_at')),
+        'polls',
+    )
+    return stats
+
+
+def rebuild_user_stats(batch_size=500):
+    """
+    Recount every ``UserStats`` row, and the per-category thread counts,
+    from the posts, for drift left behind by bulk writes, which send no
+    signals. Returns the number of users counted.
+    """
+    counted = counted_stats()
+    per_category = (
+        Thread.objects.filter(author__isnull=False, category__isnull=False).order_by()
+        .values('author_id', 'category_id').annotate(n=Count('id'))
+    )
+    with transaction.atomic():
+        UserStats.objects.update(**dict.fromkeys(COUNTERS, 0), last_activity_at=None)
+        UserStats.objects.bulk_create(
+            counted.values(), batch_size=batch_size, update_conflicts=True, unique_fields=['user'],
+            update_fields=[*COUNTERS, 'last_activity_at'],
+        )
+        UserCategoryStats.objects.all().delete()
+        UserCategoryStats.objects.bulk_create(
+            (
+                UserCategoryStats(user_id=row['author_id'], category_id=row['category_id'], threads=row['n'])
+                for row in per_category.iterator(chunk_size=batch_size)
+            ),
+            batch_size=batch_size,
+        )
+    return len(counted)
+
+
+def user_stats(user):
+    """
+    The user's stats row, or an unsaved one of zeros before their first post.
+    """
+    return UserStats.objects.filter(user=user).first() or UserStats(user=user)
+
+
+# ----- Summary -----
+
+def _summary_key(user_id):
+    return f"forum:dashboard:{user_id}"
+
+
+def invalidate_summary(user_id):
+    if user_id is not None:
+        cache.delete(_summary_key(user_id))
+
+
+def recent(request, stats):
+    """
+    One keyset page each of the user's threads, comments and polls, newest
+    first. Lists the counters show to be empty are not queried.
+    """
+    user = request.user
+    querysets = {
+        'threads': (Thread.objects.filter(author=user), 'threads_cursor'),
+        'comments': (Comment.objects.filter(author=user).select_related('thread'), 'comments_cursor'),
+        'polls': (Poll.objects.filter(thread__author=user).select_related('thread'), 'polls_cursor'),
+    }
+    return {
+        name: paginate(request, queryset, param, per_page=RECENT_ITEMS) if getattr(stats, name) else None
+        for name, (queryset, param) in querysets.items()
+    }
+
+
+def render_summary(request):
+    """
+    The rendered dashboard body for ``request.user``. The first page, which
+    is nearly every visit, comes from the per-user cache; older pages
+    (any cursor in the query string) are rendered fresh.
+    """
+    paging = any(param in request.GET for param in CURSORS)
+    key = _summary_key(request.user.pk)
+    if not paging:
+        html = cache.get(key)
+        if html is not None:
+            return html
+
+    stats = user_stats(request.user)
+    html = render_to_string('dashboard_summary.html', {'stats': stats, **recent(request, stats)})
+    if not paging:
+        cache.set(key, html, getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 5 * 60))
+    return html
@@ -1,5 +1,8 @@
 from django import forms
 from .models import Category, Tag, Forum, Thread, Comment, Poll, PollOption, UserProfile, Achievement
+from .achievements import InvalidCriteria, parse
+
+ATTACHMENT_ACCEPT = '.pdf,.jpg,.jpeg,.png,.doc,.docx'
 
 class CategoryForm(forms.ModelForm):
     class Meta:
@@ -48,16 +51,18 @@ class ForumForm(forms.ModelForm):
         return name
 
 class ThreadForm(forms.ModelForm):
+    # Stored through forum.attachments, not as a model field.
+    attachment = forms.FileField(required=False, widget=forms.FileInput(attrs={'accept': ATTACHMENT_ACCEPT}))
+
     class Meta:
         model = Thread
-        fields = ['title', 'description', 'category', 'tags', 'status', 'attachment']
+        fields = ['title', 'description', 'category', 'tags', 'status']
         widgets = {
             'title': forms.TextInput(attrs={'placeholder': 'Enter thread title'}),
             'description': forms.Textarea(attrs={'rows': 6, 'placeholder': 'Write your thread content'}),
             'category': forms.Select(attrs={'class': 'form-select'}),
             'tags': forms.CheckboxSelectMultiple,
             'status': forms.Select(choices=Thread.STATUS_CHOICES),
-            'attachment': forms.FileInput(attrs={'accept': '.pdf,.jpg,.png,.doc,.docx'}),
         }
 
     def clean(self):
@@ -70,13 +75,13 @@ class ThreadForm(forms.ModelForm):
 
 class CommentForm(forms.ModelForm):
     parent_id = forms.IntegerField(required=False, widget=forms.HiddenInput)
+    attachment = forms.FileField(required=False, widget=forms.FileInput(attrs={'accept': ATTACHMENT_ACCEPT}))
 
     class Meta:
         model = Comment
-        fields = ['content', 'attachment']
+        fields = ['content']
         widgets = {
             'content': forms.Textarea(attrs={'rows': 4, 'placeholder': 'Write your comment'}),
-            'attachment': forms.FileInput(attrs={'accept': '.pdf,.jpg,.png,.doc,.docx'}),
         }
 
     def clean(self):
@@ -120,16 +125,29 @@ class ProfileForm(forms.ModelForm):
 class AchievementForm(forms.ModelForm):
     class Meta:
         model = Achievement
-        fields = ['name', 'description', 'badge_image', 'points']
+        fields = ['name', 'description', 'badge_image', 'points', 'criteria']
         widgets = {
             'name': forms.TextInput(attrs={'placeholder': 'Achievement name'}),
             'description': forms.Textarea(attrs={'rows': 4, 'placeholder': 'Describe the achievement'}),
             'badge_image': forms.FileInput(attrs={'accept': '.jpg,.png'}),
             'points': forms.NumberInput(attrs={'min': 0}),
+            'criteria': forms.TextInput(attrs={'placeholder': 'e.g. comments >= 100 and upvotes >= 10'}),
         }
 
     def clean_name(self):
         name = self.cleaned_data['name']
         if Achievement.objects.filter(name__iexact=name).exclude(pk=self.instance.pk if self.instance else None).exists():
             raise forms.ValidationError("An achievement with this name already exists.")
-        return name
\ No newline at end of file
+        return name
+
+    def clean_criteria(self):
+        criteria = self.cleaned_data['criteria']
+        try:
+            predicates = parse(criteria)
+        except InvalidCriteria as error:
+            raise forms.ValidationError(str(error))
+        names = {predicate.category for predicate in predicates if predicate.category}
+        unknown = names - set(Category.objects.filter(name__in=names).values_list('name', flat=True))
+        if unknown:
+            raise forms.ValidationError(f"No such category: {', '.join(sorted(unknown))}.")
+        return criteria
@@ -0,0 +1,49 @@
+import time
+
+from django.core.cache import cache
+
+
+def _generation_key(kind, pk):
+    return f"forum:fragment-gen:{kind}:{pk}"
+
+
+def invalidate_fragments(kind, *pks):
+    """
+    Retire every cached fragment of the given objects by moving them to a
+    new generation; the old fragments are never read again and expire.
+    """
+    token = time.time_ns()
+    # Generations must outlive the fragments keyed on them, so no timeout.
+    cache.set_many({_generation_key(kind, pk): token for pk in pks}, None)
+
+
+# Fragments also show their author's name and picture and their category's
+# name, so the generations of those objects are part of the version too.
+RELATED = (('user', 'author_id'), ('category', 'category_id'))
+
+
+def annotate_versions(kind, objects):
+    """
+    Set ``fragment_version`` on each object, for use as a ``{% cache %}``
+    vary-on value: its ``updated_at`` (when it has one) plus the generations
+    bumped by signals for it, its author and its category, fetched for all
+    objects in one cache round trip.
+    """
+    objects = list(objects)
+    keys = {
+        obj: [_generation_key(kind, obj.pk)] + [
+            _generation_key(related, getattr(obj, attname, None)) for related, attname in RELATED
+        ]
+        for obj in objects
+    }
+    generations = cache.get_many({key for object_keys in keys.values() for key in object_keys})
+    for obj in objects:
+        updated_at = getattr(obj, 'updated_at', None)
+        stamp = updated_at.timestamp() if updated_at else 0
+        obj.fragment_version = ':'.join([str(stamp)] + [str(generations.get(key, 0)) for key in keys[obj]])
+    return objects
+
+
+def annotate_tree(tree):
+    annotate_versions('comment', (node.comment for node in tree.nodes.values()))
+    return tree
@@ -0,0 +1,244 @@
+"""
+Live thread updates: new comments, score changes and poll tallies pushed to
+readers of a thread as Server-Sent Events.
+
+Signal handlers publish to a broker channel per thread; the ``thread_events``
+view subscribes to it from an async generator, so under ASGI an idle reader
+costs a queue and a suspended coroutine rather than a worker thread. The
+broker is named by ``FORUM_LIVE_BROKER``. The default ``InProcessBroker``
+only reaches readers connected to the same process: enough for a single
+ASGI server and for tests. Several processes need a shared broker (Redis
+pub/sub, PostgreSQL LISTEN/NOTIFY, ...) implementing ``Broker``.
+"""
+import asyncio
+import itertools
+import json
+import threading
+from collections import namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+from forum.models import Comment, PollOption, Thread
+
+HEARTBEAT = 15
+RETRY_MS = 3000
+
+Message = namedtuple('Message', 'id event data')
+
+
+class Broker:
+    """
+    Publish/subscribe over named channels. ``publish`` is called from sync
+    code on any thread; ``subscribe`` returns an async context manager whose
+    ``get(timeout)`` waits for the next message.
+    """
+
+    def publish(self, channel, event, data):
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        raise NotImplementedError
+
+    def has_subscribers(self, channel=None):
+        """
+        False only when publishing to ``channel`` (to any channel when None)
+        certainly reaches nobody, letting publishers skip the queries behind
+        a message.
+        """
+        return True
+
+
+class InProcessBroker(Broker):
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self.channels = {}
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+
+    def publish(self, channel, event, data):
+        message = Message(next(self.ids), event, data)
+        with self.lock:
+            subscriptions = list(self.channels.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(message)
+        return len(subscriptions)
+
+    def subscribe(self, channel):
+        return Subscription(self, channel, self.max_queue)
+
+    def has_subscribers(self, channel=None):
+        return bool(self.channels if channel is None else self.channels.get(channel))
+
+    def _add(self, channel, subscription):
+        with self.lock:
+            self.channels.setdefault(channel, set()).add(subscription)
+
+    def _remove(self, channel, subscription):
+        with self.lock:
+            subscriptions = self.channels.get(channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.channels[channel]
+
+
+class RecordingBroker(InProcessBroker):
+    """
+    An InProcessBroker that also keeps every published message, and always
+    claims subscribers so nothing is skipped. For tests.
+    """
+
+    def __init__(self, max_queue=100):
+        super().__init__(max_queue)
+        self.published = []
+
+    def publish(self, channel, event, data):
+        self.published.append((channel, event, data))
+        return super().publish(channel, event, data)
+
+    def has_subscribers(self, channel=None):
+        return True
+
+
+class Subscription:
+    """
+    One reader's bounded queue, fed thread-safely through its event loop.
+    A reader that falls ``max_queue`` messages behind loses the oldest.
+    """
+
+    def __init__(self, broker, channel, max_queue):
+        self.broker = broker
+        self.channel = channel
+        self.max_queue = max_queue
+        self.loop = None
+        self.queue = None
+
+    async def __aenter__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(self.max_queue)
+        self.broker._add(self.channel, self)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.broker._remove(self.channel, self)
+
+    def deliver(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The loop is gone; the reader will never collect it.
+            self.broker._remove(self.channel, self)
+
+    def _put(self, message):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+@lru_cache(maxsize=None)
+def _broker(path):
+    return import_string(path)()
+
+
+def get_broker():
+    return _broker(getattr(settings, 'FORUM_LIVE_BROKER', 'forum.live.InProcessBroker'))
+
+
+def live_enabled():
+    """
+    Whether pages open event streams. Off by default: under WSGI a stream
+    never ends and holds a worker thread for as long as the page is open.
+    """
+    return getattr(settings, 'FORUM_LIVE_ENABLED', False)
+
+
+def thread_channel(thread_id):
+    return f"forum:thread:{thread_id}"
+
+
+# ----- Streaming -----
+
+def format_event(message):
+    data = json.dumps(message.data, cls=DjangoJSONEncoder)
+    return f"id: {message.id}\nevent: {message.event}\ndata: {data}\n\n"
+
+
+async def event_stream(channel, heartbeat=HEARTBEAT):
+    """
+    SSE text for ``channel`` until the client goes away (the server then
+    cancels the generator, which unsubscribes). Comments every ``heartbeat``
+    seconds keep proxies from closing an idle connection.
+    """
+    async with get_broker().subscribe(channel) as subscription:
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            try:
+                message = await subscription.get(heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_event(message)
+
+
+# ----- Publishing (run on commit) -----
+
+def publish_comment(comment):
+    channel = thread_channel(comment.thread_id)
+    broker = get_broker()
+    if not broker.has_subscribers(channel):
+        return
+    broker.publish(channel, 'comment', {
+        'id': comment.pk,
+        'parent_id': comment.parent_id,
+        'author': comment.author.username if comment.author_id else None,
+        'content': comment.content,
+        'created_at': comment.created_at,
+    })
+
+
+def publish_score(kind, pk):
+    """
+    The current counters of a thread or comment. Runs after the vote's
+    transaction, so they are final.
+    """
+    broker = get_broker()
+    if kind == 'thread':
+        thread_id = pk
+        if not broker.has_subscribers(thread_channel(thread_id)):
+            return
+        row = Thread.objects.filter(pk=pk).values('id', 'upvotes', 'downvotes', 'score').first()
+    else:
+        if not broker.has_subscribers():
+            return
+        row = Comment.objects.filter(pk=pk).values('id', 'thread_id', 'upvotes', 'downvotes', 'score').first()
+        thread_id = row and row.pop('thread_id')
+    if row is not None:
+        broker.publish(thread_channel(thread_id), 'score', {'kind': kind, **row})
+
+
+def publish_poll_tally(option_id):
+    """
+    Every option of the poll ``option_id`` belongs to, read from the
+    counters directly: the cached tally is only invalidated after this runs.
+    """
+    broker = get_broker()
+    if not broker.has_subscribers():
+        return
+    options = list(
+        PollOption.objects.filter(poll__options=option_id).order_by('id')
+        .values_list('id', 'text', 'votes', 'poll_id', 'poll__thread_id')
+    )
+    if not options:
+        return
+    poll_id, thread_id = options[0][3:]
+    broker.publish(thread_channel(thread_id), 'poll', {
+        'poll_id': poll_id,
+        'options': [{'option_id': pk, 'text': text, 'votes': votes} for pk, text, votes, _, _ in options],
+        'total': sum(votes for _, _, votes, _, _ in options),
+    })
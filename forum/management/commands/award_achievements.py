@@ -0,0 +1,26 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from forum.achievements import backfill
+from forum.models import UserAchievement
+
+
+class Command(BaseCommand):
+    help = (
+        "Award every achievement (or those given with --achievement) to the users whose stored counters "
+        "satisfy its criteria, evaluating users in chunks over a process pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--achievement', type=int, action='append', dest='achievements', help="Achievement id.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        before = UserAchievement.objects.count()
+        users, rules = backfill(options['achievements'], chunk_size=options['chunk_size'], workers=options['workers'])
+        awarded = UserAchievement.objects.count() - before
+        self.stdout.write(self.style.SUCCESS(
+            f"Evaluated {users} user(s) against {rules} rule(s); {awarded} new award(s)."
+        ))
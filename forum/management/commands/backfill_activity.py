@@ -0,0 +1,32 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from forum.activity import backfill, FEED_DAYS
+from forum.models import ActivityEvent
+
+
+class Command(BaseCommand):
+    help = "Write activity feed events for existing threads, comments and polls, streaming rows in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=FEED_DAYS, help="Only content created in the last N days.")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--clear', action='store_true', help="Drop every feed event first.")
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted, _ = ActivityEvent.objects.all().delete()
+            self.stdout.write(f"Removed {deleted} event(s).")
+
+        totals = Counter()
+        since = now() - timedelta(days=options['days'])
+        for kind, count in backfill(since, chunk_size=options['chunk_size']):
+            totals[kind] += count
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Recorded {totals[kind]} {kind}(s)...")
+
+        summary = ", ".join(f"{totals[kind]} {kind}(s)" for kind in ('thread', 'comment', 'poll'))
+        self.stdout.write(self.style.SUCCESS(f"Recorded {summary}."))
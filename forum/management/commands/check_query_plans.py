@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from forum.query_plans import analyze, check_plans
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the hot forum queries and verify each one uses the index designed for it."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--analyze', action='store_true', help="Run ANALYZE first so the planner has fresh statistics.",
+        )
+
+    def handle(self, *args, **options):
+        if options['analyze']:
+            analyze()
+        failures = 0
+        for label, indexes, used, plan in check_plans():
+            if used:
+                self.stdout.write(f"ok    {label}: {' or '.join(indexes)}")
+            else:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"MISS  {label}: expected {' or '.join(indexes)}"))
+            if options['verbosity'] > 1 or not used:
+                for line in plan.splitlines():
+                    self.stdout.write(f"        {line}")
+
+        if failures:
+            raise CommandError(f"{failures} query plan(s) on {connection.vendor} do not use their index.")
+        self.stdout.write(self.style.SUCCESS(f"All query plans use their indexes ({connection.vendor})."))
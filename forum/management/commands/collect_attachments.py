@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from forum.attachments import collect, recount
+
+
+class Command(BaseCommand):
+    help = "Delete attachment blobs no thread or comment has used for FORUM_ATTACHMENT_GRACE seconds."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, help="Grace period in seconds instead of the setting.")
+        parser.add_argument('--recount', action='store_true', help="Recompute every reference count first.")
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            recount()
+        deleted = collect(options['grace'])
+        self.stdout.write(self.style.SUCCESS(f"Removed {deleted} blob(s)."))
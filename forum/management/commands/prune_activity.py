@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from forum.activity import prune, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = "Delete activity feed events older than FORUM_ACTIVITY_RETENTION_DAYS, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Keep this many days instead of the setting.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        deleted = prune(retention_cutoff(options['days']), batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Removed {deleted} event(s)."))
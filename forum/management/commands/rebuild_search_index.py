@@ -0,0 +1,28 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from forum.models import SearchDocument
+from forum.search import reindex
+
+
+class Command(BaseCommand):
+    help = "Rebuild the forum search index from threads, comments and polls, streaming rows in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--clear', action='store_true', help="Drop every indexed document first.")
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted, _ = SearchDocument.objects.all().delete()
+            self.stdout.write(f"Removed {deleted} document(s).")
+
+        totals = Counter()
+        for kind, count in reindex(chunk_size=options['chunk_size']):
+            totals[kind] += count
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Indexed {totals[kind]} {kind}(s)...")
+
+        summary = ", ".join(f"{totals[kind]} {kind}(s)" for kind in ('thread', 'comment', 'poll'))
+        self.stdout.write(self.style.SUCCESS(f"Indexed {summary}."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from forum.dashboard import rebuild_user_stats
+
+
+class Command(BaseCommand):
+    help = "Recount the per-user dashboard stats and per-category thread counts from the posts and their vote counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        counted = rebuild_user_stats(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Recounted the stats of {counted} user(s)."))
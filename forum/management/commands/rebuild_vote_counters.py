@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from forum.models import Thread, Comment
+from forum.polls import rebuild_poll_counters
+from forum.voting import rebuild_vote_counters
+
+
+class Command(BaseCommand):
+    help = "Recount Thread, Comment and PollOption vote counters from the vote tables and report drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without fixing it.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        action = "found" if dry_run else "fixed"
+        total = 0
+        for model in (Thread, Comment):
+            drift = rebuild_vote_counters(model, dry_run=dry_run, batch_size=options['batch_size'])
+            total += len(drift)
+            if options['verbosity'] > 1:
+                for obj_id, stored, actual in drift:
+                    self.stdout.write(
+                        f"{model.__name__} #{obj_id}: stored up/down/score={stored}, actual={actual}"
+                    )
+            self.stdout.write(f"{model.__name__}: {len(drift)} drifted row(s) {action}.")
+
+        drift = rebuild_poll_counters(dry_run=dry_run, batch_size=options['batch_size'])
+        total += len(drift)
+        if options['verbosity'] > 1:
+            for option_id, stored, actual in drift:
+                self.stdout.write(f"PollOption #{option_id}: stored votes={stored}, actual={actual}")
+        self.stdout.write(f"PollOption: {len(drift)} drifted row(s) {action}.")
+
+        if total and dry_run:
+            self.stdout.write(self.style.WARNING(f"{total} row(s) need rebuilding."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Vote counters are consistent."))
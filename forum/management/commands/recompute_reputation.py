@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from forum.reputation import recompute
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount global and per-forum reputation from the vote counters and the achievements held, correcting "
+        "drift in the incremental scores. Meant to run nightly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forum', type=int, action='append', dest='forums', help="Only this forum's scores.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        users, forum_rows = recompute(options['forums'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Recounted the reputation of {users} user(s) and {forum_rows} per-forum score(s)."
+        ))
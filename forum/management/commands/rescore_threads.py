@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from forum.trending import refresh_windows, rescore
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the trending scores of every thread from its votes, comments and views. With --windows, only "
+        "recount the last week's votes and comments (run this hourly; the full rescore nightly)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--windows', action='store_true', help="Only refresh week_score and week_comments.")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if options['windows']:
+            self.stdout.write(self.style.SUCCESS(f"Refreshed the weekly counts of {refresh_windows()} thread(s)."))
+            return
+        changed = rescore(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rescored {changed} thread(s)."))
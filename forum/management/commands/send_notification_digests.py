@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from forum.notifications import send_digests, rebuild_inbox_counters
+
+
+class Command(BaseCommand):
+    help = "Email every user a digest of their pending notifications, at most once per digest interval."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, help="Seconds between digests, instead of the setting.")
+        parser.add_argument('--batch-size', type=int, default=100, help="Users per email batch.")
+        parser.add_argument('--rebuild-counters', action='store_true', help="Recount unread notifications first.")
+
+    def handle(self, *args, **options):
+        if options['rebuild_counters']:
+            rebuild_inbox_counters()
+            self.stdout.write("Rebuilt unread counters.")
+        interval = timedelta(seconds=options['interval']) if options['interval'] is not None else None
+        sent = send_digests(interval, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Sent {sent} digest(s)."))
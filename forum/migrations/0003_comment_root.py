@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_comment_roots(apps, schema_editor):
+    Comment = apps.get_model('forum', 'Comment')
+    parents = dict(Comment.objects.filter(parent__isnull=False).values_list('id', 'parent_id'))
+    roots = {}
+    for comment_id in parents:
+        node = comment_id
+        while node in parents:
+            node = parents[node]
+        roots[comment_id] = node
+    pending = [Comment(id=comment_id, root_id=root_id) for comment_id, root_id in roots.items()]
+    Comment.objects.bulk_update(pending, ['root'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0002_vote_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='root',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='forum.comment'),
+        ),
+        migrations.RunPython(fill_comment_roots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE forum_searchdocument_fts USING fts5(
+        title, body,
+        content='forum_searchdocument', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER forum_searchdocument_fts_insert AFTER INSERT ON forum_searchdocument BEGIN
+        INSERT INTO forum_searchdocument_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER forum_searchdocument_fts_delete AFTER DELETE ON forum_searchdocument BEGIN
+        INSERT INTO forum_searchdocument_fts(forum_searchdocument_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER forum_searchdocument_fts_update AFTER UPDATE OF title, body ON forum_searchdocument BEGIN
+        INSERT INTO forum_searchdocument_fts(forum_searchdocument_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO forum_searchdocument_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+]
+
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS forum_searchdocument_fts_update",
+    "DROP TRIGGER IF EXISTS forum_searchdocument_fts_delete",
+    "DROP TRIGGER IF EXISTS forum_searchdocument_fts_insert",
+    "DROP TABLE IF EXISTS forum_searchdocument_fts",
+]
+
+POSTGRES_INSTALL = [
+    """
+    CREATE INDEX forum_searchdocument_tsv ON forum_searchdocument
+    USING GIN (to_tsvector('english', title || ' ' || body))
+    """,
+]
+
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS forum_searchdocument_tsv",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+install_full_text = _run({'sqlite': SQLITE_INSTALL, 'postgresql': POSTGRES_INSTALL})
+uninstall_full_text = _run({'sqlite': SQLITE_UNINSTALL, 'postgresql': POSTGRES_UNINSTALL})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0003_comment_root'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('thread', 'Thread'), ('comment', 'Comment'), ('poll', 'Poll')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField()),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='forum.category')),
+                ('thread', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='forum.thread')),
+            ],
+            options={
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(install_full_text, uninstall_full_text),
+    ]
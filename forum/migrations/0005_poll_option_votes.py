@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:19
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_poll_votes(apps, schema_editor):
+    PollOption = apps.get_model('forum', 'PollOption')
+    options = list(PollOption.objects.annotate(counted=Count('pollvote')).filter(counted__gt=0))
+    for option in options:
+        option.votes = option.counted
+    PollOption.objects.bulk_update(options, ['votes'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0004_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='polloption',
+            name='votes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_poll_votes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0005_poll_option_votes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_deleted', False), ('parent__isnull', True)), fields=['thread', 'created_at', 'id'], name='comment_thread_top_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-created_at', '-id'], name='comment_live_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='comment_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commentedithistory',
+            index=models.Index(fields=['comment', '-edited_at'], name='comment_history_edited_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='poll',
+            index=models.Index(fields=['-created_at', '-id'], name='poll_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-created_at', '-id'], name='thread_live_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['category', '-created_at', '-id'], name='thread_live_cat_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='thread_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='threadedithistory',
+            index=models.Index(fields=['thread', '-edited_at'], name='thread_history_edited_idx'),
+        ),
+    ]
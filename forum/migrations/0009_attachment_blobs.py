@@ -0,0 +1,152 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:56
+
+import hashlib
+import os
+import tempfile
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# The blob store layout and content types as of this migration, frozen here
+# rather than imported from forum.attachments.
+CONTENT_TYPES = {
+    'pdf': 'application/pdf',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+    'txt': 'text/plain',
+    'doc': 'application/msword',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'zip': 'application/zip',
+}
+
+
+def ingest(path):
+    """
+    Hash the file at ``path`` and copy it into the store. Returns
+    ``(sha256, size, content_type)``.
+    """
+    root = os.fspath(getattr(settings, 'FORUM_ATTACHMENT_ROOT', os.path.join(settings.MEDIA_ROOT, 'blobs')))
+    digest, size = hashlib.sha256(), 0
+    os.makedirs(os.path.join(root, 'tmp'), exist_ok=True)
+    fd, spool = tempfile.mkstemp(dir=os.path.join(root, 'tmp'), suffix='.upload')
+    with open(path, 'rb') as source, os.fdopen(fd, 'wb') as target:
+        for chunk in iter(lambda: source.read(64 * 1024), b''):
+            digest.update(chunk)
+            target.write(chunk)
+            size += len(chunk)
+    sha256 = digest.hexdigest()
+    destination = os.path.join(root, sha256[:2], sha256[2:4], sha256)
+    if os.path.exists(destination):
+        os.remove(spool)
+    else:
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.chmod(spool, 0o644)
+        os.replace(spool, destination)
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    return sha256, size, CONTENT_TYPES.get(extension, 'application/octet-stream')
+
+
+def move_to_blob_store(apps, schema_editor):
+    """
+    Hash the files of existing attachments into the blob store and point
+    their threads and comments at the blobs. Files that cannot be found
+    (uploads used to land relative to the working directory) are dropped.
+    """
+    Blob = apps.get_model('forum', 'Blob')
+    refcounts, blobs = {}, {}
+    for model_name in ('Thread', 'Comment'):
+        model = apps.get_model('forum', model_name)
+        for pk, name in model.objects.exclude(attachment='').exclude(attachment=None).values_list('pk', 'attachment'):
+            candidates = [os.path.join(settings.MEDIA_ROOT, name), os.path.join(settings.BASE_DIR, name)]
+            path = next((candidate for candidate in candidates if os.path.isfile(candidate)), None)
+            if path is None:
+                continue
+            sha256, size, content_type = ingest(path)
+            blobs[sha256] = (size, content_type)
+            refcounts[sha256] = refcounts.get(sha256, 0) + 1
+            model.objects.filter(pk=pk).update(attachment_blob=sha256, attachment_name=os.path.basename(name)[:255])
+    Blob.objects.bulk_create(
+        [Blob(sha256=sha256, size=size, content_type=content_type, refcount=refcounts[sha256])
+         for sha256, (size, content_type) in blobs.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0008_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.BigIntegerField()),
+                ('content_type', models.CharField(max_length=100)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('released_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('refcount', 0)), fields=['released_at'], name='blob_orphan_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='attachment_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='attachment_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        # Blob rows are created after the references, so no constraint yet.
+        migrations.AddField(
+            model_name='comment',
+            name='attachment_blob',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='attachment_blob',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        # Irreversible: the old file columns are dropped below, and the files
+        # now live only in the blob store.
+        migrations.RunPython(move_to_blob_store),
+        migrations.RemoveField(
+            model_name='comment',
+            name='attachment',
+        ),
+        migrations.RemoveField(
+            model_name='thread',
+            name='attachment',
+        ),
+        migrations.RenameField(
+            model_name='comment',
+            old_name='attachment_blob',
+            new_name='attachment',
+        ),
+        migrations.RenameField(
+            model_name='thread',
+            old_name='attachment_blob',
+            new_name='attachment',
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='attachment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='forum.blob'),
+        ),
+        migrations.AlterField(
+            model_name='thread',
+            name='attachment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='forum.blob'),
+        ),
+    ]
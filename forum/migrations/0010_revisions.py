@@ -0,0 +1,150 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:03
+
+import json
+import re
+import zlib
+from difflib import SequenceMatcher
+from itertools import groupby
+from operator import itemgetter
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+# The revision encoding as of this migration, frozen here rather than
+# imported from forum.revisions: word-level deltas as JSON ops, a snapshot
+# every FORUM_REVISION_SNAPSHOT_INTERVAL revisions, zlib where smaller.
+_TOKEN = re.compile(r'\S+\s*|\s+')
+COMPRESS_MIN = 64
+
+
+def make_delta(old, new):
+    old_tokens, new_tokens = _TOKEN.findall(old), _TOKEN.findall(new)
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, old_tokens, new_tokens).get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif tag in ('replace', 'insert'):
+            ops.append(''.join(new_tokens[j1:j2]))
+    return ops
+
+
+def revision_fields(number, content, previous, **extra):
+    data = content.encode()
+    is_snapshot, is_compressed = True, False
+    interval = getattr(settings, 'FORUM_REVISION_SNAPSHOT_INTERVAL', 10)
+    if previous is not None and number % interval != 0:
+        delta = json.dumps(make_delta(previous, content), ensure_ascii=False, separators=(',', ':')).encode()
+        if len(delta) < len(data):
+            data, is_snapshot = delta, False
+    if getattr(settings, 'FORUM_REVISION_COMPRESS', True) and len(data) >= COMPRESS_MIN:
+        packed = zlib.compress(data, 6)
+        if len(packed) < len(data):
+            data, is_compressed = packed, True
+    return dict(
+        number=number, is_snapshot=is_snapshot, is_compressed=is_compressed, data=data, length=len(content),
+        **extra,
+    )
+
+
+def convert(original, edits, **original_extra):
+    """
+    Revision fields for a history kept as ``(old, new, user_id, edited_at)``
+    edits, in order, after ``original``. An edit whose old text is not the
+    text before it gets a revision of its own, so every text is kept.
+    """
+    rows = [revision_fields(0, original, None, **original_extra)]
+    current = original
+    for old, new, user_id, edited_at in edits:
+        if old != current:
+            rows.append(revision_fields(len(rows), old, current, user_id=None, created_at=edited_at))
+            current = old
+        rows.append(revision_fields(len(rows), new, current, user_id=user_id, created_at=edited_at))
+        current = new
+    return rows
+
+
+def convert_histories(apps, schema_editor):
+    """
+    Rebuild each edited thread's and comment's history as revisions: the
+    text before its first edit as revision 0, then one revision per edit.
+    """
+    for history_name, revision_name, field in (
+        ('ThreadEditHistory', 'ThreadRevision', 'thread'),
+        ('CommentEditHistory', 'CommentRevision', 'comment'),
+    ):
+        History = apps.get_model('forum', history_name)
+        Revision = apps.get_model('forum', revision_name)
+        rows = (
+            History.objects.order_by(f'{field}_id', 'edited_at', 'id')
+            .values_list(f'{field}_id', f'{field}__author_id', f'{field}__created_at',
+                         'old_content', 'new_content', 'user_id', 'edited_at')
+        )
+        batch = []
+        for parent_id, edits in groupby(rows.iterator(chunk_size=2000), key=itemgetter(0)):
+            edits = list(edits)
+            _, author_id, created_at = edits[0][:3]
+            revisions = convert(
+                edits[0][3], [edit[3:] for edit in edits], user_id=author_id, created_at=created_at,
+            )
+            batch.extend(Revision(**{f'{field}_id': parent_id}, **revision) for revision in revisions)
+            if len(batch) >= 1000:
+                Revision.objects.bulk_create(batch)
+                batch = []
+        Revision.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0009_attachment_blobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('is_snapshot', models.BooleanField()),
+                ('is_compressed', models.BooleanField(default=False)),
+                ('data', models.BinaryField()),
+                ('length', models.PositiveIntegerField()),
+                ('comment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='forum.comment')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ThreadRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('is_snapshot', models.BooleanField()),
+                ('is_compressed', models.BooleanField(default=False)),
+                ('data', models.BinaryField()),
+                ('length', models.PositiveIntegerField()),
+                ('thread', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='forum.thread')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='commentrevision',
+            constraint=models.UniqueConstraint(fields=('comment', 'number'), name='comment_revision_number_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='threadrevision',
+            constraint=models.UniqueConstraint(fields=('thread', 'number'), name='thread_revision_number_uniq'),
+        ),
+        # Irreversible: the old edit-history tables are dropped below.
+        migrations.RunPython(convert_histories),
+        migrations.DeleteModel(
+            name='CommentEditHistory',
+        ),
+        migrations.DeleteModel(
+            name='ThreadEditHistory',
+        ),
+    ]
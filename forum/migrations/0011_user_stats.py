@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Sum
+
+
+def count_user_stats(apps, schema_editor):
+    Thread = apps.get_model('forum', 'Thread')
+    Comment = apps.get_model('forum', 'Comment')
+    Poll = apps.get_model('forum', 'Poll')
+    UserStats = apps.get_model('forum', 'UserStats')
+    stats = {}
+
+    def merge(rows, counter):
+        for row in rows:
+            entry = stats.setdefault(row['author_id'], UserStats(user_id=row['author_id']))
+            setattr(entry, counter, row['n'])
+            entry.upvotes_received += row.get('up') or 0
+            entry.downvotes_received += row.get('down') or 0
+            if entry.last_activity_at is None or row['last'] > entry.last_activity_at:
+                entry.last_activity_at = row['last']
+
+    for model, counter in ((Thread, 'threads'), (Comment, 'comments')):
+        merge(
+            model.objects.filter(author__isnull=False).order_by().values('author_id')
+            .annotate(n=Count('id'), up=Sum('upvotes'), down=Sum('downvotes'), last=Max('updated_at')),
+            counter,
+        )
+    merge(
+        Poll.objects.filter(thread__author__isnull=False).order_by()
+        .values(author_id=F('thread__author_id')).annotate(n=Count('id'), last=Max('created_at')),
+        'polls',
+    )
+    UserStats.objects.bulk_create(stats.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentification', '0001_initial'),
+        ('forum', '0010_revisions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('threads', models.PositiveIntegerField(default=0)),
+                ('comments', models.PositiveIntegerField(default=0)),
+                ('polls', models.PositiveIntegerField(default=0)),
+                ('upvotes_received', models.PositiveIntegerField(default=0)),
+                ('downvotes_received', models.PositiveIntegerField(default=0)),
+                ('last_activity_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(count_user_stats, migrations.RunPython.noop),
+    ]
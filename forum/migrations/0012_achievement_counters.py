@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_category_threads(apps, schema_editor):
+    Thread = apps.get_model('forum', 'Thread')
+    UserCategoryStats = apps.get_model('forum', 'UserCategoryStats')
+    rows = (
+        Thread.objects.filter(author__isnull=False, category__isnull=False).order_by()
+        .values('author_id', 'category_id').annotate(n=Count('id'))
+    )
+    UserCategoryStats.objects.bulk_create(
+        [UserCategoryStats(user_id=row['author_id'], category_id=row['category_id'], threads=row['n']) for row in rows],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0011_user_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCategoryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('threads', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='forum.category')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'category'), name='user_category_stats_uniq')],
+            },
+        ),
+        migrations.RunPython(count_category_threads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def score_reputation(apps, schema_editor):
+    Thread = apps.get_model('forum', 'Thread')
+    Comment = apps.get_model('forum', 'Comment')
+    UserAchievement = apps.get_model('forum', 'UserAchievement')
+    UserStats = apps.get_model('forum', 'UserStats')
+    ForumReputation = apps.get_model('forum', 'ForumReputation')
+
+    totals, forums = {}, {}
+    for model, path in ((Thread, 'category__forums'), (Comment, 'thread__category__forums')):
+        posts = model.objects.filter(author__isnull=False).order_by()
+        for row in posts.values('author_id').annotate(net=Sum('score')):
+            totals[row['author_id']] = totals.get(row['author_id'], 0) + (row['net'] or 0)
+        for row in posts.filter(**{f'{path}__isnull': False}).values('author_id', forum=F(path)).annotate(net=Sum('score')):
+            key = (row['forum'], row['author_id'])
+            forums[key] = forums.get(key, 0) + (row['net'] or 0)
+    earned = UserAchievement.objects.order_by().values('user_id').annotate(points=Sum('achievement__points'))
+    for row in earned:
+        totals[row['user_id']] = totals.get(row['user_id'], 0) + (row['points'] or 0)
+
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=user_id, reputation=score) for user_id, score in totals.items()],
+        batch_size=500, update_conflicts=True, unique_fields=['user'], update_fields=['reputation'],
+    )
+    ForumReputation.objects.bulk_create(
+        [ForumReputation(forum_id=forum_id, user_id=user_id, score=score) for (forum_id, user_id), score in forums.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0012_achievement_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='reputation',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ForumReputation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.IntegerField(default=0)),
+                ('forum', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='forum.forum')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('forum', 'user'), name='forum_reputation_uniq')],
+            },
+        ),
+        migrations.RunPython(score_reputation, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:29
+
+import math
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.timezone import now
+
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+WEIGHTS = {'thread': 1.0, 'vote': 1.0, 'comment': 2.0, 'view': 0.1}
+
+
+def score_threads(apps, schema_editor):
+    # forum.trending.rescore as of this migration.
+    Thread = apps.get_model('forum', 'Thread')
+    ThreadVote = apps.get_model('forum', 'ThreadVote')
+    Comment = apps.get_model('forum', 'Comment')
+    tau = getattr(settings, 'TRENDING_HALF_LIFE', 24 * 60 * 60) / math.log(2)
+    since = now() - timedelta(days=7)
+
+    def log_weight(weight, at):
+        return math.log(weight) + (at - EPOCH).total_seconds() / tau
+
+    last = 0
+    while True:
+        threads = list(
+            Thread.objects.filter(pk__gt=last).order_by('pk').values_list('pk', 'created_at', 'views')[:2000]
+        )
+        if not threads:
+            return
+        first, last = threads[0][0], threads[-1][0]
+        events = {pk: [] for pk, _, _ in threads}
+        for thread_id, vote_type, voted_at in ThreadVote.objects.filter(
+            thread_id__gte=first, thread_id__lte=last,
+        ).values_list('thread_id', 'vote_type', 'voted_at'):
+            events[thread_id].append(('vote', 1 if vote_type == 'up' else -1, voted_at))
+        for thread_id, created_at in Comment.objects.filter(
+            thread_id__gte=first, thread_id__lte=last, is_deleted=False,
+        ).values_list('thread_id', 'created_at'):
+            events[thread_id].append(('comment', 1, created_at))
+
+        updates = []
+        for pk, created_at, views in threads:
+            base = log_weight(WEIGHTS['thread'], created_at)
+            terms, latest = [(1, base)], created_at
+            week_score = week_comments = 0
+            for kind, sign, at in events[pk]:
+                terms.append((sign, log_weight(WEIGHTS[kind], at)))
+                latest = max(latest, at)
+                if at >= since:
+                    week_score += sign if kind == 'vote' else 0
+                    week_comments += kind == 'comment'
+            if views:
+                terms.append((1, log_weight(views * WEIGHTS['view'], latest)))
+            top = max(x for _, x in terms)
+            total = sum(sign * math.exp(x - top) for sign, x in terms)
+            hot = top + math.log(total) if total > 0 else base
+            updates.append(Thread(pk=pk, hot=hot, week_score=week_score, week_comments=week_comments))
+        Thread.objects.bulk_update(updates, ['hot', 'week_score', 'week_comments'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0013_reputation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thread',
+            name='hot',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='week_comments',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='week_score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['created_at'], name='comment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-hot', '-id'], name='thread_live_hot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-week_score', '-id'], name='thread_live_week_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-week_comments', '-id'], name='thread_live_week_comments_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='threadvote',
+            index=models.Index(fields=['voted_at'], name='threadvote_voted_idx'),
+        ),
+        migrations.RunPython(score_threads, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
 from authentification.models import CustomUser
 
 class UserProfile(models.Model):
@@ -57,6 +59,29 @@ class Forum(models.Model):
     def __str__(self):
         return self.name
 
+# ----- Attachments -----
+
+class Blob(models.Model):
+    """
+    One stored attachment file, named by the SHA-256 of its content (see
+    ``forum.attachments``). ``refcount`` counts the threads and comments
+    pointing at it; blobs left at zero are collected after a grace period.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.BigIntegerField()
+    content_type = models.CharField(max_length=100)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    released_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['released_at'], name='blob_orphan_idx', condition=Q(refcount=0)),
+        ]
+
+    def __str__(self):
+        return self.sha256
+
 # ----- Threads -----
 
 class Thread(models.Model):
@@ -69,11 +94,20 @@ class Thread(models.Model):
 
     title = models.CharField(max_length=255)
     description = models.TextField()
-    attachment = models.FileField(upload_to='attachments/', null=True, blank=True)
+    attachment = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    attachment_name = models.CharField(max_length=255, blank=True)
     author = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, related_name='threads')
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='threads')
     tags = models.ManyToManyField(Tag, blank=True, related_name='threads')
     views = models.PositiveIntegerField(default=0)
+    upvotes = models.PositiveIntegerField(default=0)
+    downvotes = models.PositiveIntegerField(default=0)
+    score = models.IntegerField(default=0)
+    # Trending orderings, kept by forum.trending: time-decayed activity in
+    # log space, and net votes and comments over the last week.
+    hot = models.FloatField(default=0)
+    week_score = models.IntegerField(default=0)
+    week_comments = models.PositiveIntegerField(default=0)
     is_deleted = models.BooleanField(default=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -81,6 +115,39 @@ class Thread(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Pages of live threads, newest first, overall and per category.
+            models.Index(
+                fields=['-created_at', '-id'], name='thread_live_created_idx', condition=Q(is_deleted=False),
+            ),
+            models.Index(
+                fields=['category', '-created_at', '-id'], name='thread_live_cat_created_idx',
+                condition=Q(is_deleted=False),
+            ),
+            # Pages of live threads by each trending ordering.
+            models.Index(fields=['-hot', '-id'], name='thread_live_hot_idx', condition=Q(is_deleted=False)),
+            models.Index(
+                fields=['-week_score', '-id'], name='thread_live_week_score_idx', condition=Q(is_deleted=False),
+            ),
+            models.Index(
+                fields=['-week_comments', '-id'], name='thread_live_week_comments_idx',
+                condition=Q(is_deleted=False),
+            ),
+            # A user's own threads on the dashboard, deleted ones included.
+            models.Index(fields=['author', '-created_at', '-id'], name='thread_author_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        thread = super().from_db(db, field_names, values)
+        if 'category_id' in field_names:
+            # The category as loaded, so that a save can tell the thread moved.
+            thread._loaded_category_id = thread.category_id
+        if 'title' in field_names and 'category_id' in field_names:
+            # What the activity feed is scoped by, so an edit that leaves
+            # both alone does not re-scope it.
+            thread._loaded_scope = (thread.title, thread.category_id)
+        return thread
 
     def __str__(self):
         return self.title
@@ -101,13 +168,6 @@ class SavedThread(models.Model):
     class Meta:
         unique_together = ('user', 'thread')
 
-class ThreadEditHistory(models.Model):
-    user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True)
-    thread = models.ForeignKey(Thread, on_delete=models.CASCADE)
-    old_content = models.TextField()
-    new_content = models.TextField()
-    edited_at = models.DateTimeField(auto_now_add=True)
-
 class ThreadVote(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     thread = models.ForeignKey(Thread, on_delete=models.CASCADE)
@@ -116,6 +176,8 @@ class ThreadVote(models.Model):
 
     class Meta:
         unique_together = ('user', 'thread')
+        # The last week's votes, for the trending windows.
+        indexes = [models.Index(fields=['voted_at'], name='threadvote_voted_idx')]
 
 # ----- Polls -----
 
@@ -124,9 +186,13 @@ class Poll(models.Model):
     question = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['-created_at', '-id'], name='poll_created_idx')]
+
 class PollOption(models.Model):
     poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='options')
     text = models.CharField(max_length=255)
+    votes = models.PositiveIntegerField(default=0)
 
 class PollVote(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
@@ -143,25 +209,41 @@ class Comment(models.Model):
     poll = models.ForeignKey(Poll, on_delete=models.CASCADE, null=True, blank=True, related_name='comments')
     author = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, related_name='comments')
     parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='replies')
+    root = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='+')
     content = models.TextField()
-    attachment = models.FileField(upload_to='attachments/', null=True, blank=True)
+    attachment = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    attachment_name = models.CharField(max_length=255, blank=True)
     views = models.PositiveIntegerField(default=0)
+    upvotes = models.PositiveIntegerField(default=0)
+    downvotes = models.PositiveIntegerField(default=0)
+    score = models.IntegerField(default=0)
     is_deleted = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Top-level comments of a thread, oldest first (thread_detail).
+            # Deleted ones are included: their live replies are still shown.
+            models.Index(
+                fields=['thread', 'created_at', 'id'], name='comment_thread_top_idx',
+                condition=Q(parent__isnull=True),
+            ),
+            models.Index(fields=['author', '-created_at', '-id'], name='comment_author_created_idx'),
+            # The last week's comments, for the trending windows.
+            models.Index(fields=['created_at'], name='comment_created_idx'),
+        ]
 
     def __str__(self):
         return f"Comment by {self.author} on {self.thread.title}"
 
-class CommentEditHistory(models.Model):
-    user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True)
-    comment = models.ForeignKey(Comment, on_delete=models.CASCADE)
-    old_content = models.TextField()
-    new_content = models.TextField()
-    edited_at = models.DateTimeField(auto_now_add=True)
+    def save(self, *args, **kwargs):
+        # Replies remember their top-level comment so a page of top-level
+        # comments can load all of its replies with one query.
+        if self.parent_id and not self.root_id:
+            self.root_id = self.parent.root_id or self.parent_id
+        super().save(*args, **kwargs)
 
 class CommentVote(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
@@ -171,3 +253,205 @@ class CommentVote(models.Model):
 
     class Meta:
         unique_together = ('user', 'comment')
+
+# ----- Revisions -----
+
+class Revision(models.Model):
+    """
+    One version of a thread's description or a comment's content, numbered
+    from 0 (the original). Stored either whole (``is_snapshot``) or as a
+    delta from the previous revision, optionally zlib-compressed; see
+    ``forum.revisions``.
+    """
+    number = models.PositiveIntegerField()
+    user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, related_name='+')
+    created_at = models.DateTimeField(default=timezone.now)
+    is_snapshot = models.BooleanField()
+    is_compressed = models.BooleanField(default=False)
+    data = models.BinaryField()
+    length = models.PositiveIntegerField()
+
+    class Meta:
+        abstract = True
+
+
+class ThreadRevision(Revision):
+    thread = models.ForeignKey(Thread, on_delete=models.CASCADE, related_name='revisions')
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['thread', 'number'], name='thread_revision_number_uniq')]
+
+
+class CommentRevision(Revision):
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name='revisions')
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['comment', 'number'], name='comment_revision_number_uniq')]
+
+# ----- Search -----
+
+class SearchDocument(models.Model):
+    KIND_CHOICES = [
+        ('thread', 'Thread'),
+        ('comment', 'Comment'),
+        ('poll', 'Poll'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    thread = models.ForeignKey(Thread, on_delete=models.CASCADE, related_name='+')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    title = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+
+# ----- Activity feed -----
+
+class ActivityEvent(models.Model):
+    """
+    One entry of the recent-activity feed, written when a thread, comment or
+    poll is created, edited or deleted. Every event is stored once per scope
+    it shows up in: a global row (no forum, no tag) that also serves the
+    category feeds, plus one row per forum of the thread's category and one
+    per tag of the thread, so each feed is a single index range.
+    """
+    KIND_CHOICES = SearchDocument.KIND_CHOICES
+    VERB_CHOICES = [
+        ('created', 'Created'),
+        ('edited', 'Edited'),
+        ('deleted', 'Deleted'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    verb = models.CharField(max_length=10, choices=VERB_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    thread = models.ForeignKey(Thread, on_delete=models.CASCADE, related_name='+')
+    actor = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # The scope columns are covered by the feed indexes below.
+    category = models.ForeignKey(
+        Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_index=False,
+    )
+    forum = models.ForeignKey(Forum, on_delete=models.CASCADE, null=True, blank=True, related_name='+', db_index=False)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, null=True, blank=True, related_name='+', db_index=False)
+    title = models.CharField(max_length=255, blank=True)
+    summary = models.CharField(max_length=300, blank=True)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['-created_at', '-id'], name='activity_global_idx',
+                condition=Q(forum__isnull=True, tag__isnull=True),
+            ),
+            models.Index(
+                fields=['category', '-created_at', '-id'], name='activity_category_idx',
+                condition=Q(forum__isnull=True, tag__isnull=True),
+            ),
+            models.Index(
+                fields=['forum', '-created_at', '-id'], name='activity_forum_idx', condition=Q(forum__isnull=False),
+            ),
+            models.Index(
+                fields=['tag', '-created_at', '-id'], name='activity_tag_idx', condition=Q(tag__isnull=False),
+            ),
+            models.Index(fields=['kind', 'object_id'], name='activity_object_idx'),
+            # Pruning, across every scope.
+            models.Index(fields=['created_at'], name='activity_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} {self.verb}"
+
+# ----- Notifications -----
+
+class Notification(models.Model):
+    """
+    A new comment in a thread the user is subscribed to. Rows are written by
+    ``forum.notifications.notify_subscribers`` with one INSERT ... SELECT.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='notifications', db_index=False)
+    thread = models.ForeignKey(Thread, on_delete=models.CASCADE, related_name='+')
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()
+    read_at = models.DateTimeField(null=True, blank=True)
+    emailed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='notification_user_idx'),
+            # Notifications still waiting for a digest.
+            models.Index(
+                fields=['user', 'id'], name='notification_pending_idx',
+                condition=Q(read_at__isnull=True, emailed_at__isnull=True),
+            ),
+        ]
+
+class NotificationInbox(models.Model):
+    """
+    Per-user unread counter and digest bookkeeping, so the count is one row
+    read rather than a COUNT over the user's notifications.
+    """
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='notification_inbox')
+    unread = models.PositiveIntegerField(default=0)
+    last_digest_at = models.DateTimeField(null=True, blank=True)
+
+
+# ----- Dashboard -----
+
+class UserStats(models.Model):
+    """
+    Per-user activity counters for the dashboard, moved by
+    ``forum.dashboard`` on every write that affects them instead of counted
+    on each visit. Threads, comments and polls count the user's own posts,
+    soft-deleted ones included; votes are those received on them.
+    ``reputation`` is the net votes received plus the points of the user's
+    achievements, ranked by ``forum.reputation``.
+    """
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    threads = models.PositiveIntegerField(default=0)
+    comments = models.PositiveIntegerField(default=0)
+    polls = models.PositiveIntegerField(default=0)
+    upvotes_received = models.PositiveIntegerField(default=0)
+    downvotes_received = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(null=True, blank=True)
+    reputation = models.IntegerField(default=0)
+
+    @property
+    def votes_received(self):
+        return self.upvotes_received + self.downvotes_received
+
+    @property
+    def score(self):
+        return self.upvotes_received - self.downvotes_received
+
+
+class UserCategoryStats(models.Model):
+    """
+    Threads a user started per category, for category-scoped achievement
+    rules. Moved with the thread counter in ``UserStats``.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+', db_index=False)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    threads = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category'], name='user_category_stats_uniq'),
+        ]
+
+
+class ForumReputation(models.Model):
+    """
+    Net votes a user received on threads and comments in one forum's
+    categories: the per-forum counterpart of ``UserStats.reputation``.
+    """
+    forum = models.ForeignKey(Forum, on_delete=models.CASCADE, related_name='+')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    score = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['forum', 'user'], name='forum_reputation_uniq'),
+        ]
@@ -0,0 +1,158 @@
+"""
+Thread subscriptions turned into notifications: a new comment fans out to
+every subscriber with one INSERT ... SELECT, unread counts are kept in
+``NotificationInbox``, and pending notifications are batched into one
+email digest per user and interval.
+"""
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+from django.template.loader import render_to_string
+from django.utils.timezone import now
+
+from forum.models import Notification, NotificationInbox, ThreadSubscription
+
+DIGEST_ITEMS = 50
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def notify_subscribers(comment):
+    """
+    Notify every subscriber of the comment's thread but its author. Two
+    statements whatever the number of subscribers: the notifications, then
+    the unread counters (inbox rows are created on first use).
+    """
+    subscribers = (
+        f"FROM {_table(ThreadSubscription)} WHERE thread_id = %s AND user_id <> %s"
+        if comment.author_id else f"FROM {_table(ThreadSubscription)} WHERE thread_id = %s"
+    )
+    params = [comment.thread_id, comment.author_id] if comment.author_id else [comment.thread_id]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {_table(Notification)} (user_id, thread_id, comment_id, created_at) "
+            f"SELECT user_id, %s, %s, %s {subscribers}",
+            [comment.thread_id, comment.pk, comment.created_at, *params],
+        )
+        if not cursor.rowcount:
+            return 0
+        notified = cursor.rowcount
+        inbox = _table(NotificationInbox)
+        # "WHERE 1 = 1" keeps SQLite from reading ON CONFLICT as a join clause.
+        cursor.execute(
+            f"INSERT INTO {inbox} (user_id, unread) SELECT user_id, 1 {subscribers} AND 1 = 1 "
+            f"ON CONFLICT (user_id) DO UPDATE SET unread = {inbox}.unread + 1",
+            params,
+        )
+    return notified
+
+
+def unread_count(user):
+    return NotificationInbox.objects.filter(user=user).values_list('unread', flat=True).first() or 0
+
+
+def mark_read(user, notification_ids=None):
+    """
+    Mark the user's unread notifications (all, or just ``notification_ids``)
+    as read and take them off the counter. Returns how many changed.
+    """
+    notifications = Notification.objects.filter(user=user, read_at__isnull=True)
+    if notification_ids is not None:
+        notifications = notifications.filter(pk__in=notification_ids)
+    changed = notifications.update(read_at=now())
+    if changed:
+        inbox = NotificationInbox.objects.filter(user=user)
+        if notification_ids is None:
+            inbox.update(unread=0)
+        else:
+            inbox.update(unread=Greatest(F('unread') - changed, 0))
+    return changed
+
+
+def rebuild_inbox_counters():
+    """
+    Recount every inbox from the notifications, for drift left behind by
+    deleted comments or threads (their notifications cascade away).
+    """
+    NotificationInbox.objects.update(unread=0)
+    counts = (
+        Notification.objects.filter(read_at__isnull=True)
+        .values('user_id').annotate(unread=Count('id')).order_by()
+    )
+    NotificationInbox.objects.bulk_create(
+        [NotificationInbox(user_id=row['user_id'], unread=row['unread']) for row in counts],
+        batch_size=500, update_conflicts=True, unique_fields=['user'], update_fields=['unread'],
+    )
+
+
+# ----- Digests -----
+
+def due_notifications(interval, at=None):
+    """
+    Unread, not yet emailed notifications of every user whose last digest is
+    at least ``interval`` old.
+    """
+    cutoff = (at or now()) - interval
+    return Notification.objects.filter(read_at__isnull=True, emailed_at__isnull=True).filter(
+        Q(user__notification_inbox__isnull=True)
+        | Q(user__notification_inbox__last_digest_at__isnull=True)
+        | Q(user__notification_inbox__last_digest_at__lte=cutoff)
+    )
+
+
+def render_digest(user, notifications):
+    threads = [
+        (thread, list(items))
+        for thread, items in groupby(notifications[:DIGEST_ITEMS], key=lambda notification: notification.thread)
+    ]
+    body = render_to_string('emails/notification_digest.txt', {
+        'user': user,
+        'threads': threads,
+        'more': max(len(notifications) - DIGEST_ITEMS, 0),
+    })
+    subject = f"{len(notifications)} new comment(s) in threads you follow"
+    return EmailMessage(subject, body, to=[user.email])
+
+
+def send_digests(interval=None, batch_size=100, email_connection=None):
+    """
+    Send one digest per user with due notifications, ``batch_size`` users at
+    a time over one backend connection. Each batch is marked as emailed once
+    sent, which also takes it out of the next batch's query. Returns the
+    number of emails sent.
+    """
+    if interval is None:
+        interval = timedelta(seconds=getattr(settings, 'FORUM_NOTIFICATION_DIGEST_INTERVAL', 60 * 60))
+    due = due_notifications(interval)
+    email_connection = email_connection or get_connection()
+    sent = 0
+    while True:
+        user_ids = list(due.order_by('user_id').values_list('user_id', flat=True).distinct()[:batch_size])
+        if not user_ids:
+            return sent
+        notifications = (
+            due.filter(user_id__in=user_ids)
+            .select_related('user', 'thread', 'comment__author')
+            .order_by('user_id', 'thread_id', 'id')
+        )
+        messages, notification_ids = [], []
+        for user, items in groupby(notifications, key=lambda notification: notification.user):
+            items = list(items)
+            messages.append(render_digest(user, items))
+            notification_ids.extend(notification.pk for notification in items)
+        sent += email_connection.send_messages(messages) or 0
+
+        # Only what went out: comments posted meanwhile wait for the next run.
+        stamp = now()
+        Notification.objects.filter(pk__in=notification_ids).update(emailed_at=stamp)
+        NotificationInbox.objects.bulk_create(
+            [NotificationInbox(user_id=user_id, last_digest_at=stamp) for user_id in user_ids],
+            update_conflicts=True, unique_fields=['user'], update_fields=['last_digest_at'],
+        )
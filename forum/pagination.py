@@ -0,0 +1,129 @@
+import base64
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+
+DEFAULT_PAGE_SIZE = 20
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(direction, value, pk):
+    # repr() round-trips floats exactly; datetimes go as ISO 8601.
+    value = value.isoformat() if hasattr(value, 'isoformat') else repr(value)
+    raw = f"{direction}|{value}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, field):
+    """
+    ``(direction, value, pk)`` from ``cursor``, the value parsed by the
+    model ``field`` the pages are ordered on.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        direction, value, pk = raw.split('|')
+        if direction not in ('n', 'p'):
+            raise ValueError(direction)
+        value = field.to_python(value)
+        if value is None:
+            raise ValueError(raw)
+        return direction, value, int(pk)
+    except (ValueError, UnicodeDecodeError, ValidationError) as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, prev_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.next_url = None
+        self.prev_url = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Pages through ``queryset`` by ``(key, id)`` (``created_at`` unless told
+    otherwise; the key must be non-null) using WHERE clauses on the last row
+    seen instead of OFFSET, so every page costs the same single LIMIT query
+    no matter how deep it is.
+    """
+
+    def __init__(self, queryset, per_page=DEFAULT_PAGE_SIZE, descending=True, key='created_at'):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.descending = descending
+        self.key = key
+
+    def _after(self, value, pk, forward):
+        # "After" in display order: older rows for newest-first listings.
+        lookup = 'lt' if forward == self.descending else 'gt'
+        return Q(**{f'{self.key}__{lookup}': value}) | Q(**{self.key: value, f'id__{lookup}': pk})
+
+    def _ordered(self, forward):
+        if forward == self.descending:
+            return self.queryset.order_by(f'-{self.key}', '-id')
+        return self.queryset.order_by(self.key, 'id')
+
+    def page(self, cursor=None):
+        forward = True
+        queryset = self._ordered(forward)
+        if cursor:
+            direction, value, pk = decode_cursor(cursor, self.queryset.model._meta.get_field(self.key))
+            forward = direction == 'n'
+            queryset = self._ordered(forward).filter(self._after(value, pk, forward))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        has_next = has_more if forward else True
+        has_previous = bool(cursor) if forward else has_more
+        if not rows:
+            return KeysetPage(rows)
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor('n', getattr(rows[-1], self.key), rows[-1].pk) if has_next else None,
+            prev_cursor=encode_cursor('p', getattr(rows[0], self.key), rows[0].pk) if has_previous else None,
+        )
+
+
+def paginate(request, queryset, param='cursor', per_page=DEFAULT_PAGE_SIZE, descending=True, key='created_at'):
+    """
+    Return the keyset page selected by ``request.GET[param]``, with
+    ``next_url``/``prev_url`` that keep the rest of the query string.
+    """
+    try:
+        page = KeysetPaginator(queryset, per_page, descending, key).page(request.GET.get(param))
+    except InvalidCursor:
+        raise Http404("Invalid page cursor.")
+
+    for attr, cursor in (('next_url', page.next_cursor), ('prev_url', page.prev_cursor)):
+        if cursor:
+            query = request.GET.copy()
+            query[param] = cursor
+            setattr(page, attr, f"?{query.urlencode()}")
+    return page
@@ -0,0 +1,98 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F
+
+from forum.models import PollOption, PollVote
+
+TALLY_TIMEOUT = 60 * 60
+
+
+def _tally_key(poll_id):
+    return f"forum:poll-tally:{poll_id}"
+
+
+def invalidate_tally(poll_id):
+    cache.delete(_tally_key(poll_id))
+
+
+def cast_poll_vote(user, poll, option):
+    """
+    Make ``option`` the user's only vote in ``poll``, moving the per-option
+    counters in the same transaction. Returns False if nothing changed.
+    """
+    with transaction.atomic():
+        previous = list(
+            PollVote.objects.select_for_update()
+            .filter(user=user, option__poll=poll)
+            .values_list('option_id', flat=True)
+        )
+        if previous == [option.id]:
+            return False
+
+        stale = [option_id for option_id in previous if option_id != option.id]
+        if stale:
+            PollVote.objects.filter(user=user, option_id__in=stale).delete()
+            PollOption.objects.filter(id__in=stale).update(votes=F('votes') - 1)
+        if option.id not in previous:
+            PollVote.objects.create(user=user, option=option)
+            PollOption.objects.filter(id=option.id).update(votes=F('votes') + 1)
+        transaction.on_commit(lambda: invalidate_tally(poll.id))
+    return True
+
+
+class PollTally:
+    def __init__(self, options):
+        self.options = options
+        self.total = sum(votes for _, _, votes in options)
+
+    @property
+    def results(self):
+        return [
+            {
+                'option_id': option_id,
+                'text': text,
+                'votes': votes,
+                'percent': 100 * votes / self.total if self.total else 0,
+            }
+            for option_id, text, votes in self.options
+        ]
+
+
+def poll_tally(poll):
+    """
+    Per-option vote counts for ``poll``, read from the stored counters with
+    one query and cached until the next vote or option change.
+    """
+    key = _tally_key(poll.id)
+    options = cache.get(key)
+    if options is None:
+        options = list(PollOption.objects.filter(poll=poll).order_by('id').values_list('id', 'text', 'votes'))
+        cache.set(key, options, TALLY_TIMEOUT)
+    return PollTally(options)
+
+
+def rebuild_poll_counters(dry_run=False, batch_size=500):
+    """
+    Recount ``PollOption.votes`` from the vote table in one grouped query and
+    fix the options that drifted. Returns ``(option_id, stored, actual)``.
+    """
+    drift = []
+    with transaction.atomic():
+        drifted = (
+            PollOption.objects.order_by()
+            .annotate(actual=Count('pollvote'))
+            .exclude(votes=F('actual'))
+            .only('id', 'poll_id', 'votes')
+        )
+        pending = []
+        for option in drifted.iterator(chunk_size=batch_size):
+            drift.append((option.id, option.votes, option.actual))
+            option.votes = option.actual
+            pending.append(option)
+        if not dry_run and pending:
+            PollOption.objects.bulk_update(pending, ['votes'], batch_size=batch_size)
+
+    if not dry_run:
+        for poll_id in {option.poll_id for option in pending}:
+            invalidate_tally(poll_id)
+    return drift
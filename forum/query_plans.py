@@ -0,0 +1,106 @@
+"""
+The hot forum queries, each paired with the index it is meant to use, and an
+EXPLAIN-based check that the planner actually picks it. The querysets mirror
+the views (filters plus the keyset ordering from ``forum.pagination``).
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.timezone import now
+
+from forum.activity import feed
+from forum.comment_tree import top_level_comments
+from forum.models import Thread, ThreadVote, Comment, Poll, ThreadRevision, CommentRevision
+
+PAGE = 21
+
+
+def _newest(queryset):
+    return queryset.order_by('-created_at', '-id')[:PAGE]
+
+
+def _oldest(queryset):
+    return queryset.order_by('created_at', 'id')[:PAGE]
+
+
+def _by(key, queryset):
+    return queryset.order_by(f'-{key}', '-id')[:PAGE]
+
+
+def plan_checks():
+    """
+    ``(label, queryset, index name or names)`` for every query the indexes
+    exist for.
+    """
+    last_week = now() - timedelta(days=7)
+    return [
+        ('recent threads', _newest(Thread.objects.filter(created_at__gte=last_week, is_deleted=False)),
+         'thread_live_created_idx'),
+        ('threads in a category', _newest(Thread.objects.filter(category_id=1, is_deleted=False)),
+         'thread_live_cat_created_idx'),
+        ('dashboard threads', _newest(Thread.objects.filter(author_id=1)), 'thread_author_created_idx'),
+        ('thread top-level comments',
+         _oldest(top_level_comments(1)),
+         'comment_thread_top_idx'),
+        ('dashboard comments', _newest(Comment.objects.filter(author_id=1)), 'comment_author_created_idx'),
+        ('recent polls', _newest(Poll.objects.filter(created_at__gte=last_week)), 'poll_created_idx'),
+        # SQLite names the index behind a unique constraint itself.
+        ('thread revisions', ThreadRevision.objects.filter(thread_id=1).order_by('-number'),
+         ('thread_revision_number_uniq', 'sqlite_autoindex_forum_threadrevision_1')),
+        ('comment revisions', CommentRevision.objects.filter(comment_id=1).order_by('-number'),
+         ('comment_revision_number_uniq', 'sqlite_autoindex_forum_commentrevision_1')),
+        ('activity feed', _newest(feed()), 'activity_global_idx'),
+        ('category activity feed', _newest(feed(category=1)), 'activity_category_idx'),
+        ('forum activity feed', _newest(feed(forum=1)), 'activity_forum_idx'),
+        ('tag activity feed', _newest(feed(tag=1)), 'activity_tag_idx'),
+        # Either index works: a walk down the newest threads, or one range
+        # per category merged together.
+        ('forum threads',
+         _newest(Thread.objects.filter(Q(category__in=[1, 2, 3]) | Q(category__isnull=True), is_deleted=False)),
+         ('thread_live_created_idx', 'thread_live_cat_created_idx')),
+        ('hot forum threads',
+         _by('hot', Thread.objects.filter(Q(category__in=[1, 2, 3]) | Q(category__isnull=True), is_deleted=False)),
+         'thread_live_hot_idx'),
+        ('top threads this week', _by('week_score', Thread.objects.filter(is_deleted=False)),
+         'thread_live_week_score_idx'),
+        ('most discussed threads', _by('week_comments', Thread.objects.filter(is_deleted=False)),
+         'thread_live_week_comments_idx'),
+        ('trending window votes', ThreadVote.objects.filter(voted_at__gte=last_week).values('thread_id'),
+         'threadvote_voted_idx'),
+        ('trending window comments', Comment.objects.filter(created_at__gte=last_week).values('thread_id'),
+         'comment_created_idx'),
+    ]
+
+
+def explain(queryset):
+    """
+    The query plan as text. On PostgreSQL sequential scans are disabled for
+    the statement, so the answer is "can this index serve the query" rather
+    than "is a scan cheaper on today's tiny table".
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.explain()
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+
+def analyze():
+    """
+    Refresh the planner statistics. SQLite has none until ANALYZE runs and
+    then falls back to guesses that favour the plain FK indexes.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def check_plans():
+    """
+    Yield ``(label, index names, used, plan)`` for every entry of plan_checks().
+    """
+    for label, queryset, indexes in plan_checks():
+        indexes = (indexes,) if isinstance(indexes, str) else indexes
+        plan = explain(queryset)
+        yield label, indexes, any(index in plan for index in indexes), plan
@@ -0,0 +1,260 @@
+"""
+Reputation: net votes received on a user's threads and comments plus the
+points of their achievements, overall (``UserStats.reputation``) and per
+forum (``ForumReputation``, votes only, through the forum's categories).
+
+Scores are moved by the same writes that move the vote counters, each in
+one statement. Ranks come from an in-process ``Leaderboard`` per scope, an
+indexable skip list loaded from the score table with one query, so a rank
+or a page of the board is O(log n) rather than an ORDER BY over the whole
+table. Each process applies its own committed moves to its boards at once
+and reloads them from the table every ``LEADERBOARD_REFRESH_INTERVAL``
+seconds, or as soon as ``recompute`` publishes new totals.
+
+Moves the incremental path cannot see (a thread changing category, a forum
+changing categories, badges revoked or repriced) are put right by
+``recompute``, run nightly by the ``recompute_reputation`` command and per
+forum when a forum's categories change.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Sum
+
+from forum.models import Comment, Forum, ForumReputation, Thread, UserAchievement, UserStats
+from forum.skiplist import SkipList
+
+GENERATION_KEY = 'forum:reputation-generation'
+GLOBAL = None
+PAGE_SIZE = 25
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+# ----- Ranking -----
+
+class Leaderboard:
+    """
+    Users ordered by score, highest first (ties by user id). Ranks are
+    competition ranks: users with equal scores share one.
+    """
+
+    def __init__(self, scores=()):
+        self._index = SkipList()
+        self._scores = {}
+        self._lock = threading.Lock()
+        for user_id, score in scores:
+            self._scores[user_id] = score
+            self._index.insert((-score, user_id))
+
+    def __len__(self):
+        return len(self._index)
+
+    def score(self, user_id):
+        return self._scores.get(user_id)
+
+    def set(self, user_id, score):
+        with self._lock:
+            previous = self._scores.get(user_id)
+            if previous == score:
+                return
+            if previous is not None:
+                self._index.remove((-previous, user_id))
+            self._scores[user_id] = score
+            self._index.insert((-score, user_id))
+
+    def rank(self, user_id):
+        """
+        The user's 1-based rank, or None if they are not on the board.
+        """
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        # Everyone with a higher score sorts before (-score, 0).
+        return self._index.rank((-score, 0)) + 1
+
+    def page(self, start=0, count=25):
+        """
+        ``(rank, user_id, score)`` for ``count`` users from 0-based
+        position ``start``.
+        """
+        with self._lock:
+            keys = self._index.slice(start, count)
+            first = self._index.rank((keys[0][0], 0)) + 1 if keys else None
+        entries, rank, previous = [], first, None
+        for position, (negated, user_id) in enumerate(keys, start=start + 1):
+            if previous is not None and negated != previous:
+                rank = position
+            entries.append((rank, user_id, -negated))
+            previous = negated
+        return entries
+
+
+_boards = {}
+_boards_lock = threading.Lock()
+
+
+def _load(forum_id):
+    if forum_id is GLOBAL:
+        rows = UserStats.objects.values_list('user_id', 'reputation')
+    else:
+        rows = ForumReputation.objects.filter(forum_id=forum_id).values_list('user_id', 'score')
+    return Leaderboard(rows.iterator(chunk_size=5000))
+
+
+def _generation_key(forum_id):
+    return f"{GENERATION_KEY}:{'global' if forum_id is GLOBAL else forum_id}"
+
+
+def board(forum_id=GLOBAL):
+    """
+    This process's leaderboard for one forum, or the global one, loaded on
+    first use and reloaded when stale.
+    """
+    keys = (GENERATION_KEY, _generation_key(forum_id))
+    generations = cache.get_many(keys)
+    generation = tuple(generations.get(key) for key in keys)
+    entry = _boards.get(forum_id)
+    interval = getattr(settings, 'LEADERBOARD_REFRESH_INTERVAL', 60)
+    if entry is None or entry[1] != generation or time.monotonic() - entry[2] >= interval:
+        entry = (_load(forum_id), generation, time.monotonic())
+        with _boards_lock:
+            _boards[forum_id] = entry
+    return entry[0]
+
+
+def _publish(scores):
+    """
+    Apply ``{(forum_id, user_id): score}`` to the boards this process has
+    loaded, once the transaction that wrote them commits.
+    """
+    def apply():
+        for (forum_id, user_id), score in scores.items():
+            entry = _boards.get(forum_id)
+            if entry is not None:
+                entry[0].set(user_id, score)
+    if scores:
+        transaction.on_commit(apply)
+
+
+def forget_boards():
+    with _boards_lock:
+        _boards.clear()
+
+
+# ----- Incremental moves -----
+
+def global_moved(stats):
+    """
+    Publish the reputation in a ``forum.dashboard.adjust`` result.
+    """
+    if stats is not None and 'reputation' in stats:
+        _publish({(GLOBAL, stats['user_id']): stats['reputation']})
+
+
+def vote_moved(target_model, target_id, delta):
+    """
+    Move the per-forum scores of the author of a voted thread or comment by
+    ``delta``, in every forum holding the thread's category. One upsert.
+    """
+    if not delta:
+        return
+    scores = _table(ForumReputation)
+    thread, categories = _table(Thread), _table(Forum.categories.through)
+    if target_model is Thread:
+        source = f"FROM {thread} post JOIN {categories} fc ON fc.category_id = post.category_id"
+    else:
+        source = (
+            f"FROM {_table(Comment)} post JOIN {thread} t ON t.id = post.thread_id "
+            f"JOIN {categories} fc ON fc.category_id = t.category_id"
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {scores} (forum_id, user_id, score) "
+            f"SELECT fc.forum_id, post.author_id, %s {source} WHERE post.id = %s AND post.author_id IS NOT NULL "
+            f"ON CONFLICT (forum_id, user_id) DO UPDATE SET score = {scores}.score + excluded.score "
+            f"RETURNING forum_id, user_id, score",
+            [delta, target_id],
+        )
+        _publish({(forum_id, user_id): score for forum_id, user_id, score in cursor.fetchall()})
+
+
+def add_points(points):
+    """
+    Add ``{user_id: points}`` of newly earned achievements to reputation.
+    One UPDATE for any number of users.
+    """
+    points = {user_id: value for user_id, value in points.items() if value}
+    if not points:
+        return
+    stats = _table(UserStats)
+    cases = ' '.join(['WHEN %s THEN %s'] * len(points))
+    placeholders = ', '.join(['%s'] * len(points))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {stats} SET reputation = reputation + CASE user_id {cases} ELSE 0 END "
+            f"WHERE user_id IN ({placeholders}) RETURNING user_id, reputation",
+            [param for item in points.items() for param in item] + list(points),
+        )
+        _publish({(GLOBAL, user_id): reputation for user_id, reputation in cursor.fetchall()})
+
+
+# ----- Recompute -----
+
+def _net_votes(model, author='author_id', forum=None):
+    rows = model.objects.filter(author__isnull=False).order_by()
+    if forum is not None:
+        rows = rows.filter(**{f'{forum}__isnull': False})
+        return rows.values(author, forum_id=F(forum)).annotate(net=Sum('score'))
+    return rows.values(author).annotate(net=Sum('score'))
+
+
+def recompute(forum_ids=None, batch_size=500):
+    """
+    Recount reputation from the stored vote counters and the achievements
+    held: everything, or with ``forum_ids`` just those forums' scores.
+    Publishes the new totals to every process. Returns the number of
+    global and forum rows written.
+    """
+    forum_rows = {}
+    for model, path in ((Thread, 'category__forums'), (Comment, 'thread__category__forums')):
+        rows = _net_votes(model, forum=path)
+        if forum_ids is not None:
+            rows = rows.filter(**{f'{path}__in': forum_ids})
+        for row in rows.iterator(chunk_size=batch_size):
+            key = (row['forum_id'], row['author_id'])
+            forum_rows[key] = forum_rows.get(key, 0) + (row['net'] or 0)
+
+    global_rows = {}
+    if forum_ids is None:
+        for model in (Thread, Comment):
+            for row in _net_votes(model).iterator(chunk_size=batch_size):
+                global_rows[row['author_id']] = global_rows.get(row['author_id'], 0) + (row['net'] or 0)
+        earned = UserAchievement.objects.order_by().values('user_id').annotate(points=Sum('achievement__points'))
+        for row in earned.iterator(chunk_size=batch_size):
+            global_rows[row['user_id']] = global_rows.get(row['user_id'], 0) + (row['points'] or 0)
+
+    with transaction.atomic():
+        scoped = ForumReputation.objects.all() if forum_ids is None else ForumReputation.objects.filter(
+            forum_id__in=forum_ids,
+        )
+        scoped.delete()
+        ForumReputation.objects.bulk_create(
+            (ForumReputation(forum_id=forum_id, user_id=user_id, score=score)
+             for (forum_id, user_id), score in forum_rows.items()),
+            batch_size=batch_size,
+        )
+        if forum_ids is None:
+            UserStats.objects.update(reputation=0)
+            UserStats.objects.bulk_create(
+                (UserStats(user_id=user_id, reputation=score) for user_id, score in global_rows.items()),
+                batch_size=batch_size, update_conflicts=True, unique_fields=['user'], update_fields=['reputation'],
+            )
+        keys = [GENERATION_KEY] if forum_ids is None else [_generation_key(forum_id) for forum_id in forum_ids]
+        transaction.on_commit(lambda: cache.set_many(dict.fromkeys(keys, time.time_ns()), None))
+    return len(global_rows), len(forum_rows)
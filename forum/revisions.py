@@ -0,0 +1,223 @@
+"""
+Edit history as a revision store: each edit appends the new text as a
+delta from the previous revision, with a full snapshot every
+``FORUM_REVISION_SNAPSHOT_INTERVAL`` revisions (and whenever a delta would
+not be smaller), so reading any revision takes one range query and at most
+that many deltas. Payloads are zlib-compressed when that saves space.
+
+A delta is a JSON list over the previous text's word tokens: ``[i, j]``
+copies tokens ``i`` to ``j``, a string inserts itself. Diffs between
+revisions are only computed when a diff page is opened.
+"""
+import json
+import re
+import zlib
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from forum.models import CommentRevision, ThreadRevision
+
+_TOKEN = re.compile(r'\S+\s*|\s+')
+
+# Payloads shorter than this are not worth a compression attempt.
+COMPRESS_MIN = 64
+
+STORES = {
+    'thread': (ThreadRevision, 'thread', 'description'),
+    'comment': (CommentRevision, 'comment', 'content'),
+}
+
+
+def snapshot_interval():
+    return getattr(settings, 'FORUM_REVISION_SNAPSHOT_INTERVAL', 10)
+
+
+def tokens(text):
+    return _TOKEN.findall(text)
+
+
+# ----- Encoding -----
+
+def make_delta(old, new):
+    old_tokens, new_tokens = tokens(old), tokens(new)
+    ops = []
+    matcher = SequenceMatcher(None, old_tokens, new_tokens)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif tag in ('replace', 'insert'):
+            ops.append(''.join(new_tokens[j1:j2]))
+    return ops
+
+
+def apply_delta(old, ops):
+    old_tokens = tokens(old)
+    return ''.join(''.join(old_tokens[op[0]:op[1]]) if isinstance(op, list) else op for op in ops)
+
+
+def encode(content, previous=None, snapshot=False, compress=None):
+    """
+    ``(is_snapshot, is_compressed, data)`` for storing ``content`` after
+    ``previous`` (None for the first revision).
+    """
+    if compress is None:
+        compress = getattr(settings, 'FORUM_REVISION_COMPRESS', True)
+    data = content.encode()
+    is_snapshot = True
+    if previous is not None and not snapshot:
+        delta = json.dumps(make_delta(previous, content), ensure_ascii=False, separators=(',', ':')).encode()
+        if len(delta) < len(data):
+            data, is_snapshot = delta, False
+    if compress and len(data) >= COMPRESS_MIN:
+        packed = zlib.compress(data, 6)
+        if len(packed) < len(data):
+            return is_snapshot, True, packed
+    return is_snapshot, False, data
+
+
+def decode(is_snapshot, is_compressed, data, previous):
+    raw = zlib.decompress(data) if is_compressed else bytes(data)
+    if is_snapshot:
+        return raw.decode()
+    return apply_delta(previous, json.loads(raw))
+
+
+def revision_fields(number, content, previous, **extra):
+    """
+    The stored fields of revision ``number`` holding ``content``.
+    """
+    is_snapshot, is_compressed, data = encode(
+        content, previous, snapshot=previous is None or number % snapshot_interval() == 0,
+    )
+    return dict(
+        number=number, is_snapshot=is_snapshot, is_compressed=is_compressed, data=data, length=len(content),
+        **extra,
+    )
+
+
+def build(model, field, parent_id, number, content, previous, **extra):
+    return model(**{f'{field}_id': parent_id}, **revision_fields(number, content, previous, **extra))
+
+
+# ----- Reading -----
+
+def _chain(model, field, parent_id, number, base):
+    """
+    The revisions from the last snapshot at or before ``base`` up to
+    ``number``, in one query.
+    """
+    latest_snapshot = model.objects.filter(
+        **{field: OuterRef(field)}, is_snapshot=True, number__lte=base,
+    ).order_by('-number').values('number')[:1]
+    return list(
+        model.objects.filter(**{field: parent_id}, number__lte=number, number__gte=Subquery(latest_snapshot))
+        .order_by('number').values_list('number', 'is_snapshot', 'is_compressed', 'data')
+    )
+
+
+def contents(kind, parent_id, number, base=None):
+    """
+    ``{revision number: text}`` for the revisions up to ``number``, starting
+    from the snapshot that ``base`` (default: ``number``) is based on.
+    """
+    model, field, _ = STORES[kind]
+    texts, previous = {}, None
+    base = number if base is None else base
+    for revision, is_snapshot, is_compressed, data in _chain(model, field, parent_id, number, base):
+        previous = texts[revision] = decode(is_snapshot, is_compressed, data, previous)
+    return texts
+
+
+def content_at(kind, parent_id, number):
+    """
+    The text of revision ``number``, or None if there is no such revision.
+    """
+    return contents(kind, parent_id, number).get(number)
+
+
+def history(kind, parent_id):
+    """
+    The revisions of one thread or comment, newest first, without payloads.
+    """
+    model, field, _ = STORES[kind]
+    return model.objects.filter(**{field: parent_id}).defer('data').select_related('user').order_by('-number')
+
+
+def diff(old, new):
+    """
+    ``[(op, text), ...]`` with op ``equal``, ``delete`` or ``insert``,
+    turning ``old`` into ``new`` word by word.
+    """
+    old_tokens, new_tokens = tokens(old), tokens(new)
+    segments = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, old_tokens, new_tokens).get_opcodes():
+        if tag == 'equal':
+            segments.append(('equal', ''.join(old_tokens[i1:i2])))
+            continue
+        if i2 > i1:
+            segments.append(('delete', ''.join(old_tokens[i1:i2])))
+        if j2 > j1:
+            segments.append(('insert', ''.join(new_tokens[j1:j2])))
+    return segments
+
+
+def revision_diff(kind, parent_id, number):
+    """
+    ``(old text, new text, segments)`` for revision ``number`` against the
+    one before it, or None if there is no such revision. One query.
+    """
+    texts = contents(kind, parent_id, number, base=max(number - 1, 0))
+    if number not in texts:
+        return None
+    old, new = texts.get(number - 1, ''), texts[number]
+    return old, new, diff(old, new)
+
+
+# ----- Writing -----
+
+def record_edit(kind, obj, old, new, user):
+    """
+    Append ``new`` to the history of ``obj`` before it is saved with it.
+    The first edit also stores the original; if the object was changed
+    without going through here, its current text ``old`` is stored first so
+    that the chain stays exact. Returns the new revision, or None if
+    nothing changed.
+    """
+    if old == new:
+        return None
+    model, field, _ = STORES[kind]
+    with transaction.atomic():
+        last = model.objects.filter(**{field: obj.pk}).order_by('-number').values_list('number', flat=True).first()
+        rows = []
+        if last is None:
+            rows.append(build(model, field, obj.pk, 0, old, None, user_id=obj.author_id, created_at=obj.created_at))
+            number = 1
+        else:
+            stored = content_at(kind, obj.pk, last)
+            number = last + 1
+            if stored != old:
+                rows.append(build(model, field, obj.pk, number, old, stored, user=None))
+                number += 1
+        rows.append(build(model, field, obj.pk, number, new, old, user=user))
+        model.objects.bulk_create(rows)
+    return rows[-1]
+
+
+def convert(original, edits, **original_extra):
+    """
+    Revision fields for a history kept as ``(old, new, user_id, edited_at)``
+    edits, in order, after ``original``. An edit whose old text is not the
+    text before it gets a revision of its own, so every text is kept.
+    """
+    rows = [revision_fields(0, original, None, **original_extra)]
+    current = original
+    for old, new, user_id, edited_at in edits:
+        if old != current:
+            rows.append(revision_fields(len(rows), old, current, user_id=None, created_at=edited_at))
+            current = old
+        rows.append(revision_fields(len(rows), new, current, user_id=user_id, created_at=edited_at))
+        current = new
+    return rows
@@ -0,0 +1,279 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from forum.models import Thread, Comment, Poll, SearchDocument
+
+FTS_TABLE = 'forum_searchdocument_fts'
+PG_VECTOR = "to_tsvector('english', forum_searchdocument.title || ' ' || forum_searchdocument.body)"
+
+RESULTS_PER_PAGE = 20
+MAX_PAGES = 50
+
+
+# ----- Documents -----
+
+def thread_document(thread):
+    return SearchDocument(
+        kind='thread', object_id=thread.pk, thread_id=thread.pk, category_id=thread.category_id,
+        title=thread.title, body=thread.description, created_at=thread.created_at,
+    )
+
+
+def comment_document(comment, category_id):
+    return SearchDocument(
+        kind='comment', object_id=comment.pk, thread_id=comment.thread_id, category_id=category_id,
+        title='', body=comment.content, created_at=comment.created_at,
+    )
+
+
+def poll_document(poll, category_id, options):
+    return SearchDocument(
+        kind='poll', object_id=poll.pk, thread_id=poll.thread_id, category_id=category_id,
+        title=poll.question, body='\n'.join(option.text for option in options), created_at=poll.created_at,
+    )
+
+
+def save_documents(documents):
+    """
+    Insert or refresh ``documents`` in one statement per batch.
+    """
+    SearchDocument.objects.bulk_create(
+        documents,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['kind', 'object_id'],
+        update_fields=['thread', 'category', 'title', 'body', 'created_at'],
+    )
+
+
+def remove_documents(kind, object_ids):
+    SearchDocument.objects.filter(kind=kind, object_id__in=object_ids).delete()
+
+
+def index_thread(thread):
+    if thread.is_deleted:
+        remove_documents('thread', [thread.pk])
+        return
+    save_documents([thread_document(thread)])
+    # Comments and polls are filtered by their thread's category.
+    SearchDocument.objects.filter(thread_id=thread.pk).exclude(category_id=thread.category_id).update(
+        category_id=thread.category_id
+    )
+
+
+def index_comment(comment):
+    if comment.is_deleted:
+        remove_documents('comment', [comment.pk])
+        return
+    category_id = Thread.objects.filter(pk=comment.thread_id).values_list('category_id', flat=True).first()
+    save_documents([comment_document(comment, category_id)])
+
+
+def index_poll(poll):
+    category_id = Thread.objects.filter(pk=poll.thread_id).values_list('category_id', flat=True).first()
+    save_documents([poll_document(poll, category_id, poll.options.all())])
+
+
+def sync_document(kind, pk):
+    """
+    Bring the search document for one object in line with the database,
+    removing it if the object is gone or soft-deleted.
+    """
+    if kind == 'thread':
+        thread = Thread.objects.filter(pk=pk).first()
+        if thread is None:
+            remove_documents('thread', [pk])
+        else:
+            index_thread(thread)
+    elif kind == 'comment':
+        comment = Comment.objects.filter(pk=pk).first()
+        if comment is None:
+            remove_documents('comment', [pk])
+        else:
+            index_comment(comment)
+    elif kind == 'poll':
+        poll = Poll.objects.filter(pk=pk).first()
+        if poll is None:
+            remove_documents('poll', [pk])
+        else:
+            index_poll(poll)
+
+
+# ----- Backends -----
+
+class SearchResults:
+    def __init__(self, documents, page, has_next):
+        self.documents = documents
+        self.page = page
+        self.has_next = has_next
+
+    @property
+    def has_previous(self):
+        return self.page > 1
+
+    def __iter__(self):
+        return iter(self.documents)
+
+    def __len__(self):
+        return len(self.documents)
+
+
+class BaseSearchBackend:
+    """
+    Ranks ``SearchDocument`` rows against a query. Subclasses implement
+    ``match`` to restrict and order a queryset by relevance.
+    """
+
+    def match(self, queryset, query):
+        raise NotImplementedError
+
+    def search(self, query, forum=None, category=None, tag=None, page=1, per_page=RESULTS_PER_PAGE):
+        page = max(1, min(int(page), MAX_PAGES))
+        queryset = SearchDocument.objects.filter(thread__is_deleted=False).select_related('thread')
+        if forum:
+            queryset = queryset.filter(Q(category__forums__id=forum) | Q(category__isnull=True))
+        if category:
+            queryset = queryset.filter(category_id=category)
+        if tag:
+            queryset = queryset.filter(thread__tags__id=tag)
+
+        queryset = self.match(queryset, query)
+        if queryset is None:
+            return SearchResults([], page, False)
+        start = (page - 1) * per_page
+        documents = list(queryset[start:start + per_page + 1])
+        return SearchResults(documents[:per_page], page, len(documents) > per_page and page < MAX_PAGES)
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    SQLite FTS5 index kept in sync with ``forum_searchdocument`` by triggers
+    (see migration 0004), ranked with bm25.
+    """
+
+    @staticmethod
+    def fts_query(query):
+        # Quote every word so user input can never be read as FTS5 syntax,
+        # and let the last one match as a prefix.
+        words = re.findall(r'\w+', query)
+        if not words:
+            return None
+        terms = [f'"{word}"' for word in words]
+        terms[-1] += '*'
+        return ' '.join(terms)
+
+    def match(self, queryset, query):
+        fts_query = self.fts_query(query)
+        if fts_query is None:
+            return None
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = forum_searchdocument.id', f'{FTS_TABLE} MATCH %s'],
+            params=[fts_query],
+            select={'rank': f'bm25({FTS_TABLE}, 2.0, 1.0)'},
+            order_by=['rank', 'id'],
+        )
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Postgres full-text search over a GIN expression index on the document
+    tsvector (see migration 0004), ranked with ts_rank.
+    """
+
+    def match(self, queryset, query):
+        if not query.strip():
+            return None
+        return queryset.extra(
+            where=[f"{PG_VECTOR} @@ plainto_tsquery('english', %s)"],
+            params=[query],
+            select={'rank': f"ts_rank({PG_VECTOR}, plainto_tsquery('english', %s))"},
+            select_params=[query],
+            order_by=['-rank', 'id'],
+        )
+
+
+class BasicSearchBackend(BaseSearchBackend):
+    """
+    Unranked substring matching for databases without a full-text backend.
+    """
+
+    def match(self, queryset, query):
+        words = query.split()
+        if not words:
+            return None
+        for word in words:
+            queryset = queryset.filter(Q(title__icontains=word) | Q(body__icontains=word))
+        return queryset.order_by('-created_at', '-id')
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTSBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+@lru_cache(maxsize=None)
+def _backend_class(path, vendor):
+    if path:
+        return import_string(path)
+    return VENDOR_BACKENDS.get(vendor, BasicSearchBackend)
+
+
+def get_backend():
+    """
+    The backend named by ``FORUM_SEARCH_BACKEND``, or the best one for the
+    default database.
+    """
+    return _backend_class(getattr(settings, 'FORUM_SEARCH_BACKEND', None), connection.vendor)()
+
+
+def search(query, **filters):
+    return get_backend().search(query, **filters)
+
+
+# ----- Bulk indexing -----
+
+def reindex(chunk_size=1000):
+    """
+    Rebuild every search document, streaming source rows in chunks so memory
+    stays bounded. Yields ``(kind, count)`` after each chunk.
+    """
+    threads = Thread.objects.filter(is_deleted=False).order_by('pk')
+    for chunk in _chunks(threads.iterator(chunk_size=chunk_size), chunk_size):
+        save_documents([thread_document(thread) for thread in chunk])
+        yield 'thread', len(chunk)
+
+    comments = (
+        Comment.objects.filter(is_deleted=False, thread__is_deleted=False)
+        .select_related('thread').only('pk', 'thread_id', 'thread__category_id', 'content', 'created_at')
+        .order_by('pk')
+    )
+    for chunk in _chunks(comments.iterator(chunk_size=chunk_size), chunk_size):
+        save_documents([comment_document(comment, comment.thread.category_id) for comment in chunk])
+        yield 'comment', len(chunk)
+
+    polls = (
+        Poll.objects.filter(thread__is_deleted=False)
+        .select_related('thread').prefetch_related('options')
+        .order_by('pk')
+    )
+    for chunk in _chunks(polls.iterator(chunk_size=chunk_size), chunk_size):
+        save_documents([poll_document(poll, poll.thread.category_id, poll.options.all()) for poll in chunk])
+        yield 'poll', len(chunk)
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
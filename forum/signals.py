@@ -0,0 +1,399 @@
+from copy import copy
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save, m2m_changed
+from django.dispatch import receiver
+from django.utils.timezone import now
+
+from forum import achievements, activity, attachments, dashboard, live, reputation, tasks, trending
+from forum.fragments import invalidate_fragments
+from authentification.models import CustomUser
+from GroupPortal import images
+from forum.models import (
+    Category, Forum, Thread, Comment, Poll, PollOption, PollVote, ThreadVote, CommentVote, UserProfile, Achievement,
+)
+from forum.polls import invalidate_tally
+
+
+def _reindex_on_commit(kind, pk):
+    # Queued in the writer's transaction and run after it commits, so
+    # cascades and rolled-back writes never leave stale or dangling search
+    # documents behind.
+    tasks.sync_search_document.delay(kind, pk)
+
+
+@receiver(post_save, sender=Thread)
+@receiver(post_delete, sender=Thread)
+def reindex_thread(sender, instance, **kwargs):
+    _reindex_on_commit('thread', instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def reindex_comment(sender, instance, **kwargs):
+    _reindex_on_commit('comment', instance.pk)
+
+
+@receiver(post_save, sender=Poll)
+@receiver(post_delete, sender=Poll)
+def reindex_poll(sender, instance, **kwargs):
+    _reindex_on_commit('poll', instance.pk)
+
+
+@receiver(post_save, sender=PollOption)
+@receiver(post_delete, sender=PollOption)
+def reindex_poll_options(sender, instance, **kwargs):
+    _reindex_on_commit('poll', instance.poll_id)
+    transaction.on_commit(lambda: invalidate_tally(instance.poll_id))
+
+
+# ----- Template fragments -----
+# Saves (soft deletes included) retire the object's cached fragments. Votes
+# move the counters with UPDATE ... F(), which bypasses updated_at, so they
+# retire their target's fragments too.
+
+def _invalidate_on_commit(kind, pk):
+    transaction.on_commit(lambda: invalidate_fragments(kind, pk))
+
+
+@receiver(post_save, sender=Thread)
+def invalidate_thread_fragments(sender, instance, **kwargs):
+    _invalidate_on_commit('thread', instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def invalidate_comment_fragments(sender, instance, **kwargs):
+    _invalidate_on_commit('comment', instance.pk)
+
+
+@receiver(post_save, sender=Poll)
+def invalidate_poll_fragments(sender, instance, **kwargs):
+    _invalidate_on_commit('poll', instance.pk)
+
+
+# Fragments render the author's name and picture and the category's name.
+# Logins save the user with update_fields=['last_login'], which changes
+# neither and so keeps the fragments.
+_RENDERED_USER_FIELDS = {'username', 'profile_picture'}
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_user_fragments(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or _RENDERED_USER_FIELDS & set(update_fields):
+        _invalidate_on_commit('user', instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def invalidate_category_fragments(sender, instance, **kwargs):
+    _invalidate_on_commit('category', instance.pk)
+
+
+@receiver(post_save, sender=ThreadVote)
+@receiver(post_delete, sender=ThreadVote)
+def invalidate_voted_thread(sender, instance, **kwargs):
+    _invalidate_on_commit('thread', instance.thread_id)
+
+
+@receiver(post_save, sender=CommentVote)
+@receiver(post_delete, sender=CommentVote)
+def invalidate_voted_comment(sender, instance, **kwargs):
+    _invalidate_on_commit('comment', instance.comment_id)
+
+
+# ----- Activity feed -----
+# Creates, edits and soft deletes append to the feed once the write commits.
+# Hard deletes of threads cascade to their events; removed comments and polls
+# are purged explicitly. Tag and forum-category changes re-scope the copies.
+
+def _record_on_commit(kind, instance, created):
+    if created:
+        verb = 'created'
+    else:
+        verb = 'deleted' if getattr(instance, 'is_deleted', False) else 'edited'
+    transaction.on_commit(lambda: activity.record(kind, verb, instance))
+
+
+@receiver(post_save, sender=Thread)
+def record_thread_activity(sender, instance, created, **kwargs):
+    _record_on_commit('thread', instance, created)
+    scope = (instance.title, instance.category_id)
+    title, category_id = getattr(instance, '_loaded_scope', scope)
+    if not created and (title, category_id) != scope:
+        moved = category_id != instance.category_id
+        transaction.on_commit(lambda: activity.rescope_thread(instance, moved))
+    instance._loaded_scope = scope
+
+
+@receiver(post_save, sender=Comment)
+def record_comment_activity(sender, instance, created, **kwargs):
+    _record_on_commit('comment', instance, created)
+
+
+@receiver(post_save, sender=Poll)
+def record_poll_activity(sender, instance, created, **kwargs):
+    _record_on_commit('poll', instance, created)
+
+
+@receiver(post_delete, sender=Comment)
+def purge_comment_activity(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: activity.remove_events('comment', [pk]))
+
+
+@receiver(post_delete, sender=Poll)
+def purge_poll_activity(sender, instance, **kwargs):
+    # A copy keeps the primary key, which the delete clears afterwards.
+    poll = copy(instance)
+    transaction.on_commit(lambda: activity.record('poll', 'deleted', poll))
+
+
+@receiver(m2m_changed, sender=Thread.tags.through)
+def rescope_thread_activity(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        # No pk_set: everything on the cleared side goes.
+        scope = {'tag_ids': [instance.pk]} if reverse else {'thread_ids': [instance.pk]}
+        transaction.on_commit(lambda: activity.remove_tag_copies(**scope))
+        return
+    if not pk_set:
+        return
+    thread_ids, tag_ids = (list(pk_set), [instance.pk]) if reverse else ([instance.pk], list(pk_set))
+    update = activity.add_tag_copies if action == 'post_add' else activity.remove_tag_copies
+    transaction.on_commit(lambda: update(thread_ids, tag_ids))
+
+
+@receiver(m2m_changed, sender=Forum.categories.through)
+def rescope_forum_activity(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    for forum_id in (pk_set or ()) if reverse else [instance.pk]:
+        transaction.on_commit(lambda forum_id=forum_id: activity.refresh_forum(forum_id))
+
+
+# ----- Notifications -----
+
+@receiver(post_save, sender=Comment)
+def notify_thread_subscribers(sender, instance, created, **kwargs):
+    if created:
+        tasks.notify_comment_subscribers.enqueue([instance.pk], key=f'notify-comment:{instance.pk}')
+
+
+# ----- Attachments -----
+# Hard deletes (cascades included) give their blob reference back in the
+# deleting transaction; soft-deleted posts keep theirs.
+
+@receiver(post_delete, sender=Thread)
+@receiver(post_delete, sender=Comment)
+def release_attachment(sender, instance, **kwargs):
+    attachments.release(instance.attachment_id)
+
+
+# ----- Image derivatives -----
+# Rendered in the background after an upload. Users are saved on every
+# login, so only images with derivatives missing are queued.
+
+IMAGE_FIELDS = {UserProfile: 'avatar', CustomUser: 'profile_picture', Achievement: 'badge_image'}
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_save, sender=CustomUser)
+@receiver(post_save, sender=Achievement)
+def render_thumbnails(sender, instance, **kwargs):
+    name = getattr(instance, IMAGE_FIELDS[sender]).name
+    if name and images.targets(name):
+        tasks.render_thumbnails.enqueue([name], key=f'thumbnails:{name}')
+
+
+# ----- Live updates -----
+
+@receiver(post_save, sender=Comment)
+def push_new_comment(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: live.publish_comment(instance))
+
+
+@receiver(post_save, sender=ThreadVote)
+@receiver(post_delete, sender=ThreadVote)
+def push_thread_score(sender, instance, **kwargs):
+    transaction.on_commit(lambda: live.publish_score('thread', instance.thread_id))
+
+
+@receiver(post_save, sender=CommentVote)
+@receiver(post_delete, sender=CommentVote)
+def push_comment_score(sender, instance, **kwargs):
+    transaction.on_commit(lambda: live.publish_score('comment', instance.comment_id))
+
+
+# cast_poll_vote always saves the new vote, so post_save is enough; a
+# post_delete receiver would also make every vote deletion fetch its rows.
+@receiver(post_save, sender=PollVote)
+def push_poll_tally(sender, instance, **kwargs):
+    transaction.on_commit(lambda: live.publish_poll_tally(instance.option_id))
+
+
+# ----- Dashboard and achievements -----
+# Posts move their author's counters and last activity and drop the
+# author's cached dashboard; votes move the counters of the author of what
+# was voted on. Counts are resolved in SQL, so no receiver loads a row, and
+# each move checks the achievement rules whose thresholds it crossed.
+
+def _adjust(user, active_at=None, **deltas):
+    stats = dashboard.adjust(user, active_at, **deltas)
+    reputation.global_moved(stats)
+    achievements.counters_moved(stats, deltas)
+
+
+def _own_write(user_id):
+    transaction.on_commit(lambda: dashboard.invalidate_summary(user_id))
+
+
+@receiver(post_save, sender=Thread)
+@receiver(post_save, sender=Comment)
+def count_post(sender, instance, created, **kwargs):
+    counter = 'threads' if sender is Thread else 'comments'
+    _adjust(instance.author_id, active_at=instance.updated_at, **{counter: int(created)})
+    _own_write(instance.author_id)
+
+
+@receiver(post_delete, sender=Thread)
+@receiver(post_delete, sender=Comment)
+def uncount_post(sender, instance, **kwargs):
+    counter = 'threads' if sender is Thread else 'comments'
+    _adjust(instance.author_id, **{counter: -1})
+    _own_write(instance.author_id)
+
+
+@receiver(post_save, sender=Poll)
+def count_poll(sender, instance, created, **kwargs):
+    _adjust(
+        dashboard.author_of(Thread, instance.thread_id), active_at=instance.created_at if created else now(),
+        polls=int(created),
+    )
+    thread_id = instance.thread_id
+    transaction.on_commit(lambda: dashboard.invalidate_summary(
+        Thread.objects.filter(pk=thread_id).values_list('author_id', flat=True).first()
+    ))
+
+
+@receiver(post_delete, sender=Poll)
+def uncount_poll(sender, instance, **kwargs):
+    # Polls go before their thread in a cascade, so the author is still there.
+    _adjust(dashboard.author_of(Thread, instance.thread_id), polls=-1)
+
+
+def _move_votes(target_model, target_id, **deltas):
+    # Reputation moves with the net of the vote counters, globally and in
+    # the forums the target is posted in.
+    net = deltas.get('upvotes_received', 0) - deltas.get('downvotes_received', 0)
+    _adjust(dashboard.author_of(target_model, target_id), reputation=net, **deltas)
+    reputation.vote_moved(target_model, target_id, net)
+
+
+def _count_vote(target_model, target_id, vote_type, created, update_fields):
+    if created:
+        deltas = {dashboard.VOTE_COUNTERS[vote_type]: 1}
+    elif update_fields and 'vote_type' in update_fields:
+        # Only cast_*_vote changes a vote, always to the other type.
+        deltas = {counter: 1 if kind == vote_type else -1 for kind, counter in dashboard.VOTE_COUNTERS.items()}
+    else:
+        return
+    _move_votes(target_model, target_id, **deltas)
+
+
+@receiver(post_save, sender=ThreadVote)
+def count_thread_vote(sender, instance, created, update_fields, **kwargs):
+    _count_vote(Thread, instance.thread_id, instance.vote_type, created, update_fields)
+
+
+@receiver(post_save, sender=CommentVote)
+def count_comment_vote(sender, instance, created, update_fields, **kwargs):
+    _count_vote(Comment, instance.comment_id, instance.vote_type, created, update_fields)
+
+
+@receiver(post_delete, sender=ThreadVote)
+def uncount_thread_vote(sender, instance, **kwargs):
+    _move_votes(Thread, instance.thread_id, **{dashboard.VOTE_COUNTERS[instance.vote_type]: -1})
+
+
+@receiver(post_delete, sender=CommentVote)
+def uncount_comment_vote(sender, instance, **kwargs):
+    _move_votes(Comment, instance.comment_id, **{dashboard.VOTE_COUNTERS[instance.vote_type]: -1})
+
+
+@receiver(post_save, sender=Thread)
+def count_category_thread(sender, instance, created, **kwargs):
+    if created:
+        achievements.adjust_category(instance.author_id, instance.category_id, 1)
+    elif getattr(instance, '_loaded_category_id', instance.category_id) != instance.category_id:
+        achievements.adjust_category(instance.author_id, instance._loaded_category_id, -1)
+        achievements.adjust_category(instance.author_id, instance.category_id, 1)
+        _recompute_moved_thread(instance._loaded_category_id, instance.category_id)
+    instance._loaded_category_id = instance.category_id
+
+
+@receiver(post_delete, sender=Thread)
+def uncount_category_thread(sender, instance, **kwargs):
+    achievements.adjust_category(instance.author_id, instance.category_id, -1)
+
+
+# New or changed rules are awarded to the users who already qualify in the
+# background; renamed categories re-resolve the rules that name them.
+
+@receiver(post_save, sender=Achievement)
+def award_achievement(sender, instance, **kwargs):
+    transaction.on_commit(achievements.invalidate_rules)
+    tasks.award_achievement.delay(instance.pk)
+
+
+@receiver(post_delete, sender=Achievement)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_achievement_rules(sender, instance, **kwargs):
+    transaction.on_commit(achievements.invalidate_rules)
+
+
+# ----- Reputation -----
+# Votes move reputation above. A forum gaining or losing categories, or a
+# thread moving category (see count_category_thread), moves votes between
+# forums: the forums affected are recounted in the background. Everything
+# else is left to the nightly recompute.
+
+def _recompute_forums(forum_ids):
+    for forum_id in forum_ids:
+        tasks.recompute_forum_reputation.delay(forum_id)
+
+
+@receiver(m2m_changed, sender=Forum.categories.through)
+def recompute_forum_reputation(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # A category's forums changed; a cleared one waits for the nightly run.
+        _recompute_forums(pk_set or ())
+    else:
+        _recompute_forums([instance.pk])
+
+
+def _recompute_moved_thread(*category_ids):
+    _recompute_forums(
+        Forum.categories.through.objects.filter(category_id__in=[pk for pk in category_ids if pk is not None])
+        .values_list('forum_id', flat=True).distinct()
+    )
+
+
+# ----- Trending -----
+# A new thread starts with the heat of its own creation; comments heat up
+# their thread in one UPDATE. Votes and views fold theirs into the writes
+# that count them (forum.voting, forum.view_counter).
+
+@receiver(pre_save, sender=Thread)
+def heat_new_thread(sender, instance, **kwargs):
+    if instance._state.adding and not instance.hot:
+        instance.hot = trending.initial(instance.created_at or now())
+
+
+@receiver(post_save, sender=Comment)
+def heat_commented_thread(sender, instance, created, **kwargs):
+    if created:
+        trending.comment_added(instance.thread_id, instance.created_at)
@@ -0,0 +1,130 @@
+"""
+An indexable skip list: sorted keys with expected O(log n) insert, remove,
+rank and positional lookup, so a leaderboard can answer "what rank is this
+user" and "who is at ranks 1000-1025" without sorting anything.
+
+Each link also records how many positions it skips, which is what makes
+ranks and positions cheap: walking down from the top level adds up the
+widths of the links taken.
+"""
+import random
+
+MAX_LEVEL = 32
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level
+
+
+class SkipList:
+    def __init__(self, keys=(), seed=None):
+        self._head = _Node(None, MAX_LEVEL)
+        self._size = 0
+        self._random = random.Random(seed)
+        for key in keys:
+            self.insert(key)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        node = self._head.next[0]
+        while node is not None:
+            yield node.key
+            node = node.next[0]
+
+    def _level(self):
+        # Level n with probability 2**-n.
+        level = 1
+        while level < MAX_LEVEL and self._random.getrandbits(1):
+            level += 1
+        return level
+
+    def _path(self, key):
+        """
+        The last node before ``key`` on every level, and its position
+        (the head is position 0, the first key position 1).
+        """
+        chain, positions = [None] * MAX_LEVEL, [0] * MAX_LEVEL
+        node, position = self._head, 0
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            chain[level], positions[level] = node, position
+        return chain, positions
+
+    def insert(self, key):
+        chain, positions = self._path(key)
+        position = positions[0] + 1
+        node = _Node(key, self._level())
+        for level in range(len(node.next)):
+            before = chain[level]
+            skipped = position - positions[level]
+            node.next[level], before.next[level] = before.next[level], node
+            node.width[level] = before.width[level] - skipped + 1
+            before.width[level] = skipped
+        for level in range(len(node.next), MAX_LEVEL):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key):
+        """
+        Remove ``key``; KeyError if it is not there.
+        """
+        chain, _ = self._path(key)
+        node = chain[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        for level in range(len(node.next)):
+            before = chain[level]
+            before.width[level] += node.width[level] - 1
+            before.next[level] = node.next[level]
+        for level in range(len(node.next), MAX_LEVEL):
+            chain[level].width[level] -= 1
+        self._size -= 1
+
+    def rank(self, key):
+        """
+        How many keys sort before ``key``, whether or not it is present.
+        """
+        _, positions = self._path(key)
+        return positions[0]
+
+    def __contains__(self, key):
+        chain, _ = self._path(key)
+        node = chain[0].next[0]
+        return node is not None and node.key == key
+
+    def _node_at(self, index):
+        remaining, node = index + 1, self._head
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        return node
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError(index)
+        return self._node_at(index).key
+
+    def slice(self, start, count):
+        """
+        Up to ``count`` keys from position ``start``: one descent, then a
+        walk along the bottom level.
+        """
+        if start >= self._size or count <= 0:
+            return []
+        node, keys = self._node_at(max(start, 0)), []
+        while node is not None and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
@@ -0,0 +1,40 @@
+"""
+Forum work handed off to the task queue by ``forum.signals``.
+"""
+import os
+
+from GroupPortal import images
+from GroupPortal.tasks import task
+from forum.achievements import backfill as backfill_achievements
+from forum.models import Comment
+from forum.notifications import notify_subscribers
+from forum.reputation import recompute as recompute_reputation
+from forum.search import sync_document
+
+
+@task
+def sync_search_document(kind, pk):
+    sync_document(kind, pk)
+
+
+@task(max_attempts=8)
+def notify_comment_subscribers(comment_id):
+    comment = Comment.objects.filter(pk=comment_id).only('thread_id', 'author_id', 'created_at').first()
+    if comment is not None:
+        notify_subscribers(comment)
+
+
+@task(max_attempts=3)
+def render_thumbnails(name):
+    if os.path.isfile(images.source_path(name)):
+        images.generate(name)
+
+
+@task
+def award_achievement(achievement_id):
+    backfill_achievements([achievement_id])
+
+
+@task
+def recompute_forum_reputation(forum_id):
+    recompute_reputation([forum_id])
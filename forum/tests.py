@@ -1,3 +1,1550 @@
-from django.test import TestCase
+import asyncio
+import bisect
+import itertools
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now, timedelta
+
+from authentification.models import CustomUser
+from GroupPortal.testing import (
+    QueryBudgetMixin, seed_forum, make_user, make_category, make_tag, make_forum, make_thread, make_comment, make_poll,
+)
+from forum.achievements import InvalidCriteria, load_rules, parse, satisfied, user_values, rules as achievement_rules
+from forum.activity import feed
+from forum.dashboard import counted_stats
+from forum.reputation import Leaderboard, board, forget_boards
+from forum.skiplist import SkipList
+from forum.trending import refresh_windows, rescore
+from forum.attachments import blob_path, collect, parse_range, recount
+from forum.revisions import content_at, convert, record_edit, revision_diff, make_delta, apply_delta
+from forum.models import (
+    Category, Forum, Tag, Thread, ThreadVote, Comment, CommentVote, Poll, PollOption, PollVote, SearchDocument,
+    ActivityEvent, ThreadSubscription, SavedThread, Notification, NotificationInbox, Blob, ThreadRevision,
+    CommentRevision, UserStats, UserCategoryStats, Achievement, UserAchievement, ForumReputation,
+)
+from forum.live import InProcessBroker, get_broker, thread_channel, publish_comment, publish_score
+from forum.notifications import notify_subscribers, unread_count, rebuild_inbox_counters, send_digests
+from forum.voting import cast_thread_vote, cast_comment_vote, rebuild_vote_counters
+from forum.view_counter import ViewCountBuffer, thread_views, comment_views
+from forum.forms import AchievementForm
+from forum.comment_tree import build_comment_tree, load_comment_page, load_comment_tree, top_level_comments
+from forum.pagination import KeysetPaginator, InvalidCursor
+from forum.search import search, SQLiteFTSBackend, BasicSearchBackend
+from forum.polls import cast_poll_vote, poll_tally
+from forum.query_plans import analyze, check_plans
+
+
+class VoteCounterTests(TestCase):
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user('alice@example.com', 'alice', 'pw')
+        self.bob = CustomUser.objects.create_user('bob@example.com', 'bob', 'pw')
+        self.thread = Thread.objects.create(title='T', description='D', author=self.alice)
+        self.comment = Comment.objects.create(thread=self.thread, author=self.alice, content='C')
+
+    def test_thread_votes_update_counters(self):
+        cast_thread_vote(self.alice, self.thread, 'up')
+        cast_thread_vote(self.bob, self.thread, 'down')
+        self.assertEqual((self.thread.upvotes, self.thread.downvotes, self.thread.score), (1, 1, 0))
+
+    def test_flipping_a_vote_moves_the_counters(self):
+        cast_comment_vote(self.bob, self.comment, 'up')
+        cast_comment_vote(self.bob, self.comment, 'down')
+        self.assertEqual((self.comment.upvotes, self.comment.downvotes, self.comment.score), (0, 1, -1))
+        self.assertEqual(CommentVote.objects.get(user=self.bob).vote_type, 'down')
+
+    def test_repeated_vote_is_a_no_op(self):
+        self.assertTrue(cast_thread_vote(self.bob, self.thread, 'up'))
+        self.assertFalse(cast_thread_vote(self.bob, self.thread, 'up'))
+        self.assertEqual(self.thread.score, 1)
+
+    def test_invalid_vote_type_is_rejected(self):
+        with self.assertRaises(ValueError):
+            cast_thread_vote(self.bob, self.thread, 'sideways')
+
+    def test_rebuild_fixes_drift(self):
+        ThreadVote.objects.create(user=self.bob, thread=self.thread, vote_type='up')
+        self.assertEqual(rebuild_vote_counters(Thread, dry_run=True), [(self.thread.id, (0, 0, 0), (1, 0, 1))])
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.score, 0)
+
+        out = StringIO()
+        call_command('rebuild_vote_counters', stdout=out)
+        self.assertIn('Thread: 1 drifted row(s) fixed.', out.getvalue())
+        self.thread.refresh_from_db()
+        self.assertEqual((self.thread.upvotes, self.thread.score), (1, 1))
+        self.assertEqual(rebuild_vote_counters(Thread), [])
+
+
+@override_settings(FORUM_VIEW_COUNT_FLUSH_THRESHOLD=1000, FORUM_VIEW_COUNT_FLUSH_INTERVAL=3600)
+class ViewCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        thread_views.flush()
+        comment_views.flush()
+        self.thread = Thread.objects.create(title='T', description='D')
+        self.comment = Comment.objects.create(thread=self.thread, content='C')
+
+    def tearDown(self):
+        thread_views.flush()
+        comment_views.flush()
+
+    def test_flush_writes_all_increments_in_one_update(self):
+        other = Thread.objects.create(title='U', description='D')
+        buffer = ViewCountBuffer(Thread)
+        buffer.add([self.thread.id])
+        buffer.add([self.thread.id])
+        buffer.add([other.id])
+        with CaptureQueriesContext(connection) as queries:
+            buffer.flush()
+        self.assertEqual(len(queries), 1)
+        self.assertIn('CASE', queries[0]['sql'])
+        self.assertEqual(
+            dict(Thread.objects.values_list('id', 'views')),
+            {self.thread.id: 2, other.id: 1},
+        )
+
+    @override_settings(FORUM_VIEW_COUNT_FLUSH_THRESHOLD=2)
+    def test_buffer_flushes_after_threshold(self):
+        buffer = ViewCountBuffer(Thread)
+        buffer.add([self.thread.id])
+        self.assertEqual(buffer.pending(), {self.thread.id: 1})
+        buffer.add([self.thread.id])
+        self.assertEqual(buffer.pending(), {})
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.views, 2)
+
+    def test_repeat_views_from_one_session_are_deduplicated(self):
+        url = f'/thread/{self.thread.id}/'
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(thread_views.pending(), {self.thread.id: 1})
+        self.assertEqual(comment_views.pending(), {self.comment.id: 1})
+        thread_views.flush()
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.views, 1)
+
+
+class CommentTreeTests(TestCase):
+    def setUp(self):
+        self.thread = Thread.objects.create(title='T', description='D')
+
+    def reply(self, parent=None, **kwargs):
+        return Comment.objects.create(thread=self.thread, parent=parent, content='C', **kwargs)
+
+    def test_tree_is_built_from_a_single_query(self):
+        root = self.reply()
+        child = self.reply(root)
+        self.reply(child)
+        self.reply()
+        with self.assertNumQueries(1):
+            tree = load_comment_tree(self.thread)
+            [node.comment.author for node in tree.nodes.values()]
+        self.assertEqual(len(tree), 4)
+        self.assertEqual([len(node.children) for node in tree.roots], [1, 0])
+        self.assertEqual(tree.roots[0].children[0].children[0].depth, 2)
+
+    def test_replies_to_deleted_comments_are_promoted(self):
+        root = self.reply(is_deleted=True)
+        orphan = self.reply(root)
+        tree = load_comment_tree(self.thread)
+        self.assertEqual([node.comment for node in tree.roots], [orphan])
+
+    def test_thread_detail_keeps_replies_to_deleted_top_level_comments(self):
+        deleted = self.reply(is_deleted=True)
+        orphan = Comment.objects.create(thread=self.thread, parent=deleted, content='Still here')
+        Comment.objects.create(thread=self.thread, parent=orphan, content='Nested reply')
+        Comment.objects.create(thread=self.thread, content='Gone for good', is_deleted=True)
+        live = self.reply()
+
+        self.assertEqual(set(top_level_comments(self.thread)), {deleted, live})
+        tree = load_comment_page(top_level_comments(self.thread))
+        self.assertEqual([node.comment for node in tree.roots], [orphan, live])
+        self.assertEqual(len(tree.roots[0].children), 1)
+
+        response = self.client.get(f'/thread/{self.thread.id}/')
+        self.assertContains(response, 'Still here')
+        self.assertContains(response, 'Nested reply')
+        self.assertNotContains(response, 'Gone for good')
+
+    def test_depth_limit_leaves_a_cursor(self):
+        root = self.reply()
+        child = self.reply(root)
+        self.reply(self.reply(child))
+        tree = load_comment_tree(self.thread, max_depth=2)
+        cut = tree.roots[0].children[0]
+        self.assertEqual(cut.children, [])
+        self.assertEqual((cut.more_replies.parent_id, cut.more_replies.count), (child.id, 2))
+
+        replies = load_comment_tree(self.thread, root_id=child.id)
+        self.assertEqual(len(replies), 2)
+
+    def test_sibling_limit_continues_after_last_shown_reply(self):
+        root = self.reply()
+        replies = [self.reply(root) for _ in range(5)]
+        tree = build_comment_tree(Comment.objects.order_by('created_at', 'id'), max_children=2)
+        more = tree.roots[0].more_replies
+        self.assertEqual((more.after_id, more.count), (replies[1].id, 3))
+
+        rest = load_comment_tree(self.thread, root_id=root.id, after_id=more.after_id)
+        self.assertEqual([node.comment for node in rest.roots], replies[2:])
+
+    def test_thread_detail_query_count_does_not_grow_with_comments(self):
+        parent = None
+        for _ in range(30):
+            parent = self.reply(parent)
+        url = f'/thread/{self.thread.id}/'
+        # Start both requests with fresh view-count buffers, so neither hits
+        # the flush interval.
+        thread_views.flush()
+        comment_views.flush()
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        for _ in range(30):
+            self.reply(self.reply())
+        cache.clear()
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(few), len(many))
+        thread_views.flush()
+        comment_views.flush()
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.threads = [Thread.objects.create(title=f'T{i}', description='D') for i in range(7)]
+        # Newest first, with ties on created_at broken by id.
+        Thread.objects.update(created_at=self.threads[0].created_at)
+        self.newest_first = sorted(self.threads, key=lambda t: t.id, reverse=True)
+
+    def test_pages_forward_and_back_without_offset(self):
+        paginator = KeysetPaginator(Thread.objects.all(), per_page=3)
+        with CaptureQueriesContext(connection) as queries:
+            first = paginator.page()
+            second = paginator.page(first.next_cursor)
+            third = paginator.page(second.next_cursor)
+        self.assertEqual(len(queries), 3)
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries))
+        self.assertEqual(list(first) + list(second) + list(third), self.newest_first)
+        self.assertFalse(first.has_previous)
+        self.assertFalse(third.has_next)
+
+        back = paginator.page(third.prev_cursor)
+        self.assertEqual(list(back), list(second))
+        self.assertEqual(list(paginator.page(back.prev_cursor)), list(first))
+        self.assertFalse(paginator.page(back.prev_cursor).has_previous)
+
+    def test_ascending_order(self):
+        paginator = KeysetPaginator(Thread.objects.all(), per_page=4, descending=False)
+        first = paginator.page()
+        self.assertEqual(list(first) + list(paginator.page(first.next_cursor)), self.newest_first[::-1])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            KeysetPaginator(Thread.objects.all()).page('garbage')
+        forum = Forum.objects.create(name='F')
+        response = self.client.get(f'/forum/{forum.id}/', {'threads_cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_forum_detail_links_to_the_next_page(self):
+        forum = Forum.objects.create(name='F')
+        Thread.objects.bulk_create([Thread(title=f'Extra {i}', description='D') for i in range(20)])
+        response = self.client.get(f'/forum/{forum.id}/')
+        self.assertEqual(len(response.context['threads']), 20)
+        next_url = response.context['threads'].next_url
+        self.assertIn('threads_cursor=', next_url)
+        response = self.client.get(f'/forum/{forum.id}/{next_url}')
+        self.assertEqual(len(response.context['threads']), 7)
+
+
+@override_settings(TASKS_EAGER=True)
+class SearchTests(TestCase):
+    def setUp(self):
+        self.python = Category.objects.create(name='Python')
+        self.forum = Forum.objects.create(name='Dev')
+        self.forum.categories.add(self.python)
+        self.tag = Tag.objects.create(name='help')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.thread = Thread.objects.create(
+                title='Running Django tests', description='How do I speed up the test runner?', category=self.python,
+            )
+            self.thread.tags.add(self.tag)
+            self.other = Thread.objects.create(title='Gardening', description='Tomatoes need sun.')
+            self.comment = Comment.objects.create(thread=self.other, content='Django runs my greenhouse sensors.')
+            self.poll = Poll.objects.create(thread=self.thread, question='Favourite runner?')
+            self.poll.options.create(text='pytest')
+            self.poll.options.create(text='unittest')
+
+    def kinds(self, results):
+        return [(document.kind, document.object_id) for document in results]
+
+    def test_signals_keep_documents_in_sync(self):
+        self.assertEqual(SearchDocument.objects.count(), 4)
+        self.assertEqual(SearchDocument.objects.get(kind='poll').body, 'pytest\nunittest')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.comment.is_deleted = True
+            self.comment.save()
+        self.assertFalse(SearchDocument.objects.filter(kind='comment').exists())
+
+    def test_ranked_full_text_match(self):
+        results = search('django')
+        self.assertEqual(self.kinds(results), [('thread', self.thread.id), ('comment', self.comment.id)])
+        self.assertEqual(self.kinds(search('pytest')), [('poll', self.poll.id)])
+        # Stemming and prefix matching on the last word.
+        self.assertEqual(self.kinds(search('tomato')), [('thread', self.other.id)])
+
+    def test_filters(self):
+        self.assertEqual(self.kinds(search('django', category=self.python.id)), [('thread', self.thread.id)])
+        self.assertEqual(self.kinds(search('django', tag=self.tag.id)), [('thread', self.thread.id)])
+        self.assertEqual(len(search('django', forum=self.forum.id)), 2)
+
+    def test_user_input_cannot_break_the_match_syntax(self):
+        self.assertEqual(SQLiteFTSBackend.fts_query('tests" OR body:*'), '"tests" "OR" "body"*')
+        self.assertEqual(len(search('"unbalanced (')), 0)
+
+    def test_pagination(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(5):
+                Comment.objects.create(thread=self.thread, content=f'django note {i}')
+        first = search('django', per_page=4)
+        second = search('django', page=2, per_page=4)
+        self.assertTrue(first.has_next)
+        self.assertFalse(second.has_next)
+        self.assertEqual(len(first) + len(second), 7)
+
+    def test_basic_backend(self):
+        self.assertEqual(len(BasicSearchBackend().search('greenhouse')), 1)
+
+    def test_rebuild_command(self):
+        SearchDocument.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_search_index', chunk_size=1, stdout=out)
+        self.assertIn('Indexed 2 thread(s), 1 comment(s), 1 poll(s).', out.getvalue())
+        self.assertEqual(len(search('django')), 2)
+
+    def test_search_view(self):
+        response = self.client.get('/search/', {'q': 'django', 'category': self.python.id})
+        self.assertContains(response, 'Running Django tests')
+        self.assertNotContains(response, 'greenhouse')
+
+    def test_search_view_ignores_malformed_filters(self):
+        response = self.client.get('/search/', {'q': 'django', 'forum': 'abc', 'category': '1x', 'tag': '-1'})
+        self.assertContains(response, 'Running Django tests')
+        self.assertContains(response, 'greenhouse')
+
+
+class PollTallyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [CustomUser.objects.create(email=f'u{i}@example.com', username=f'u{i}') for i in range(3)]
+        self.poll = Poll.objects.create(thread=Thread.objects.create(title='T', description='D'), question='Q?')
+        self.yes = self.poll.options.create(text='Yes')
+        self.no = self.poll.options.create(text='No')
+
+    def test_revote_moves_the_vote(self):
+        cast_poll_vote(self.users[0], self.poll, self.yes)
+        cast_poll_vote(self.users[1], self.poll, self.yes)
+        cast_poll_vote(self.users[0], self.poll, self.no)
+        self.assertFalse(cast_poll_vote(self.users[0], self.poll, self.no))
+        self.assertEqual(PollVote.objects.filter(user=self.users[0]).count(), 1)
+        self.assertEqual(
+            dict(PollOption.objects.values_list('text', 'votes')),
+            {'Yes': 1, 'No': 1},
+        )
+
+    def test_tally_is_cached_until_the_next_vote(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_poll_vote(self.users[0], self.poll, self.yes)
+        with self.assertNumQueries(1):
+            poll_tally(self.poll)
+        with self.assertNumQueries(0):
+            tally = poll_tally(self.poll)
+        self.assertEqual([r['votes'] for r in tally.results], [1, 0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_poll_vote(self.users[1], self.poll, self.no)
+        tally = poll_tally(self.poll)
+        self.assertEqual((tally.total, [r['percent'] for r in tally.results]), (2, [50, 50]))
+
+    def test_results_page_query_count_does_not_grow_with_options(self):
+        url = f'/poll-results/{self.poll.id}/'
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        cache.clear()
+        for i in range(10):
+            self.poll.options.create(text=f'Option {i}')
+        cache.clear()
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(len(response.context['results']), 12)
+
+    def test_rebuild_recounts_options(self):
+        PollVote.objects.create(user=self.users[2], option=self.no)
+        out = StringIO()
+        call_command('rebuild_vote_counters', stdout=out)
+        self.assertIn('PollOption: 1 drifted row(s) fixed.', out.getvalue())
+        self.no.refresh_from_db()
+        self.assertEqual(self.no.votes, 1)
+
+
+class ViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Upper bounds on the queries behind each forum page, over enough data
+    that a per-row query would blow the budget. Logged-in requests spend
+    two of them on the session and the user.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_forum(users=5, threads=12, comments=4, replies=2)
+        call_command('backfill_activity', stdout=StringIO())
+
+    def setUp(self):
+        cache.clear()
+        # Steady state: the achievement rules are parsed once and cached.
+        achievement_rules()
+        self.thread = self.data['threads'][0]
+        self.comment = self.data['comments'][0]
+        self.poll = self.data['polls'][0]
+        self.forum = self.data['forum']
+        self.client.force_login(self.thread.author)
+
+    def tearDown(self):
+        thread_views.flush()
+        comment_views.flush()
+
+    def assertPageBudget(self, url, limit):
+        with self.subTest(url=url):
+            with self.assertMaxQueries(limit):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_browsing(self):
+        self.assertPageBudget('/forums/', 3)
+        self.assertPageBudget(f'/forum/{self.forum.id}/', 5)
+        self.assertPageBudget(f'/thread/{self.thread.id}/', 6)
+        self.assertPageBudget(f'/comment/{self.comment.id}/replies/', 4)
+        self.assertPageBudget('/recent/', 3)
+        self.assertPageBudget(f'/recent/?forum={self.forum.id}&tag={self.data["tags"][0].id}', 3)
+        self.assertPageBudget('/search/?q=thread', 6)
+
+    def test_dashboard(self):
+        # The stats row and one page of each list, then the cached summary.
+        self.assertPageBudget('/dashboard/', 6)
+        self.assertPageBudget('/dashboard/', 2)
+
+    def test_notifications(self):
+        ThreadSubscription.objects.bulk_create(
+            ThreadSubscription(user=self.thread.author, thread=thread) for thread in self.data['threads']
+        )
+        for comment in self.data['comments']:
+            notify_subscribers(comment)
+        self.assertPageBudget('/notifications/', 4)
+
+    def test_history(self):
+        self.assertPageBudget(f'/thread/{self.thread.id}/history/', 4)
+        self.assertPageBudget(f'/comment/{self.comment.id}/history/', 4)
+
+    def test_polls(self):
+        self.assertPageBudget(f'/poll-results/{self.poll.id}/', 4)
+        self.assertPageBudget(f'/poll/{self.poll.id}/vote/', 4)
+        self.assertPageBudget('/create-poll/', 3)
+        self.assertPageBudget(f'/update-poll/{self.poll.id}/', 4)
+
+    def test_forms(self):
+        self.assertPageBudget('/create-thread/', 4)
+        self.assertPageBudget(f'/thread/{self.thread.id}/edit/', 6)
+        self.assertPageBudget(f'/thread/{self.thread.id}/vote/', 3)
+        self.assertPageBudget(f'/thread/{self.thread.id}/comment/', 4)
+        self.assertPageBudget(f'/thread/{self.thread.id}/comment/{self.comment.id}/', 4)
+        self.assertPageBudget(f'/comment/{self.comment.id}/vote/', 3)
+        self.assertPageBudget('/create-forum/', 2)
+        self.assertPageBudget(f'/update-forum/{self.forum.id}/', 3)
+        self.assertPageBudget(f'/update-category/{self.data["categories"][0].id}/', 3)
+        self.assertPageBudget(f'/update-tag/{self.data["tags"][0].id}/', 3)
+        self.assertPageBudget('/add-category/', 2)
+        self.assertPageBudget('/add-tag/', 2)
+        self.assertPageBudget(f'/confirm-delete/{self.thread.id}/', 4)
+
+    def test_comment_author_forms(self):
+        self.client.force_login(self.comment.author)
+        self.assertPageBudget(f'/comment/{self.comment.id}/edit/', 4)
+        self.assertPageBudget(f'/comment/{self.comment.id}/delete/', 4)
+
+    def test_writes(self):
+        voter = self.data['users'][1]
+        self.client.force_login(voter)
+        # Includes moving the thread author's dashboard stats and their
+        # reputation in the thread's forums.
+        with self.assertMaxQueries(11):
+            self.client.post(f'/thread/{self.thread.id}/vote/', {'vote_type': 'up'})
+        option = self.poll.options.order_by('id').first()
+        with self.assertMaxQueries(11):
+            self.client.post(f'/poll/{self.poll.id}/vote/', {'option_id': option.id})
+        # Includes queueing the search indexing and subscriber fan-out,
+        # counting the comment in the author's dashboard stats and heating
+        # up the thread's trending score.
+        with self.assertMaxQueries(8):
+            self.client.post(f'/thread/{self.thread.id}/comment/', {'content': 'Hello'})
+
+    def test_budget_failure_lists_queries(self):
+        with self.assertRaises(AssertionError) as failure:
+            with self.assertMaxQueries(0):
+                list(Thread.objects.all())
+        self.assertIn('FROM "forum_thread"', str(failure.exception))
+
+
+class QueryPlanTests(TestCase):
+    def setUp(self):
+        seed_forum(threads=30)
+        call_command('backfill_activity', stdout=StringIO())
+
+    def test_hot_queries_use_their_indexes(self):
+        analyze()
+        for label, indexes, used, plan in check_plans():
+            with self.subTest(label):
+                self.assertTrue(used, f"{label} does not use {indexes}:\n{plan}")
+
+    def test_command(self):
+        out = StringIO()
+        call_command('check_query_plans', analyze=True, stdout=out)
+        self.assertIn('All query plans use their indexes', out.getvalue())
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user('alice@example.com', 'alice', 'pw')
+        self.bob = CustomUser.objects.create_user('bob@example.com', 'bob', 'pw')
+        self.thread = Thread.objects.create(title='Cached title', description='D', author=self.alice)
+        self.comment = Comment.objects.create(thread=self.thread, author=self.alice, content='Cached comment')
+
+    def tearDown(self):
+        thread_views.flush()
+        comment_views.flush()
+
+    def page(self):
+        return self.client.get(f'/thread/{self.thread.id}/').content.decode()
+
+    def test_fragments_are_reused_until_invalidated(self):
+        self.page()
+        # Writes that skip signals and updated_at are not seen...
+        Thread.objects.filter(id=self.thread.id).update(title='Sneaky title')
+        Comment.objects.filter(id=self.comment.id).update(content='Sneaky comment')
+        content = self.page()
+        self.assertIn('Cached title', content)
+        self.assertIn('Cached comment', content)
+
+        # ...but saves and votes are.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.comment.refresh_from_db()
+            self.comment.save()
+            cast_thread_vote(self.bob, self.thread, 'up')
+        content = self.page()
+        self.assertIn('Sneaky title', content)
+        self.assertIn('Score: 1', content)
+        self.assertIn('Sneaky comment', content)
+
+    def test_comment_votes_invalidate(self):
+        self.page()
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_comment_vote(self.bob, self.comment, 'down')
+        self.assertIn('Score: -1', self.page())
+
+    def test_author_pictures_are_cached_with_the_comment(self):
+        CustomUser.objects.filter(pk=self.alice.pk).update(profile_picture='profile_pics/old.png')
+        self.assertIn('profile_pics/old.png', self.page())
+        with mock.patch('GroupPortal.images.url', side_effect=AssertionError('not cached')):
+            self.assertIn('profile_pics/old.png', self.page())
+        CustomUser.objects.filter(pk=self.alice.pk).update(profile_picture='profile_pics/new.png')
+        content = self.page()
+        self.assertIn('profile_pics/new.png', content)
+        self.assertIn('Cached comment', content)
+
+    def test_user_and_category_saves_invalidate(self):
+        forum = Forum.objects.create(name='F')
+        category = Category.objects.create(name='Old category')
+        forum.categories.add(category)
+        Thread.objects.filter(id=self.thread.id).update(category=category)
+        self.thread.refresh_from_db()
+        self.page()
+        self.client.get(f'/forum/{forum.id}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.username = 'alicia'
+            self.alice.save()
+            category.name = 'New category'
+            category.save()
+        content = self.page()
+        self.assertIn('By alicia', content)
+        self.assertIn('Posted by alicia', content)
+        self.assertContains(self.client.get(f'/forum/{forum.id}/'), 'New category')
+
+    def test_logins_keep_fragments(self):
+        self.page()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.client.login(email='alice@example.com', password='pw')
+        self.assertEqual(callbacks, [])
+
+    def test_per_user_buttons_stay_outside(self):
+        self.client.force_login(self.alice)
+        self.assertIn(f'/comment/{self.comment.id}/edit/', self.page())
+        self.client.force_login(self.bob)
+        content = self.page()
+        self.assertIn('Cached comment', content)
+        self.assertNotIn(f'/comment/{self.comment.id}/edit/', content)
+        self.assertNotIn(f'/thread/{self.thread.id}/edit/', content)
+
+    def test_lists(self):
+        forum = Forum.objects.create(name='F')
+        self.client.get(f'/forum/{forum.id}/')
+        self.client.get('/recent/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.thread.title = 'Renamed'
+            self.thread.save()
+        self.assertContains(self.client.get(f'/forum/{forum.id}/'), 'Renamed')
+        self.assertContains(self.client.get('/recent/'), 'Renamed')
+
+
+class ActivityFeedTests(TestCase):
+    def setUp(self):
+        self.alice = make_user()
+        self.news, self.misc = make_category(), make_category()
+        self.python, self.django = make_tag(), make_tag()
+        self.forum = make_forum(categories=[self.news])
+
+    def create_thread(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            thread = make_thread(author=self.alice, category=self.news, tags=[self.python], **fields)
+        return thread
+
+    def feed_of(self, **filters):
+        return [(event.kind, event.verb, event.object_id) for event in feed(**filters).order_by('-created_at', '-id')]
+
+    def test_events_fan_out_to_every_scope(self):
+        thread = self.create_thread()
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = make_comment(thread)
+        expected = [('comment', 'created', comment.pk), ('thread', 'created', thread.pk)]
+        self.assertEqual(self.feed_of(), expected)
+        self.assertEqual(self.feed_of(forum=self.forum.pk), expected)
+        self.assertEqual(self.feed_of(category=self.news.pk), expected)
+        self.assertEqual(self.feed_of(tag=self.python.pk), expected)
+        self.assertEqual(self.feed_of(forum=self.forum.pk, tag=self.python.pk), expected)
+        self.assertEqual(self.feed_of(category=self.misc.pk), [])
+        self.assertEqual(self.feed_of(tag=self.django.pk), [])
+        self.assertEqual(ActivityEvent.objects.count(), 6)
+
+    def test_edits_rescope_and_retitle(self):
+        thread = self.create_thread()
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = make_comment(thread)
+        with self.captureOnCommitCallbacks(execute=True):
+            thread.title = 'Renamed'
+            thread.category = self.misc
+            thread.save()
+            thread.tags.set([self.django])
+        self.assertEqual(self.feed_of(forum=self.forum.pk), [])
+        self.assertEqual(self.feed_of(tag=self.python.pk), [])
+        self.assertEqual(len(self.feed_of(tag=self.django.pk)), 3)
+        self.assertEqual(self.feed_of(category=self.misc.pk)[0], ('thread', 'edited', thread.pk))
+        self.assertEqual(
+            ActivityEvent.objects.get(kind='comment', object_id=comment.pk, forum=None, tag=None).title, 'Renamed',
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.forum.categories.add(self.misc)
+        self.assertEqual(len(self.feed_of(forum=self.forum.pk)), 3)
+
+    def test_edits_touch_only_what_changed(self):
+        thread = self.create_thread()
+        with self.captureOnCommitCallbacks(execute=True):
+            make_comment(thread)
+        copies = set(ActivityEvent.objects.filter(thread_id=thread.pk).values_list('pk', flat=True))
+
+        thread = Thread.objects.get(pk=thread.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            thread.description = 'Reworded'
+            thread.save()
+        after = set(ActivityEvent.objects.filter(thread_id=thread.pk).values_list('pk', flat=True))
+        self.assertTrue(copies < after)
+        self.assertEqual(len(after - copies), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            thread.tags.add(self.django)
+        # The other tag's copies are left alone.
+        self.assertLessEqual(set(ActivityEvent.objects.filter(tag=self.python).values_list('pk', flat=True)), after)
+        self.assertEqual(len(self.feed_of(tag=self.django.pk)), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.python.threads.clear()
+        self.assertEqual(self.feed_of(tag=self.python.pk), [])
+        self.assertEqual(len(self.feed_of(tag=self.django.pk)), 3)
+
+    def test_soft_delete_leaves_one_entry(self):
+        thread = self.create_thread()
+        with self.captureOnCommitCallbacks(execute=True):
+            make_comment(thread)
+            make_poll(thread)
+        with self.captureOnCommitCallbacks(execute=True):
+            thread.is_deleted = True
+            thread.save()
+        self.assertEqual(self.feed_of(), [('thread', 'deleted', thread.pk)])
+        self.assertEqual(self.feed_of(tag=self.python.pk), [('thread', 'deleted', thread.pk)])
+        self.assertNotContains(self.client.get('/recent/'), f'/thread/{thread.pk}/')
+
+    def test_hard_deletes_purge(self):
+        thread = self.create_thread()
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = make_comment(thread)
+            poll = make_poll(thread)
+        poll_id = poll.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            comment.delete()
+            poll.delete()
+        self.assertEqual(self.feed_of(), [('poll', 'deleted', poll_id), ('thread', 'created', thread.pk)])
+        with self.captureOnCommitCallbacks(execute=True):
+            thread.delete()
+        self.assertFalse(ActivityEvent.objects.exists())
+
+    def test_backfill_and_prune(self):
+        thread = make_thread(author=self.alice, category=self.news, tags=[self.python])
+        make_comment(thread)
+        make_poll(thread)
+        self.assertFalse(ActivityEvent.objects.exists())
+        for _ in range(2):
+            call_command('backfill_activity', stdout=StringIO())
+            self.assertEqual(ActivityEvent.objects.count(), 9)
+        self.assertEqual(len(self.feed_of(forum=self.forum.pk)), 3)
+
+        ActivityEvent.objects.filter(kind='comment').update(created_at=now() - timedelta(days=40))
+        out = StringIO()
+        call_command('prune_activity', batch_size=2, stdout=out)
+        self.assertIn('Removed 3 event(s).', out.getvalue())
+        self.assertEqual(ActivityEvent.objects.count(), 6)
+
+    def test_page(self):
+        thread = self.create_thread(title='Fresh thread')
+        response = self.client.get(f'/recent/?forum={self.forum.pk}&tag={self.python.pk}')
+        self.assertContains(response, 'Fresh thread')
+        self.assertContains(response, f'/thread/{thread.pk}/')
+        self.assertContains(self.client.get(f'/recent/?tag={self.django.pk}'), 'No recent activity.')
+
+
+@override_settings(TASKS_EAGER=True)
+class NotificationTests(TestCase):
+    def setUp(self):
+        self.alice, self.bob, self.carol = make_user(), make_user(), make_user()
+        self.thread = make_thread(author=self.alice, title='Followed thread')
+        for user in (self.alice, self.bob, self.carol):
+            ThreadSubscription.objects.create(user=user, thread=self.thread)
+
+    def comment(self, author, content='New comment'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return make_comment(self.thread, author=author, content=content)
+
+    def test_fan_out_is_constant_in_subscribers(self):
+        comment = make_comment(self.thread, author=self.bob)
+        with self.assertNumQueries(2):
+            self.assertEqual(notify_subscribers(comment), 2)
+        self.assertEqual(
+            sorted(Notification.objects.values_list('user_id', flat=True)), sorted([self.alice.pk, self.carol.pk]),
+        )
+        self.assertEqual((unread_count(self.alice), unread_count(self.bob), unread_count(self.carol)), (1, 0, 1))
+
+        self.comment(self.carol)
+        self.assertEqual((unread_count(self.alice), unread_count(self.bob), unread_count(self.carol)), (2, 1, 1))
+
+    def test_reading(self):
+        first, second = self.comment(self.bob), self.comment(self.bob)
+        self.client.force_login(self.alice)
+        response = self.client.get('/notifications/')
+        self.assertContains(response, '2 unread')
+        notification = Notification.objects.get(user=self.alice, comment=first)
+        self.assertRedirects(
+            self.client.get(f'/notifications/{notification.pk}/'), f'/thread/{self.thread.pk}/',
+            fetch_redirect_response=False,
+        )
+        self.assertEqual(unread_count(self.alice), 1)
+        self.client.post('/notifications/read/')
+        self.assertEqual(unread_count(self.alice), 0)
+        self.assertEqual(Notification.objects.filter(user=self.alice, read_at__isnull=True).count(), 0)
+
+        Notification.objects.filter(comment=second).delete()
+        self.comment(self.bob)
+        NotificationInbox.objects.update(unread=7)
+        rebuild_inbox_counters()
+        self.assertEqual(unread_count(self.alice), 1)
+
+    def test_subscribe_routes(self):
+        dave = make_user()
+        self.client.force_login(dave)
+        self.client.post(f'/thread/{self.thread.pk}/subscribe/')
+        self.client.post(f'/thread/{self.thread.pk}/save/')
+        self.assertTrue(ThreadSubscription.objects.filter(user=dave, thread=self.thread).exists())
+        self.assertTrue(SavedThread.objects.filter(user=dave, thread=self.thread).exists())
+        self.comment(self.bob)
+        self.assertEqual(unread_count(dave), 1)
+        self.client.post(f'/thread/{self.thread.pk}/unsubscribe/')
+        self.comment(self.bob)
+        self.assertEqual(unread_count(dave), 1)
+
+    @override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def test_digests(self):
+        self.comment(self.bob, 'First reply')
+        self.comment(self.bob, 'Second reply')
+        out = StringIO()
+        call_command('send_notification_digests', batch_size=1, stdout=out)
+        self.assertIn('Sent 2 digest(s).', out.getvalue())
+        by_recipient = {message.to[0]: message for message in mail.outbox}
+        self.assertEqual(set(by_recipient), {self.alice.email, self.carol.email})
+        body = by_recipient[self.alice.email].body
+        self.assertIn('Followed thread', body)
+        self.assertIn('First reply', body)
+        self.assertIn('Second reply', body)
+        self.assertEqual(by_recipient[self.alice.email].subject, '2 new comment(s) in threads you follow')
+
+        # Nothing new, and the interval holds back the next digest.
+        self.comment(self.bob, 'Third reply')
+        self.assertEqual(send_digests(), 0)
+        self.assertEqual(send_digests(timedelta(0)), 2)
+        self.assertIn('Third reply', mail.outbox[-1].body)
+        self.assertNotIn('First reply', mail.outbox[-1].body)
+
+
+class LiveUpdateTests(TestCase):
+    def setUp(self):
+        self.alice, self.bob = make_user(), make_user()
+        self.thread = make_thread(author=self.alice)
+        self.channel = thread_channel(self.thread.pk)
+
+    async def test_broker(self):
+        broker = InProcessBroker(max_queue=2)
+        self.assertFalse(broker.has_subscribers())
+        async with broker.subscribe('a') as first, broker.subscribe('a') as second:
+            self.assertTrue(broker.has_subscribers('a'))
+            self.assertFalse(broker.has_subscribers('b'))
+            # Publishers are sync code on other threads.
+            publisher = threading.Thread(target=lambda: [broker.publish('a', 'n', n) for n in range(3)])
+            publisher.start()
+            publisher.join()
+            self.assertEqual([(await first.get(1)).data for _ in range(2)], [1, 2])
+            self.assertEqual((await second.get(1)).data, 1)
+            with self.assertRaises(asyncio.TimeoutError):
+                await first.get(0.01)
+        self.assertFalse(broker.has_subscribers())
+
+    @override_settings(FORUM_LIVE_ENABLED=True)
+    async def test_stream(self):
+        response = await self.async_client.get(f'/thread/{self.thread.pk}/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+        broker = get_broker()
+        self.assertTrue(broker.has_subscribers(self.channel))
+        broker.publish(self.channel, 'score', {'kind': 'thread', 'id': self.thread.pk, 'score': 1})
+        event = (await anext(stream)).decode()
+        self.assertIn('event: score\n', event)
+        self.assertIn('"score": 1', event)
+        # A client disconnect cancels the pending read, which unsubscribes.
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertFalse(broker.has_subscribers(self.channel))
+
+        await Thread.objects.filter(pk=self.thread.pk).aupdate(is_deleted=True)
+        response = await self.async_client.get(f'/thread/{self.thread.pk}/events/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_pages_open_a_stream_only_when_enabled(self):
+        self.addCleanup(thread_views.flush)
+        poll = make_poll(self.thread)
+        url = f'/thread/{self.thread.pk}/events/'
+        pages = [f'/thread/{self.thread.pk}/', f'/poll-results/{poll.pk}/']
+        for page in pages:
+            self.assertNotContains(self.client.get(page), url)
+        with self.settings(FORUM_LIVE_ENABLED=True):
+            for page in pages:
+                self.assertContains(self.client.get(page), url)
+
+    def test_sync_client_gets_no_stream(self):
+        url = f'/thread/{self.thread.pk}/events/'
+        with self.settings(FORUM_LIVE_ENABLED=True):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(response.streaming)
+        self.assertFalse(get_broker().has_subscribers(self.channel))
+        self.assertEqual(self.client.get(url).status_code, 204)
+
+    async def test_disabled_stream(self):
+        response = await self.async_client.get(f'/thread/{self.thread.pk}/events/')
+        self.assertEqual(response.status_code, 204)
+
+    @override_settings(FORUM_LIVE_BROKER='forum.live.RecordingBroker')
+    def test_signals_publish(self):
+        published = get_broker().published
+        published.clear()
+        poll = make_poll(self.thread, options=('A', 'B'))
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = make_comment(self.thread, author=self.bob, content='Live comment')
+            cast_thread_vote(self.bob, self.thread, 'up')
+            cast_comment_vote(self.alice, comment, 'down')
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_poll_vote(self.bob, poll, poll.options.get(text='B'))
+
+        events = {event: data for channel, event, data in published if channel == self.channel}
+        self.assertEqual(events['comment']['content'], 'Live comment')
+        self.assertEqual(events['comment']['author'], self.bob.username)
+        scores = [(data['kind'], data['score']) for _, event, data in published if event == 'score']
+        self.assertEqual(scores, [('thread', 1), ('comment', -1)])
+        self.assertEqual([option['votes'] for option in events['poll']['options']], [0, 1])
+        self.assertEqual(events['poll']['total'], 1)
+
+    def test_no_subscribers_no_queries(self):
+        comment = make_comment(self.thread, author=self.bob)
+        with self.assertNumQueries(0):
+            publish_comment(comment)
+            publish_score('thread', self.thread.pk)
+            publish_score('comment', comment.pk)
+
+
+class AttachmentTests(TestCase):
+    PDF = b'%PDF-1.4 ' + bytes(range(256))
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings = override_settings(FORUM_ATTACHMENT_ROOT=root, FORUM_ATTACHMENT_MAX_SIZE=1024)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.root = root
+        self.user = make_user()
+        self.client.force_login(self.user)
+
+    def upload(self, name='report.pdf', content=PDF):
+        return SimpleUploadedFile(name, content, content_type='application/octet-stream')
+
+    def create_thread(self, **attachment):
+        response = self.client.post('/create-thread/', {
+            'title': 'With a file', 'description': 'See attached', 'attachment': self.upload(**attachment),
+        })
+        return response, Thread.objects.order_by('-pk').first()
+
+    def spooled(self):
+        spool = os.path.join(self.root, 'tmp')
+        return os.listdir(spool) if os.path.isdir(spool) else []
+
+    def test_identical_uploads_are_stored_once(self):
+        _, first = self.create_thread(name='a.pdf')
+        _, second = self.create_thread(name='b.pdf')
+        response = self.client.post(f'/thread/{first.pk}/comment/', {'content': 'Again', 'attachment': self.upload()})
+        self.assertEqual(response.status_code, 302)
+        comment = Comment.objects.get(content='Again')
+
+        blob = Blob.objects.get()
+        self.assertEqual(blob.refcount, 3)
+        self.assertEqual(blob.size, len(self.PDF))
+        self.assertEqual(blob.content_type, 'application/pdf')
+        self.assertEqual({first.attachment_id, second.attachment_id, comment.attachment_id}, {blob.pk})
+        self.assertEqual((first.attachment_name, second.attachment_name), ('a.pdf', 'b.pdf'))
+        with open(blob_path(blob.pk), 'rb') as stored:
+            self.assertEqual(stored.read(), self.PDF)
+        self.assertEqual(self.spooled(), [])
+
+    def test_rejected_uploads_stop_early(self):
+        for attachment, message in (
+            ({'name': 'run.exe'}, "cannot be attached"),
+            ({'content': b'not a pdf'}, "does not look like a .pdf file"),
+            ({'content': b'%PDF-' + bytes(2048)}, "limited to"),
+        ):
+            response, thread = self.create_thread(**attachment)
+            self.assertContains(response, message)
+            self.assertIsNone(thread)
+        self.assertFalse(Blob.objects.exists())
+        self.assertEqual(self.spooled(), [])
+
+    def test_csrf_is_still_checked(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post('/create-thread/', {'title': 'T', 'description': 'D', 'attachment': self.upload()})
+        self.assertEqual(response.status_code, 403)
+
+    def test_download_and_ranges(self):
+        _, thread = self.create_thread()
+        url = f'/thread/{thread.pk}/attachment/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.PDF)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('report.pdf', response['Content-Disposition'])
+        etag = response['ETag']
+
+        response = self.client.get(url, headers={'Range': 'bytes=5-9'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.PDF[5:10])
+        self.assertEqual(response['Content-Range'], f'bytes 5-9/{len(self.PDF)}')
+        self.assertEqual(response['Content-Length'], '5')
+        response = self.client.get(url, headers={'Range': 'bytes=-4'})
+        self.assertEqual(b''.join(response.streaming_content), self.PDF[-4:])
+        response = self.client.get(url, headers={'Range': 'bytes=9999-'})
+        self.assertEqual(response.status_code, 416)
+        # A stale If-Range gets the whole, current file.
+        response = self.client.get(url, headers={'Range': 'bytes=0-1', 'If-Range': '"other"'})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        Thread.objects.filter(pk=thread.pk).update(is_deleted=True)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    @override_settings(FORUM_ATTACHMENT_ACCEL_REDIRECT='/protected/')
+    def test_accel_redirect(self):
+        _, thread = self.create_thread()
+        response = self.client.get(f'/thread/{thread.pk}/attachment/')
+        sha256 = thread.attachment_id
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{sha256[:2]}/{sha256[2:4]}/{sha256}')
+        self.assertEqual(response.content, b'')
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-', 10), (0, 9))
+        self.assertEqual(parse_range('bytes=2-100', 10), (2, 9))
+        self.assertEqual(parse_range('bytes=-20', 10), (0, 9))
+        self.assertIsNone(parse_range('bytes=0-1,4-5', 10))
+        self.assertIsNone(parse_range('items=0-1', 10))
+        self.assertFalse(parse_range('bytes=10-', 10))
+        self.assertFalse(parse_range('bytes=-0', 10))
+
+    def test_released_blobs_are_collected(self):
+        _, thread = self.create_thread()
+        old = thread.attachment_id
+        response = self.client.post(f'/thread/{thread.pk}/edit/', {
+            'title': 'With a file', 'description': 'New file', 'attachment': self.upload(content=b'%PDF-2'),
+        })
+        self.assertContains(response, 'updated')
+        thread.refresh_from_db()
+        self.assertNotEqual(thread.attachment_id, old)
+        self.assertEqual(Blob.objects.get(pk=old).refcount, 0)
+
+        # Inside the grace period nothing goes.
+        self.assertEqual(collect(), 0)
+        self.assertEqual(collect(grace=0), 1)
+        self.assertFalse(os.path.exists(blob_path(old)))
+        self.assertTrue(os.path.exists(blob_path(thread.attachment_id)))
+
+        thread.delete()
+        self.assertEqual(Blob.objects.get().refcount, 0)
+        Blob.objects.update(refcount=5, released_at=None)
+        recount()
+        call_command('collect_attachments', '--grace', '0', stdout=StringIO())
+        self.assertFalse(Blob.objects.exists())
+
+
+    def test_files_of_rolled_back_uploads_are_collected(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            _, thread = self.create_thread(content=b'%PDF-rolled back')
+            path = blob_path(thread.attachment_id)
+            raise RuntimeError
+        self.assertFalse(Blob.objects.exists())
+        self.assertTrue(os.path.exists(path))
+        _, kept = self.create_thread()
+
+        self.assertEqual(collect(), 0)
+        self.assertEqual(collect(grace=0), 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(blob_path(kept.attachment_id)))
+
+
+class RevisionTests(TestCase):
+    WORDS = "the quick brown fox jumps over a lazy dog while forum users argue about tabs and spaces".split()
+
+    def setUp(self):
+        self.user = make_user()
+        self.thread = make_thread(author=self.user, description=self.text(0))
+
+    def text(self, version):
+        # A long post of which each version changes a word or two.
+        words = [self.WORDS[(i * 7) % len(self.WORDS)] for i in range(400)]
+        for n in range(version):
+            words[(n * 37) % len(words)] = f'edit{n}'
+        return ' '.join(words) + '\n'
+
+    def edit(self, versions):
+        for version in range(1, versions + 1):
+            record_edit('thread', self.thread, self.thread.description, self.text(version), self.user)
+            self.thread.description = self.text(version)
+
+    def test_delta_round_trip(self):
+        old, new = "Hello  world,\nsecond line ", "Hello brave world,\nsecond  line"
+        self.assertEqual(apply_delta(old, make_delta(old, new)), new)
+        self.assertEqual(apply_delta('', make_delta('', new)), new)
+        self.assertEqual(apply_delta(old, make_delta(old, '')), '')
+
+    def test_every_revision_is_reconstructed(self):
+        self.edit(25)
+        revisions = list(ThreadRevision.objects.filter(thread=self.thread).order_by('number'))
+        self.assertEqual(len(revisions), 26)
+        self.assertEqual([r.number for r in revisions if r.is_snapshot], [0, 10, 20])
+        self.assertTrue(revisions[0].is_compressed)
+        full = len(self.text(1).encode())
+        self.assertTrue(all(len(r.data) < full / 10 for r in revisions if not r.is_snapshot))
+        for number in range(26):
+            with self.assertNumQueries(1):
+                self.assertEqual(content_at('thread', self.thread.pk, number), self.text(number))
+        self.assertIsNone(content_at('thread', self.thread.pk, 26))
+
+    def test_diff(self):
+        self.edit(10)
+        with self.assertNumQueries(1):
+            old, new, segments = revision_diff('thread', self.thread.pk, 10)
+        self.assertEqual((old, new), (self.text(9), self.text(10)))
+        self.assertIn(('insert', 'edit9 '), segments)
+        self.assertEqual(''.join(text for op, text in segments if op != 'delete'), new)
+        self.assertEqual(''.join(text for op, text in segments if op != 'insert'), old)
+        self.assertEqual(revision_diff('thread', self.thread.pk, 0)[2], [('insert', self.text(0))])
+        self.assertIsNone(revision_diff('thread', self.thread.pk, 11))
+
+    def test_outside_changes_keep_the_chain_exact(self):
+        self.edit(2)
+        record_edit('thread', self.thread, 'changed elsewhere', 'final', self.user)
+        self.assertEqual(
+            [content_at('thread', self.thread.pk, n) for n in range(5)],
+            [self.text(0), self.text(1), self.text(2), 'changed elsewhere', 'final'],
+        )
+        self.assertIsNone(record_edit('thread', self.thread, 'final', 'final', self.user))
+
+    def test_convert_legacy_history(self):
+        at = now()
+        rows = convert('a', [('a', 'b', 1, at), ('c', 'd', 2, at)], user_id=3, created_at=at)
+        self.assertEqual([(row['number'], row['user_id']) for row in rows], [(0, 3), (1, 1), (2, None), (3, 2)])
+
+    def test_views(self):
+        self.client.force_login(self.user)
+        for description in ('Second version', 'Second version', 'Third version'):
+            self.client.post(f'/thread/{self.thread.pk}/edit/', {'title': 'T', 'description': description})
+        self.assertEqual(ThreadRevision.objects.filter(thread=self.thread).count(), 3)
+        response = self.client.get(f'/thread/{self.thread.pk}/history/')
+        self.assertContains(response, f'/thread/{self.thread.pk}/history/2/')
+        response = self.client.get(f'/thread/{self.thread.pk}/history/2/')
+        self.assertContains(response, '<del class="bg-danger text-white">Second </del>')
+        self.assertContains(response, '<ins class="bg-success text-white">Third </ins>')
+        self.assertEqual(self.client.get(f'/thread/{self.thread.pk}/history/3/').status_code, 404)
+
+        comment = make_comment(self.thread, author=self.user, content='First')
+        self.client.post(f'/comment/{comment.pk}/edit/', {'content': 'Changed'})
+        self.assertEqual(CommentRevision.objects.filter(comment=comment).count(), 2)
+        self.assertContains(self.client.get(f'/comment/{comment.pk}/history/1/'), 'Changed')
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = make_user()
+        self.voter = make_user()
+
+    def stats(self, user):
+        return UserStats.objects.filter(user=user).values(
+            'threads', 'comments', 'polls', 'upvotes_received', 'downvotes_received',
+        ).first()
+
+    def assertMatchesRecount(self):
+        counted = {
+            user_id: (s.threads, s.comments, s.polls, s.upvotes_received, s.downvotes_received)
+            for user_id, s in counted_stats().items()
+        }
+        stored = {
+            s.user_id: (s.threads, s.comments, s.polls, s.upvotes_received, s.downvotes_received)
+            for s in UserStats.objects.all() if s.threads or s.comments or s.polls or s.votes_received
+        }
+        self.assertEqual(stored, counted)
+
+    def test_counters_follow_writes(self):
+        thread = make_thread(author=self.author)
+        comment = make_comment(thread, author=self.author)
+        make_comment(thread, author=self.voter)
+        make_poll(thread)
+        cast_thread_vote(self.voter, thread, 'up')
+        cast_thread_vote(self.voter, thread, 'down')
+        cast_comment_vote(self.voter, comment, 'up')
+        self.assertEqual(self.stats(self.author), {
+            'threads': 1, 'comments': 1, 'polls': 1, 'upvotes_received': 1, 'downvotes_received': 1,
+        })
+        self.assertIsNotNone(UserStats.objects.get(user=self.author).last_activity_at)
+        self.assertMatchesRecount()
+
+        comment.delete()
+        self.assertEqual(self.stats(self.author)['upvotes_received'], 0)
+        thread.delete()
+        self.assertEqual(self.stats(self.author), dict.fromkeys(self.stats(self.author), 0))
+        self.assertEqual(self.stats(self.voter)['comments'], 0)
+        self.assertMatchesRecount()
+
+    def test_rebuild(self):
+        seed_forum(users=3, threads=4, comments=2, replies=1)
+        UserStats.objects.update(threads=99, upvotes_received=0)
+        call_command('rebuild_user_stats', stdout=StringIO())
+        self.assertMatchesRecount()
+
+    def test_summary_is_cached_until_own_write(self):
+        thread = make_thread(author=self.author, title='First thread')
+        self.client.force_login(self.author)
+        self.assertContains(self.client.get('/dashboard/'), 'First thread')
+
+        # Votes from others wait for the cache to expire...
+        cast_thread_vote(self.voter, thread, 'up')
+        with self.assertNumQueries(2):
+            response = self.client.get('/dashboard/')
+        self.assertContains(response, '+0 / -0')
+
+        # ...the user's own posts show up at once.
+        with self.captureOnCommitCallbacks(execute=True):
+            make_thread(author=self.author, title='Second thread')
+        response = self.client.get('/dashboard/')
+        self.assertContains(response, 'Second thread')
+        self.assertContains(response, '+1 / -0')
+
+    def test_empty_lists_are_not_queried(self):
+        self.client.force_login(self.author)
+        with self.assertNumQueries(3):
+            response = self.client.get('/dashboard/')
+        self.assertContains(response, 'No threads yet.')
+        self.assertRedirects(Client().get('/dashboard/'), '/login/', fetch_redirect_response=False)
+
+
+class AchievementTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.voter = make_user()
+        self.category = make_category(name='Django')
+
+    def achievement(self, criteria):
+        return Achievement.objects.create(name=criteria, description='', criteria=criteria)
+
+    def earned(self, user=None):
+        return set(
+            UserAchievement.objects.filter(user=user or self.user).values_list('achievement__criteria', flat=True)
+        )
+
+    def test_parse(self):
+        self.assertEqual(
+            parse('Comment count ≥ 10, upvotes >= 5 and threads in category "Web dev" >= 2'),
+            [('comments', 10, None), ('upvotes_received', 5, None), ('threads', 2, 'Web dev')],
+        )
+        self.assertEqual(parse('score>=3'), [('score', 3, None)])
+        for criteria in ('', 'Be nice', 'comments > 3', 'likes >= 3', 'comments in category x >= 1',
+                         'comments >= 1 or threads >= 1'):
+            with self.subTest(criteria=criteria), self.assertRaises(InvalidCriteria):
+                parse(criteria)
+
+    def test_awarded_as_counters_cross_thresholds(self):
+        self.achievement('comments >= 2')
+        self.achievement('upvotes >= 1 and threads >= 2')
+        self.achievement('threads in category Django >= 2')
+        self.achievement('Post a lot')
+
+        thread = make_thread(author=self.user)
+        make_comment(thread, author=self.user)
+        cast_thread_vote(self.voter, thread, 'up')
+        self.assertEqual(self.earned(), set())
+
+        # A write that crosses no threshold costs no achievement query.
+        with CaptureQueriesContext(connection) as queries:
+            make_comment(thread, author=self.voter)
+        self.assertFalse([q for q in queries if 'achievement' in q['sql']])
+
+        make_comment(thread, author=self.user)
+        self.assertEqual(self.earned(), {'comments >= 2'})
+        # The clause crossed last reads the rest of the rule's counters.
+        make_thread(author=self.user, category=self.category)
+        self.assertEqual(self.earned(), {'comments >= 2', 'upvotes >= 1 and threads >= 2'})
+
+        moved = Thread.objects.get(pk=thread.pk)
+        moved.category = self.category
+        moved.save()
+        self.assertIn('threads in category Django >= 2', self.earned())
+        self.assertEqual(UserCategoryStats.objects.get(user=self.user, category=self.category).threads, 2)
+
+        # Dropping below a threshold keeps the badge; crossing it again
+        # does not award it twice.
+        Comment.objects.filter(author=self.user).first().delete()
+        make_comment(thread, author=self.user)
+        self.assertEqual(UserAchievement.objects.filter(user=self.user).count(), 3)
+
+    def test_achievements_deleted_elsewhere_are_not_awarded(self):
+        gone = self.achievement('comments >= 1')
+        self.assertEqual([rule.achievement_id for rule in achievement_rules()], [gone.pk])
+        # Deleted without this process's cached rules being invalidated.
+        Achievement.objects.filter(pk=gone.pk).delete()
+        self.assertEqual([rule.achievement_id for rule in achievement_rules()], [gone.pk])
+        make_comment(make_thread(author=self.user), author=self.user)
+        self.assertEqual(self.earned(), set())
+
+    def test_new_rules_are_backfilled(self):
+        thread = make_thread(author=self.user, category=self.category)
+        make_comment(thread, author=self.user)
+        with self.settings(TASKS_EAGER=True), self.captureOnCommitCallbacks(execute=True):
+            self.achievement('threads >= 1 and comments >= 1')
+        self.assertEqual(self.earned(), {'threads >= 1 and comments >= 1'})
+
+    def test_backfill_command(self):
+        seed_forum(users=4, threads=6, comments=2, replies=1)
+        self.achievement('threads >= 1')
+        self.achievement('comments >= 3 and score >= -100')
+        self.achievement(f'threads in category "{Category.objects.first().name}" >= 1')
+        UserAchievement.objects.all().delete()
+
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                call_command('award_achievements', workers=workers, chunk_size=2, stdout=StringIO())
+                expected = {
+                    (user_id, rule.achievement_id)
+                    for user_id, values in itertools.chain.from_iterable(user_values())
+                    for rule in load_rules() if satisfied(rule, values)
+                }
+                self.assertTrue(expected)
+                self.assertEqual(set(UserAchievement.objects.values_list('user_id', 'achievement_id')), expected)
+
+    def test_form_validates_criteria(self):
+        data = {'name': 'Regular', 'description': 'x', 'points': 5}
+        self.assertTrue(AchievementForm({**data, 'criteria': 'threads in category Django >= 3'}).is_valid())
+        form = AchievementForm({**data, 'criteria': 'threads in category Flask >= 3'})
+        self.assertIn('No such category: Flask.', form.errors['criteria'])
+        self.assertIn('criteria', AchievementForm({**data, 'criteria': 'be nice'}).errors)
+
+
+class ReputationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        forget_boards()
+        # Cached rules and boards name rows that roll back with the test.
+        self.addCleanup(cache.clear)
+        self.addCleanup(forget_boards)
+        self.author = make_user()
+        self.voter = make_user()
+        self.category = make_category()
+        self.forum = make_forum(categories=[self.category])
+
+    def reputation(self, user):
+        return UserStats.objects.get(user=user).reputation
+
+    def forum_score(self, user, forum=None):
+        return ForumReputation.objects.get(forum=forum or self.forum, user=user).score
+
+    def test_skip_list_matches_a_sorted_list(self):
+        rng = random.Random(3)
+        index, expected = SkipList(seed=3), []
+        for _ in range(2000):
+            key = rng.randrange(300)
+            if key in expected and rng.random() < 0.5:
+                index.remove(key)
+                expected.remove(key)
+            elif key not in expected:
+                index.insert(key)
+                bisect.insort(expected, key)
+        self.assertEqual(list(index), expected)
+        self.assertEqual(len(index), len(expected))
+        for key in range(-1, 301, 7):
+            self.assertEqual(index.rank(key), bisect.bisect_left(expected, key))
+            self.assertEqual(key in index, key in expected)
+        for position in (0, 1, len(expected) // 2, len(expected) - 1):
+            self.assertEqual(index[position], expected[position])
+            self.assertEqual(index.slice(position, 10), expected[position:position + 10])
+        with self.assertRaises(KeyError):
+            index.remove(301)
+
+    def test_leaderboard_ranks_share_ties(self):
+        board = Leaderboard([(1, 5), (2, 9), (3, 5), (4, 1)])
+        self.assertEqual(board.page(), [(1, 2, 9), (2, 1, 5), (2, 3, 5), (4, 4, 1)])
+        self.assertEqual([board.rank(user_id) for user_id in (1, 2, 3, 4, 5)], [2, 1, 2, 4, None])
+        board.set(4, 10)
+        self.assertEqual(board.page(1, 2), [(2, 2, 9), (3, 1, 5)])
+        self.assertEqual(board.rank(4), 1)
+
+    def test_votes_and_achievements_move_reputation(self):
+        Achievement.objects.create(name='First', description='', criteria='threads >= 1', points=10)
+        elsewhere = make_forum(categories=[self.category])
+        make_forum(categories=[make_category()])
+        global_board, forum_board = board(), board(self.forum.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            thread = make_thread(author=self.author, category=self.category)
+            comment = make_comment(thread, author=self.author)
+            cast_thread_vote(self.voter, thread, 'up')
+            cast_comment_vote(self.voter, comment, 'up')
+        self.assertEqual(self.reputation(self.author), 12)
+        self.assertEqual(self.forum_score(self.author), 2)
+        self.assertEqual(self.forum_score(self.author, elsewhere), 2)
+        self.assertEqual(ForumReputation.objects.filter(user=self.author).count(), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_thread_vote(self.voter, thread, 'down')
+        self.assertEqual(self.reputation(self.author), 10)
+        self.assertEqual(self.forum_score(self.author), 0)
+        # This process's boards took the committed scores without a reload.
+        self.assertEqual(global_board.score(self.author.pk), 10)
+        self.assertEqual(forum_board.score(self.author.pk), 0)
+        self.assertEqual(board().rank(self.author.pk), 1)
+
+    def test_recompute_matches_incremental_scores(self):
+        data = seed_forum(users=4, threads=6, comments=2, replies=1)
+        data['forum'].categories.add(self.category)
+        Achievement.objects.create(name='Busy', description='', criteria='comments >= 1', points=7)
+        for user in data['users']:
+            thread = make_thread(author=user, category=self.category)
+            make_comment(thread, author=user)
+            cast_thread_vote(self.voter, thread, 'up')
+            cast_comment_vote(self.voter, Comment.objects.filter(author=user).first(), 'down')
+
+        incremental = dict(UserStats.objects.values_list('user_id', 'reputation'))
+        forums = set(ForumReputation.objects.values_list('forum_id', 'user_id', 'score'))
+        self.assertTrue(any(incremental.values()))
+        UserStats.objects.update(reputation=999)
+        ForumReputation.objects.all().delete()
+
+        call_command('recompute_reputation', stdout=StringIO())
+        self.assertEqual(dict(UserStats.objects.values_list('user_id', 'reputation')), incremental)
+        self.assertEqual(set(ForumReputation.objects.values_list('forum_id', 'user_id', 'score')), forums)
+
+    def test_forum_categories_change_recomputes_forum(self):
+        thread = make_thread(author=self.author, category=make_category())
+        cast_thread_vote(self.voter, thread, 'up')
+        with self.settings(TASKS_EAGER=True), self.captureOnCommitCallbacks(execute=True):
+            self.forum.categories.add(thread.category)
+        self.assertEqual(self.forum_score(self.author), 1)
+
+        with self.settings(TASKS_EAGER=True), self.captureOnCommitCallbacks(execute=True):
+            moved = Thread.objects.get(pk=thread.pk)
+            moved.category = make_category()
+            moved.save()
+        self.assertFalse(ForumReputation.objects.filter(forum=self.forum, user=self.author, score__gt=0).exists())
+
+    def test_leaderboard_views(self):
+        users = [make_user() for _ in range(30)]
+        UserStats.objects.bulk_create([UserStats(user=user, reputation=n // 2) for n, user in enumerate(users)])
+        ForumReputation.objects.create(forum=self.forum, user=users[0], score=4)
+        self.client.force_login(users[0])
+
+        response = self.client.get('/leaderboard/')
+        entries = response.context['entries']
+        self.assertEqual(len(entries), 25)
+        self.assertEqual([entry['rank'] for entry in entries[:4]], [1, 1, 3, 3])
+        self.assertEqual(entries[0]['score'], 14)
+        self.assertEqual(response.context['your_rank'], 29)
+        self.assertEqual(response.context['next_start'], 25)
+
+        response = self.client.get('/leaderboard/?start=25')
+        self.assertEqual([entry['rank'] for entry in response.context['entries']], [25, 27, 27, 29, 29])
+        self.assertIsNone(response.context['next_start'])
+
+        response = self.client.get(f'/forum/{self.forum.pk}/leaderboard/')
+        self.assertEqual([(entry['user'], entry['score']) for entry in response.context['entries']], [(users[0], 4)])
+        self.assertContains(response, 'Your rank: #1')
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        self.author = make_user()
+        self.voters = [make_user() for _ in range(3)]
+        self.category = make_category()
+        self.forum = make_forum(categories=[self.category])
+
+    def columns(self, *threads):
+        return {
+            pk: (hot, week_score, week_comments)
+            for pk, hot, week_score, week_comments in Thread.objects.filter(pk__in=[t.pk for t in threads])
+            .values_list('pk', 'hot', 'week_score', 'week_comments')
+        }
+
+    def assertColumnsEqual(self, first, second):
+        self.assertEqual(first.keys(), second.keys())
+        for pk in first:
+            self.assertAlmostEqual(first[pk][0], second[pk][0], places=6)
+            self.assertEqual(first[pk][1:], second[pk][1:])
+
+    def test_incremental_scores_match_the_rescore(self):
+        quiet = make_thread(author=self.author, category=self.category)
+        busy = make_thread(author=self.author, category=self.category)
+        for voter in self.voters:
+            cast_thread_vote(voter, busy, 'up')
+        cast_thread_vote(self.voters[2], busy, 'down')
+        make_comment(busy, author=self.voters[0])
+        make_comment(busy, author=self.voters[1])
+
+        incremental = self.columns(quiet, busy)
+        self.assertGreater(incremental[busy.pk][0], incremental[quiet.pk][0])
+        self.assertEqual(incremental[busy.pk][1:], (1, 2))
+        Thread.objects.update(hot=0, week_score=0, week_comments=0)
+        call_command('rescore_threads', stdout=StringIO())
+        self.assertColumnsEqual(self.columns(quiet, busy), incremental)
+
+    def test_heat_decays_with_age(self):
+        old = make_thread(author=self.author)
+        new = make_thread(author=self.author)
+        Thread.objects.filter(pk=old.pk).update(created_at=now() - timedelta(days=2))
+        for voter in self.voters:
+            cast_thread_vote(voter, old, 'up')
+        rescore()
+        old.refresh_from_db()
+        new.refresh_from_db()
+        # Two half-lives old, the thread itself is worth a quarter of a new
+        # one, but its three fresh votes put it ahead.
+        self.assertGreater(old.hot, new.hot)
+        ThreadVote.objects.filter(thread=old).update(voted_at=now() - timedelta(days=3))
+        rescore()
+        old.refresh_from_db()
+        self.assertLess(old.hot, new.hot)
+
+    def test_views_heat_their_thread(self):
+        thread = make_thread(author=self.author)
+        thread_views.flush()
+        before = Thread.objects.get(pk=thread.pk).hot
+        for _ in range(10):
+            thread_views.add([thread.pk])
+        thread_views.flush()
+        self.assertAlmostEqual(Thread.objects.get(pk=thread.pk).hot, before + math.log(2), places=3)
+
+    def test_windows_expire(self):
+        thread = make_thread(author=self.author)
+        cast_thread_vote(self.voters[0], thread, 'up')
+        cast_thread_vote(self.voters[1], thread, 'up')
+        make_comment(thread, author=self.voters[0])
+        self.assertEqual(refresh_windows(), 0)
+
+        ThreadVote.objects.filter(user=self.voters[0]).update(voted_at=now() - timedelta(days=8))
+        Comment.objects.update(created_at=now() - timedelta(days=8))
+        call_command('rescore_threads', windows=True, stdout=StringIO())
+        self.assertEqual(self.columns(thread)[thread.pk][1:], (1, 0))
+
+    def test_forum_sorts_page_by_their_column(self):
+        threads = [make_thread(author=self.author, category=self.category) for _ in range(25)]
+        for n, thread in enumerate(threads):
+            Thread.objects.filter(pk=thread.pk).update(hot=n / 3, week_score=n % 5, week_comments=25 - n)
+
+        response = self.client.get(f'/forum/{self.forum.pk}/', {'sort': 'hot'})
+        page = response.context['threads']
+        self.assertEqual([t.pk for t in page], [t.pk for t in threads[::-1][:20]])
+        response = self.client.get(f'/forum/{self.forum.pk}/{page.next_url}')
+        self.assertEqual([t.pk for t in response.context['threads']], [t.pk for t in threads[4::-1]])
+
+        response = self.client.get(f'/forum/{self.forum.pk}/', {'sort': 'discussed'})
+        self.assertEqual(list(response.context['threads'])[0], threads[0])
+        response = self.client.get(f'/forum/{self.forum.pk}/', {'sort': 'top'})
+        self.assertEqual([t.week_score for t in response.context['threads']][:6], [4, 4, 4, 4, 4, 3])
+        response = self.client.get(f'/forum/{self.forum.pk}/', {'sort': 'bogus'})
+        self.assertEqual(response.context['sort'], 'new')
@@ -0,0 +1,206 @@
+"""
+Trending orderings for threads, each served by one indexed column:
+
+- ``hot``: activity (the thread itself, votes, comments and views, weighted
+  by ``WEIGHTS``) decayed with a half-life of ``TRENDING_HALF_LIFE``
+  seconds;
+- ``week_score`` and ``week_comments``: net votes and comments over the
+  last ``WINDOW`` ("top this week", "most discussed").
+
+Decaying every thread's heat as time passes would mean rewriting every
+row. Instead each event's weight is scaled up by e^((t - EPOCH) / tau)
+when it happens, which orders threads exactly as decaying all of them
+would, and the column stores the natural log of that sum. In log space the
+column only grows by ln 2 per half-life, so it never overflows and the
+epoch never needs rebasing; an event is folded in with a log-add-exp
+inside the UPDATE that records it, with no read.
+
+The windows do need time to pass over them: ``refresh_windows`` recounts
+them from the last week's votes and comments, and ``rescore`` recomputes
+everything. The ``rescore_threads`` command runs either.
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.db.models.lookups import GreaterThan
+from django.utils.timezone import now
+
+from forum.models import Comment, Thread, ThreadVote
+
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+WINDOW = timedelta(days=7)
+WEIGHTS = {'thread': 1.0, 'vote': 1.0, 'comment': 2.0, 'view': 0.1}
+
+# ?sort= values for thread listings and the column each pages by.
+ORDERINGS = {'new': 'created_at', 'hot': 'hot', 'top': 'week_score', 'discussed': 'week_comments'}
+
+
+def _tau():
+    return getattr(settings, 'TRENDING_HALF_LIFE', 24 * 60 * 60) / math.log(2)
+
+
+def heat(weight, at):
+    """
+    ln of ``weight`` (positive) scaled up to time ``at``.
+    """
+    return math.log(weight) + (at - EPOCH).total_seconds() / _tau()
+
+
+def heated(column, weight, at):
+    """
+    An expression for ``column`` with ``weight`` of activity at ``at`` added
+    (or, negative, taken away). Heat is never taken below nothing: a
+    removal larger than what is left is ignored until the next rescore.
+    """
+    term = Value(heat(abs(weight), at), output_field=FloatField())
+    if weight > 0:
+        return Greatest(column, term) + Ln(Value(1.0) + Exp(-Abs(column - term)))
+    return Case(
+        When(GreaterThan(column, term), then=column + Ln(Value(1.0) - Exp(term - column))),
+        default=column,
+        output_field=FloatField(),
+    )
+
+
+def _combine(terms):
+    """
+    ln of the signed sum of ``(sign, log weight)`` terms, or None if the
+    sum is not positive.
+    """
+    top = max(x for _, x in terms)
+    total = sum(sign * math.exp(x - top) for sign, x in terms)
+    return top + math.log(total) if total > 0 else None
+
+
+# ----- Incremental -----
+
+def initial(at):
+    return heat(WEIGHTS['thread'], at)
+
+
+def vote_updates(net, at=None):
+    """
+    Extra ``UPDATE`` assignments for a thread whose net votes moved by
+    ``net``, for ``forum.voting`` to fold into its counter update.
+    """
+    if not net:
+        return {}
+    return {
+        'hot': heated(F('hot'), net * WEIGHTS['vote'], at or now()),
+        'week_score': F('week_score') + net,
+    }
+
+
+def comment_added(thread_id, at=None):
+    Thread.objects.filter(pk=thread_id).update(
+        hot=heated(F('hot'), WEIGHTS['comment'], at or now()),
+        week_comments=F('week_comments') + 1,
+    )
+
+
+def viewed(increment, at=None):
+    """
+    The ``hot`` expression for ``increment`` views, for the view counter's
+    flush.
+    """
+    return heated(F('hot'), increment * WEIGHTS['view'], at or now())
+
+
+# ----- Batch -----
+
+def _window_counts():
+    since = now() - WINDOW
+    counts = {}
+    votes = (
+        ThreadVote.objects.filter(voted_at__gte=since).order_by().values('thread_id')
+        .annotate(net=Sum(Case(When(vote_type='up', then=1), default=-1)))
+    )
+    for row in votes:
+        counts[row['thread_id']] = [row['net'], 0]
+    comments = (
+        Comment.objects.filter(created_at__gte=since, is_deleted=False).order_by().values('thread_id')
+        .annotate(n=Count('id'))
+    )
+    for row in comments:
+        counts.setdefault(row['thread_id'], [0, 0])[1] = row['n']
+    return counts
+
+
+def refresh_windows(batch_size=500):
+    """
+    Recount ``week_score`` and ``week_comments`` over the last week,
+    writing only the threads whose counts changed. Reads the week's votes
+    and comments and the live threads with non-zero counts, all by index.
+    Returns the number of threads written.
+    """
+    counts = _window_counts()
+    with transaction.atomic():
+        stored = (
+            Thread.objects.filter(is_deleted=False)
+            .filter(Q(week_score__gt=0) | Q(week_score__lt=0) | Q(week_comments__gt=0))
+            .values_list('id', 'week_score', 'week_comments')
+        )
+        current = {pk: [score, comments] for pk, score, comments in stored}
+        changed = [
+            Thread(pk=pk, week_score=score, week_comments=comments)
+            for pk, (score, comments) in {**dict.fromkeys(current, [0, 0]), **counts}.items()
+            if current.get(pk, [0, 0]) != [score, comments]
+        ]
+        Thread.objects.bulk_update(changed, ['week_score', 'week_comments'], batch_size=batch_size)
+    return len(changed)
+
+
+def rescore(chunk_size=2000):
+    """
+    Recompute ``hot`` for every thread from its creation, votes, comments
+    and views, then the windows. Views carry no timestamps and are counted
+    at the thread's last activity. Threads are read in id chunks, three
+    indexed queries each, and only changed scores are written. Returns the
+    number of threads whose ``hot`` changed.
+    """
+    vote_weight, comment_weight = math.log(WEIGHTS['vote']), math.log(WEIGHTS['comment'])
+    tau, changed, last = _tau(), 0, 0
+    table = connection.ops.quote_name(Thread._meta.db_table)
+    while True:
+        threads = list(
+            Thread.objects.filter(pk__gt=last).order_by('pk')
+            .values_list('pk', 'created_at', 'views', 'hot')[:chunk_size]
+        )
+        if not threads:
+            break
+        first, last = threads[0][0], threads[-1][0]
+        events = {pk: [] for pk, _, _, _ in threads}
+        for thread_id, vote_type, voted_at in ThreadVote.objects.filter(
+            thread_id__gte=first, thread_id__lte=last,
+        ).values_list('thread_id', 'vote_type', 'voted_at'):
+            events[thread_id].append((1 if vote_type == 'up' else -1, vote_weight, voted_at))
+        for thread_id, created_at in Comment.objects.filter(
+            thread_id__gte=first, thread_id__lte=last, is_deleted=False,
+        ).values_list('thread_id', 'created_at'):
+            events[thread_id].append((1, comment_weight, created_at))
+
+        updates = []
+        for pk, created_at, views, hot in threads:
+            base = initial(created_at)
+            terms = [(1, base)]
+            latest = created_at
+            for sign, weight, at in events[pk]:
+                terms.append((sign, weight + (at - EPOCH).total_seconds() / tau))
+                latest = max(latest, at)
+            if views:
+                terms.append((1, heat(views * WEIGHTS['view'], latest)))
+            score = _combine(terms)
+            score = base if score is None else score
+            if not math.isclose(score, hot, rel_tol=0, abs_tol=1e-9):
+                updates.append((score, pk))
+        # One prepared statement for the chunk: bulk_update's CASE per row
+        # costs more to build than the whole rescore does to compute.
+        with connection.cursor() as cursor:
+            cursor.executemany(f"UPDATE {table} SET hot = %s WHERE id = %s", updates)
+        changed += len(updates)
+    refresh_windows()
+    return changed
@@ -0,0 +1,125 @@
+import atexit
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, F, FloatField, PositiveIntegerField, Value, When
+from django.utils.timezone import now
+
+from forum import trending
+from forum.models import Thread, Comment
+
+# Keeps each UPDATE comfortably below SQLite's bound-parameter limit.
+MAX_IDS_PER_UPDATE = 500
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class ViewCountBuffer:
+    """
+    Accumulates view increments for one model in process memory and writes
+    them back as a single ``UPDATE ... SET views = views + CASE ...`` once
+    enough hits have been seen or the flush interval has elapsed. With
+    ``heats``, the flushed views also heat up the rows' trending score.
+    """
+
+    def __init__(self, model, heats=False):
+        self.model = model
+        self.heats = heats
+        self._pending = Counter()
+        self._hits = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, pks):
+        with self._lock:
+            for pk in pks:
+                self._pending[pk] += 1
+            self._hits += 1
+            due = (
+                self._hits >= _setting('FORUM_VIEW_COUNT_FLUSH_THRESHOLD', 100)
+                or time.monotonic() - self._last_flush >= _setting('FORUM_VIEW_COUNT_FLUSH_INTERVAL', 10)
+            )
+            batch = self._take() if due else None
+        if batch:
+            self._write(batch)
+
+    def flush(self):
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._write(batch)
+        return batch
+
+    def pending(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def _take(self):
+        batch, self._pending = self._pending, Counter()
+        self._hits = 0
+        self._last_flush = time.monotonic()
+        return batch
+
+    def _write(self, batch):
+        items = list(batch.items())
+        for start in range(0, len(items), MAX_IDS_PER_UPDATE):
+            chunk = items[start:start + MAX_IDS_PER_UPDATE]
+            # Most objects share the same increment, so group ids by it to
+            # keep the CASE down to a handful of arms.
+            by_increment = defaultdict(list)
+            for pk, increment in chunk:
+                by_increment[increment].append(pk)
+            updates = {
+                'views': F('views') + Case(
+                    *[When(pk__in=pks, then=Value(increment)) for increment, pks in by_increment.items()],
+                    default=Value(0),
+                    output_field=PositiveIntegerField(),
+                ),
+            }
+            if self.heats:
+                at = now()
+                updates['hot'] = Case(
+                    *[When(pk__in=pks, then=trending.viewed(n, at)) for n, pks in by_increment.items()],
+                    default=F('hot'),
+                    output_field=FloatField(),
+                )
+            self.model.objects.filter(pk__in=[pk for pk, _ in chunk]).update(**updates)
+
+
+thread_views = ViewCountBuffer(Thread, heats=True)
+comment_views = ViewCountBuffer(Comment)
+
+
+def _viewer_key(request):
+    if request.session.session_key:
+        return request.session.session_key
+    if request.user.is_authenticated:
+        return f"user-{request.user.pk}"
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def record_thread_view(request, thread, comment_ids=()):
+    """
+    Count a view of ``thread`` (and the comments shown with it) unless the
+    same viewer already saw the thread inside the dedupe window.
+    """
+    key = f"forum:viewed:{thread.pk}:{_viewer_key(request)}"
+    if not cache.add(key, 1, timeout=_setting('FORUM_VIEW_DEDUPE_WINDOW', 30 * 60)):
+        return False
+    thread_views.add([thread.pk])
+    if comment_ids:
+        comment_views.add(comment_ids)
+    return True
+
+
+def flush_view_counts():
+    thread_views.flush()
+    comment_views.flush()
+
+
+atexit.register(flush_view_counts)
@@ -1,10 +1,28 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
-from forum.models import Category, Tag, Forum, Thread, ThreadSubscription, SavedThread, ThreadEditHistory, ThreadVote, Comment, CommentEditHistory, CommentVote, Poll, PollOption, PollVote
+from forum.models import Category, Tag, Forum, Thread, ThreadSubscription, SavedThread, Comment, Poll, PollOption, Notification
 from forum.forms import CategoryForm, TagForm, ForumForm, ThreadForm, CommentForm, PollForm
-from django.utils.timezone import now, timedelta
-
-#Додати логіку профіля користувача та досягнень
+from forum.voting import cast_thread_vote, cast_comment_vote
+from forum.view_counter import record_thread_view
+from forum.comment_tree import load_comment_page, load_comment_subtree, top_level_comments
+from forum.pagination import paginate
+from forum.search import search as search_documents
+from forum.polls import cast_poll_vote, poll_tally
+from forum.fragments import annotate_tree, annotate_versions
+from forum.activity import feed
+from forum.notifications import mark_read, unread_count
+from forum.live import event_stream, live_enabled, thread_channel
+from forum.attachments import accepts_attachments, attach, serve, upload_error
+from forum.revisions import history as revision_history, record_edit, revision_diff
+from forum import reputation
+from forum.trending import ORDERINGS
+from authentification.models import CustomUser
+from django.db.models import Q
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+
+#Додати логіку профіля користувача
 
 
 def error(request):
@@ -22,50 +40,22 @@ def confirm_action(request):
 def confirm_delete(request):
     return render(request, 'confirm_delete.html', {'message': 'Are you sure you want to delete this item?'})
 
-@login_required
-def dashboard(request):
-    if request.user.is_authenticated:
-        threads = Thread.objects.filter(author=request.user).order_by('-created_at')
-        comments = Comment.objects.filter(author=request.user).order_by('-created_at')
-        polls = Poll.objects.filter(thread__author=request.user).order_by('-created_at')
-        return render(request, 'dashboard.html', {'threads': threads, 'comments': comments, 'polls': polls})
-    else:
-        return redirect('login')
-
-def recent_activity(request):
-    last_week = now() - timedelta(days=7)
+def _versioned(kind, page):
+    annotate_versions(kind, page.object_list)
+    return page
 
-    threads = Thread.objects.filter(
-        created_at__gte=last_week,
-        is_deleted=False
-    ).order_by('-created_at').select_related('category')
-    comments = Comment.objects.filter(
-        created_at__gte=last_week,
-        is_deleted=False
-    ).order_by('-created_at').select_related('thread')
-    polls = Poll.objects.filter(
-        created_at__gte=last_week,
-        thread__is_deleted=False
-    ).order_by('-created_at').select_related('thread')
-
-    category_id = request.GET.get('category')
-    forum_id = request.GET.get('forum')
-    tag_id = request.GET.get('tag')
-
-    if category_id:
-        threads = threads.filter(category_id=category_id)
-        polls = polls.filter(thread__category_id=category_id)
-    if forum_id:
-        threads = threads.filter(category__forum_id=forum_id)
-        polls = polls.filter(thread__category__forum_id=forum_id)
-    if tag_id:
-        threads = threads.filter(tags__id=tag_id).distinct()
-        polls = polls.filter(thread__tags__id=tag_id).distinct()
+def _selected(request, name):
+    value = request.GET.get(name, '')
+    return int(value) if value.isdigit() else None
 
+def recent_activity(request):
+    events = feed(
+        forum=_selected(request, 'forum'),
+        category=_selected(request, 'category'),
+        tag=_selected(request, 'tag'),
+    )
     context = {
-        'threads': threads,
-        'comments': comments,
-        'polls': polls,
+        'events': paginate(request, events, 'cursor'),
         'categories': Category.objects.all(),
         'forums': Forum.objects.all(),
         'tags': Tag.objects.all(),
@@ -73,6 +63,27 @@ def recent_activity(request):
 
     return render(request, 'recent_activity.html', context)
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    filters = {
+        'forum': _selected(request, 'forum'),
+        'category': _selected(request, 'category'),
+        'tag': _selected(request, 'tag'),
+    }
+    page = request.GET.get('page', '1')
+    results = search_documents(query, page=page if page.isdigit() else 1, **filters) if query else None
+
+    query_string = request.GET.copy()
+    query_string.pop('page', None)
+    return render(request, 'search.html', {
+        'query': query,
+        'results': results,
+        'query_string': query_string.urlencode(),
+        'categories': Category.objects.all(),
+        'forums': Forum.objects.all(),
+        'tags': Tag.objects.all(),
+    })
+
 # ----- Category Views -----
 @login_required
 def add_category(request):
@@ -195,21 +206,48 @@ def forum_list(request):
 def forum_detail(request, forum_id):
     forum = get_object_or_404(Forum, id=forum_id)
     categories = forum.categories.all()
-    threads = Thread.objects.filter(category__in=categories, is_deleted=False).order_by('-created_at').select_related('category', 'author')
-    threads_without_category = Thread.objects.filter(category__isnull=True, is_deleted=False).order_by('-created_at').select_related('author')
-    threads = threads | threads_without_category
-    polls = Poll.objects.filter(thread__category__in=categories, thread__is_deleted=False).order_by('-created_at').select_related('thread__author')
+    threads = Thread.objects.filter(
+        Q(category__in=categories) | Q(category__isnull=True),
+        is_deleted=False
+    ).select_related('category', 'author')
+    polls = Poll.objects.filter(thread__category__in=categories, thread__is_deleted=False).select_related('thread__author')
+    sort = request.GET.get('sort')
+    sort = sort if sort in ORDERINGS else 'new'
     return render(request, 'forum_detail.html', {
         'forum': forum,
-        'threads': threads.distinct(),
-        'polls': polls,
+        'threads': _versioned('thread', paginate(request, threads, 'threads_cursor', key=ORDERINGS[sort])),
+        'polls': _versioned('poll', paginate(request, polls, 'polls_cursor')),
         'categories': categories,
+        'sort': sort,
+    })
+
+def leaderboard(request, forum_id=None):
+    forum = get_object_or_404(Forum, id=forum_id) if forum_id is not None else None
+    board = reputation.board(forum_id)
+    start = request.GET.get('start', '')
+    start = int(start) if start.isdigit() else 0
+    entries = board.page(start, reputation.PAGE_SIZE)
+    users = CustomUser.objects.only('username').in_bulk([user_id for _, user_id, _ in entries])
+    return render(request, 'leaderboard.html', {
+        'forum': forum,
+        'entries': [
+            {'rank': rank, 'user': users.get(user_id), 'score': score}
+            for rank, user_id, score in entries
+        ],
+        'previous_start': max(start - reputation.PAGE_SIZE, 0) if start else None,
+        'next_start': start + reputation.PAGE_SIZE if start + reputation.PAGE_SIZE < len(board) else None,
+        'your_rank': board.rank(request.user.pk) if request.user.is_authenticated else None,
+        'your_score': board.score(request.user.pk) if request.user.is_authenticated else None,
     })
     
 # ----- Thread Views -----
 @login_required
+@accepts_attachments
 def create_thread(request):
     if request.method == 'POST':
+        error = upload_error(request)
+        if error:
+            return render(request, 'error.html', {'message': error})
         title = request.POST.get('title')
         description = request.POST.get('description')
         category_id = request.POST.get('category')
@@ -218,14 +256,16 @@ def create_thread(request):
         attachment = request.FILES.get('attachment')
 
         if title and description:
-            thread = Thread.objects.create(
+            thread = Thread(
                 title=title,
                 description=description,
                 category_id=category_id or None,
                 author=request.user,
                 status=status or 'open',
-                attachment=attachment
             )
+            if attachment:
+                attach(thread, attachment)
+            thread.save()
             if tag_ids:
                 thread.tags.set(tag_ids)
             return redirect('thread_detail', thread_id=thread.id)
@@ -244,9 +284,15 @@ def create_thread(request):
     })
 
 @login_required
+@accepts_attachments
 def update_thread(request, thread_id):
-    thread = get_object_or_404(Thread, id=thread_id, author=request.user)
+    thread = get_object_or_404(
+        Thread.objects.select_related('category').prefetch_related('tags'), id=thread_id, author=request.user
+    )
     if request.method == "POST":
+        error = upload_error(request)
+        if error:
+            return render(request, "error.html", {"message": error})
         title = request.POST.get("title")
         description = request.POST.get("description")
         category_id = request.POST.get("category")
@@ -255,18 +301,13 @@ def update_thread(request, thread_id):
         attachment = request.FILES.get("attachment")
 
         if title and description:
-            ThreadEditHistory.objects.create(
-                user=request.user,
-                thread=thread,
-                old_content=thread.description,
-                new_content=description
-            )
+            record_edit('thread', thread, thread.description, description, request.user)
             thread.title = title
             thread.description = description
             thread.category_id = category_id or None
             thread.status = status or thread.status
             if attachment:
-                thread.attachment = attachment
+                attach(thread, attachment)
             thread.save()
             if tag_ids:
                 thread.tags.set(tag_ids)
@@ -319,50 +360,130 @@ def unsave_thread(request, thread_id):
         return render(request, "success.html", {"message": "Thread unsaved!"})
     return render(request, "confirm_action.html", {"object": thread, "action": "unsave"})
 
+@login_required
+def notification_list(request):
+    notifications = Notification.objects.filter(user=request.user).select_related('thread', 'comment__author')
+    return render(request, "notifications.html", {
+        "notifications": paginate(request, notifications, 'cursor'),
+        "unread": unread_count(request.user),
+    })
+
+@login_required
+def open_notification(request, notification_id):
+    notification = get_object_or_404(Notification, id=notification_id, user=request.user)
+    mark_read(request.user, [notification.id])
+    return redirect('thread_detail', thread_id=notification.thread_id)
+
+@login_required
+def read_notifications(request):
+    if request.method == "POST":
+        mark_read(request.user)
+    return redirect('notifications')
+
 @login_required
 def vote_thread(request, thread_id):
     thread = get_object_or_404(Thread, id=thread_id)
     if request.method == "POST":
         vote_type = request.POST.get("vote_type")
         if vote_type in ["up", "down"]:
-            ThreadVote.objects.update_or_create(
-                user=request.user,
-                thread=thread,
-                defaults={"vote_type": vote_type}
-            )
+            cast_thread_vote(request.user, thread, vote_type)
             return render(request, "success.html", {"message": f"Thread {vote_type}voted!"})
         return render(request, "error.html", {"message": "Invalid vote type."})
     return render(request, "vote_thread.html", {"thread": thread})
 
+async def thread_events(request, thread_id):
+    """
+    Server-Sent Events for one thread: new comments, score changes and poll
+    tallies. Async so that, under ASGI, an open stream holds no thread.
+    Under WSGI the response would be read to its (never coming) end before
+    anything is sent, so it answers 204 instead, which makes EventSource
+    stop reconnecting; likewise while live updates are turned off.
+    """
+    if not live_enabled() or not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    if not await Thread.objects.filter(id=thread_id, is_deleted=False).aexists():
+        raise Http404("Thread not found.")
+    response = StreamingHttpResponse(event_stream(thread_channel(thread_id)), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 def view_thread_edit_history(request, thread_id):
     thread = get_object_or_404(Thread, id=thread_id)
-    history = ThreadEditHistory.objects.filter(thread=thread).order_by('-edited_at')
+    history = revision_history('thread', thread.id)
     return render(request, "thread_edit_history.html", {"thread": thread, "history": history})
 
+def view_thread_revision(request, thread_id, number):
+    thread = get_object_or_404(Thread, id=thread_id)
+    return _revision_page(request, 'thread', thread, number, reverse('thread_edit_history', args=[thread.id]))
+
+def _revision_page(request, kind, obj, number, back_url):
+    compared = revision_diff(kind, obj.id, number)
+    if compared is None:
+        raise Http404("No such revision.")
+    _, _, segments = compared
+    return render(request, "revision_diff.html", {
+        'object': obj, 'kind': kind, 'number': number, 'segments': segments, 'back_url': back_url,
+    })
+
+@accepts_attachments
 def thread_detail(request, thread_id):
     thread = get_object_or_404(Thread, id=thread_id)
 
     if request.method == 'POST':
-        form = CommentForm(request.POST)
+        form = CommentForm(request.POST, request.FILES)
+        error = upload_error(request)
+        if error:
+            form.add_error('attachment', error)
         if form.is_valid():
             comment = form.save(commit=False)
             comment.thread = thread
             comment.author = request.user
+            if form.cleaned_data['attachment']:
+                attach(comment, form.cleaned_data['attachment'])
             comment.save()
             return redirect('thread_detail', thread_id=thread.id)
     else:
         form = CommentForm()
 
-    comments = Comment.objects.filter(thread=thread, is_deleted=False).select_related('author').order_by('created_at')
+    page = paginate(request, top_level_comments(thread), descending=False)
+    comments = annotate_tree(load_comment_page(page.object_list))
+    annotate_versions('thread', [thread])
+    if request.method == 'GET':
+        record_thread_view(request, thread, comments.comment_ids())
 
     return render(request, 'thread_detail.html', {
         'thread': thread,
         'form': form,
-        'comments': comments
+        'comments': comments,
+        'page': page,
+        'live_updates': live_enabled(),
+    })
+
+def comment_replies(request, comment_id):
+    comment = get_object_or_404(Comment.objects.select_related('thread', 'author'), id=comment_id, is_deleted=False)
+    after_id = request.GET.get('after')
+    replies = annotate_tree(load_comment_subtree(
+        comment,
+        after_id=int(after_id) if after_id and after_id.isdigit() else None,
+    ))
+    return render(request, 'comment_replies.html', {
+        'thread': comment.thread,
+        'comment': comment,
+        'replies': replies,
     })
 
 
+def thread_attachment(request, thread_id):
+    thread = get_object_or_404(
+        Thread.objects.select_related('attachment'), id=thread_id, is_deleted=False, attachment__isnull=False,
+    )
+    return serve(request, thread.attachment, thread.attachment_name)
+
+
 # ----- Comment Views -----
+@accepts_attachments
 def create_comment(request, thread_id, parent_id=None):
     thread = get_object_or_404(Thread, pk=thread_id)
     parent_comment = None
@@ -371,16 +492,21 @@ def create_comment(request, thread_id, parent_id=None):
         parent_comment = get_object_or_404(Comment, pk=parent_id, thread=thread)
 
     if request.method == 'POST':
+        error = upload_error(request)
+        if error:
+            return render(request, 'error.html', {'message': error})
         content = request.POST.get('content')
         attachment = request.FILES.get('attachment')
 
-        comment = Comment.objects.create(
+        comment = Comment(
             thread=thread,
             author=request.user,
             content=content,
             parent=parent_comment,
-            attachment=attachment
         )
+        if attachment:
+            attach(comment, attachment)
+        comment.save()
         return redirect('thread_detail', thread_id=thread.id)
 
     return render(request, 'create_comment.html', {
@@ -395,12 +521,7 @@ def update_comment(request, comment_id):
     if request.method == "POST":
         new_content = request.POST.get("content")
         if new_content:
-            CommentEditHistory.objects.create(
-                user=request.user,
-                comment=comment,
-                old_content=comment.content,
-                new_content=new_content
-            )
+            record_edit('comment', comment, comment.content, new_content, request.user)
             comment.content = new_content
             comment.save()
             return render(request, "success.html", {"message": "Comment updated successfully!"})
@@ -424,21 +545,27 @@ def vote_comment(request, comment_id):
     if request.method == "POST":
         vote_type = request.POST.get("vote_type")
         if vote_type in ["up", "down"]:
-            CommentVote.objects.update_or_create(
-                user=request.user,
-                comment=comment,
-                defaults={"vote_type": vote_type}
-            )
+            cast_comment_vote(request.user, comment, vote_type)
             return render(request, "success.html", {"message": f"Comment {vote_type}voted!"})
         return render(request, "error.html", {"message": "Invalid vote type."})
     return render(request, "vote_comment.html", {"comment": comment})
 
 
+def comment_attachment(request, comment_id):
+    comment = get_object_or_404(
+        Comment.objects.select_related('attachment'), id=comment_id, is_deleted=False, attachment__isnull=False,
+    )
+    return serve(request, comment.attachment, comment.attachment_name)
+
 def view_comment_edit_history(request, comment_id):
-    comment = get_object_or_404(Comment, id=comment_id)
-    history = CommentEditHistory.objects.filter(comment=comment).order_by("-edited_at")
+    comment = get_object_or_404(Comment.objects.select_related('author', 'thread'), id=comment_id)
+    history = revision_history('comment', comment.id)
     return render(request, "comment_edit_history.html", {"comment": comment, "history": history})
 
+def view_comment_revision(request, comment_id, number):
+    comment = get_object_or_404(Comment, id=comment_id)
+    return _revision_page(request, 'comment', comment, number, reverse('view_comment_edit_history', args=[comment.id]))
+
 # ----- Poll Views -----
 @login_required
 def create_poll(request):
@@ -499,22 +626,16 @@ def vote_poll(request, poll_id):
     if request.method == "POST":
         option_id = request.POST.get("option_id")
         option = get_object_or_404(PollOption, id=option_id, poll=poll)
-        PollVote.objects.update_or_create(
-            user=request.user,
-            option=option
-        )
+        cast_poll_vote(request.user, poll, option)
         return render(request, "success.html", {"message": "Poll vote recorded!"})
     return render(request, "vote_poll.html", {"poll": poll})
 
 def view_poll_results(request, poll_id):
     poll = get_object_or_404(Poll, id=poll_id)
-    options = poll.options.all()
-    total_votes = PollVote.objects.filter(option__poll=poll).count()
-    results = [
-        {"option": option, "votes": PollVote.objects.filter(option=option).count()}
-        for option in options
-    ]
-    return render(request, "poll_results.html", {"poll": poll, "results": results, "total_votes": total_votes})
+    tally = poll_tally(poll)
+    return render(request, "poll_results.html", {
+        "poll": poll, "results": tally.results, "total_votes": tally.total, "live_updates": live_enabled(),
+    })
 
 
 @login_required
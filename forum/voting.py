@@ -0,0 +1,103 @@
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from forum import trending
+from forum.models import Thread, ThreadVote, Comment, CommentVote
+
+VOTE_TYPES = ('up', 'down')
+
+
+def _counter_deltas(previous, current):
+    """
+    Return the (upvotes, downvotes) deltas for moving a vote from
+    ``previous`` to ``current``. Either side may be None (no vote).
+    """
+    up = (current == 'up') - (previous == 'up')
+    down = (current == 'down') - (previous == 'down')
+    return up, down
+
+
+def _cast_vote(vote_model, target_field, target, user, vote_type):
+    if vote_type not in VOTE_TYPES:
+        raise ValueError(f"Invalid vote type: {vote_type!r}")
+
+    target_model = type(target)
+    with transaction.atomic():
+        vote, created = vote_model.objects.select_for_update().get_or_create(
+            user=user,
+            defaults={'vote_type': vote_type},
+            **{target_field: target},
+        )
+        previous = None if created else vote.vote_type
+        if previous == vote_type:
+            return False
+
+        if not created:
+            vote.vote_type = vote_type
+            vote.save(update_fields=['vote_type'])
+
+        up, down = _counter_deltas(previous, vote_type)
+        # A thread's trending columns move in the same statement; the vote
+        # counts as of when it was first cast, as the rescore sees it.
+        trending_updates = trending.vote_updates(up - down, vote.voted_at) if target_model is Thread else {}
+        target_model.objects.filter(pk=target.pk).update(
+            upvotes=F('upvotes') + up,
+            downvotes=F('downvotes') + down,
+            score=F('score') + (up - down),
+            **trending_updates,
+        )
+    target.refresh_from_db(fields=['upvotes', 'downvotes', 'score'])
+    return True
+
+
+def cast_thread_vote(user, thread, vote_type):
+    """
+    Record ``user``'s vote on ``thread`` and adjust the thread's counters in
+    the same transaction. Returns False when the vote was already recorded.
+    """
+    return _cast_vote(ThreadVote, 'thread', thread, user, vote_type)
+
+
+def cast_comment_vote(user, comment, vote_type):
+    """
+    Record ``user``'s vote on ``comment`` and adjust the comment's counters in
+    the same transaction. Returns False when the vote was already recorded.
+    """
+    return _cast_vote(CommentVote, 'comment', comment, user, vote_type)
+
+
+def _drifted(model, vote_relation):
+    up = Count(vote_relation, filter=Q(**{f'{vote_relation}__vote_type': 'up'}))
+    down = Count(vote_relation, filter=Q(**{f'{vote_relation}__vote_type': 'down'}))
+    return (
+        model.objects
+        .order_by()
+        .annotate(actual_up=up, actual_down=down)
+        .exclude(
+            upvotes=F('actual_up'),
+            downvotes=F('actual_down'),
+            score=F('actual_up') - F('actual_down'),
+        )
+        .only('id', 'upvotes', 'downvotes', 'score')
+    )
+
+
+def rebuild_vote_counters(model, dry_run=False, batch_size=500):
+    """
+    Recount votes for every row of ``model`` (Thread or Comment) whose stored
+    counters disagree with its vote table. Returns the list of drifted rows as
+    ``(id, stored, actual)`` tuples, where each side is ``(up, down, score)``.
+    """
+    vote_relation = {Thread: 'threadvote', Comment: 'commentvote'}[model]
+    drift = []
+    with transaction.atomic():
+        pending = []
+        for obj in _drifted(model, vote_relation).iterator(chunk_size=batch_size):
+            actual = (obj.actual_up, obj.actual_down, obj.actual_up - obj.actual_down)
+            drift.append((obj.id, (obj.upvotes, obj.downvotes, obj.score), actual))
+            obj.upvotes, obj.downvotes, obj.score = actual
+            pending.append(obj)
+
+        if not dry_run and pending:
+            model.objects.bulk_update(pending, ['upvotes', 'downvotes', 'score'], batch_size=batch_size)
+    return drift